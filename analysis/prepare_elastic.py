@@ -1,4 +1,8 @@
+import bz2
+import gzip
 import json
+import lzma
+import sys
 import time
 
 from elasticsearch import Elasticsearch, helpers
@@ -29,6 +33,21 @@ index_settings = {
 def fix_lines(a): return map(fix_line, a)
 
 
+def open_dump(filename: str):
+    # compressed dump is decompressed while being read, no need to extract it
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt")
+    if filename.endswith(".bz2"):
+        return bz2.open(filename, "rt")
+    if filename.endswith(".xz"):
+        return lzma.open(filename, "rt")
+    if filename.endswith(".zst"):
+        import zstandard
+        return zstandard.open(filename, "rt")
+
+    return open(filename, "r")
+
+
 def get_index_stats(client: Elasticsearch, index: str) -> int:
     index_stats = client.indices.stats(index=index)
     if index_stats and "indices" in index_stats:
@@ -44,11 +63,11 @@ def get_fields(client: Elasticsearch, filename: str, indexname: str):
     elapsed = []
     usage = [get_index_stats(client, indexname)]
 
-    with open(filename, "r") as file:
+    # streams cannot be rewound cheaply, so the dump is opened twice
+    with open_dump(filename) as file:
         length = sum(1 for _ in file)
 
-        file.seek(0)
-
+    with open_dump(filename) as file:
         start = time.perf_counter()
 
         for chunk in tqdm(batched(file, (length // 25) + 1)):
@@ -69,7 +88,10 @@ if __name__ == "__main__":
     client.indices.create(
         index="arxiv", mappings=index_mapping, settings=index_settings
     )
-    stats = get_fields(client, "arxiv-metadata-oai-snapshot.json", "arxiv")
+    filename = (
+        sys.argv[1] if len(sys.argv) > 1 else "arxiv-metadata-oai-snapshot.json"
+    )
+    stats = get_fields(client, filename, "arxiv")
 
     with open("elastic_stats.json", "w") as file:
         json.dump({"time": stats[0], "usage": stats[1]}, file, indent=1)
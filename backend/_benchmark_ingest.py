@@ -0,0 +1,208 @@
+import argparse
+import json
+import logging
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+from ingest.metrics import Monitor
+from ingest.pipeline import (
+    loaded_path,
+    processed_path,
+    run_preprocessing,
+    run_sharded_preprocessing,
+)
+from ingest.records import open_processed
+from ingest.synthetic import write_corpus
+
+STAGES = ("reader", "processor", "writer")
+
+
+def run_once(
+    corpus: Path, processors: int, sharded: bool = False, binary: bool = False, shards: bool = False
+) -> t.Dict[str, t.Any]:
+    # arxivsearch logger would set up the whole app along with its databases
+    logger = logging.getLogger("benchmark")
+    with tempfile.TemporaryDirectory() as directory:
+        result_path = processed_path(Path(directory) / corpus.name, binary)
+        preprocess = run_sharded_preprocessing if sharded else run_preprocessing
+
+        # monitor is not started, totals are sampled once the run is over
+        monitor = Monitor()
+        start = time.perf_counter()
+        preprocess(logger, corpus, result_path, processors, shards=shards, monitor=monitor)
+        elapsed = time.perf_counter() - start
+
+        sample = monitor.sample()
+        with open_processed(loaded_path(result_path, shards)) as source:
+            papers = source.count()
+
+        return {
+            "processors": processors,
+            "seconds": elapsed,
+            "papers": papers,
+            "papers_per_s": papers / elapsed,
+            "stages": {
+                name: {
+                    "records_per_s": stage["records"] / elapsed,
+                    "mib_per_s": stage["bytes"] / elapsed / 2**20,
+                    "blocked_put": stage["blocked_put"] / stage["workers"],
+                    "blocked_get": stage["blocked_get"] / stage["workers"],
+                    "max_rss_mib": stage["max_rss"] / 2**20,
+                    "errors": stage["errors"],
+                }
+                for name, stage in sample["stages"].items()
+            },
+        }
+
+
+def print_result(result: t.Dict[str, t.Any]):
+    print(
+        f"\n{result['processors']} processors: {result['papers']} papers in {result['seconds']:.2f}s "
+        + f"({result['papers_per_s']:.0f} papers/s)"
+    )
+    print(
+        f"  {'stage':<10} {'records/s':>10} {'MiB/s':>8} {'put wait':>9} {'get wait':>9} {'RSS MiB':>8} {'errors':>7}"
+    )
+    for name in STAGES:
+        if name not in result["stages"]:
+            continue
+
+        stage = result["stages"][name]
+        print(
+            f"  {name:<10} {stage['records_per_s']:>10.0f} {stage['mib_per_s']:>8.2f} {stage['blocked_put']:>8.2f}s "
+            + f"{stage['blocked_get']:>8.2f}s {stage['max_rss_mib']:>8.0f} {stage['errors']:>7.0f}"
+        )
+
+
+def find_regressions(
+    results: t.List[t.Dict[str, t.Any]], baseline: t.List[t.Dict[str, t.Any]], tolerance: float
+) -> t.List[str]:
+    # only runs with the same number of processors are comparable
+    previous = {result["processors"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["processors"])
+        if before is None:
+            continue
+
+        if result["papers_per_s"] < before["papers_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{result['processors']} processors: {result['papers_per_s']:.0f} papers/s, "
+                + f"baseline {before['papers_per_s']:.0f} papers/s"
+            )
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure preprocessing throughput on a synthetic arxiv corpus")
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        default=Path("synthetic-arxiv.json"),
+        help="Path to the synthetic dump, it is generated when it does not exist",
+    )
+
+    parser.add_argument(
+        "--papers",
+        "-n",
+        type=int,
+        default=200_000,
+        help="Number of papers in the generated corpus",
+    )
+    parser.add_argument(
+        "--latex-share",
+        type=float,
+        default=0.3,
+        help="Share of titles and abstracts that contain latex",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the generator, the same seed always gives the same corpus",
+    )
+    parser.add_argument(
+        "--regenerate",
+        action="store_true",
+        help="Generate the corpus even if it already exists",
+    )
+    parser.add_argument(
+        "--generate-only",
+        action="store_true",
+        help="Only generate the corpus, without running the benchmark",
+    )
+
+    parser.add_argument(
+        "--processors",
+        "-p",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Numbers of processors to run the pipeline with, every one is a separate run",
+    )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Let every processor read its own range of the corpus",
+    )
+    parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="Write binary records instead of json lines",
+    )
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help="Let every processor write its own output shard",
+    )
+
+    parser.add_argument(
+        "--save",
+        type=Path,
+        default=None,
+        help="Write results as json, so later runs can be compared against them with --baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="Results of a previous run, exit with 1 if throughput dropped by more than --tolerance",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed relative drop of papers/s against the baseline",
+    )
+    args = parser.parse_args()
+
+    if args.regenerate or not args.corpus.exists():
+        write_corpus(args.corpus, args.papers, seed=args.seed, latex_share=args.latex_share)
+
+    if args.generate_only:
+        exit(0)
+
+    print(f"Corpus: {args.corpus} ({args.corpus.stat().st_size / 2**20:.1f} MiB)")
+    results = []
+    for processors in args.processors:
+        result = run_once(args.corpus, processors, sharded=args.sharded, binary=args.binary, shards=args.shards)
+        print_result(result)
+        results.append(result)
+
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is None:
+        exit(0)
+
+    with open(args.baseline, "r") as file:
+        regressions = find_regressions(results, json.load(file), args.tolerance)
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    exit(1 if regressions else 0)
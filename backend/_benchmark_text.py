@@ -0,0 +1,77 @@
+import argparse
+import json
+import time
+import typing as t
+from itertools import islice
+from pathlib import Path
+
+from pylatexenc.latex2text import LatexNodes2Text
+from tqdm import tqdm
+
+from ingest.streams import open_dump
+from ingest.text import LATEX_MARKERS, TextNormalizer, collapse_whitespace
+
+TEXT_FIELDS = ("title", "abstract", "comments")
+
+
+def reference_fix_text(latex_context: LatexNodes2Text, content: str) -> str:
+    # what Processor.fix_text used to do, every string goes through latex parser
+    return collapse_whitespace(str(latex_context.latex_to_text(content)))
+
+
+def load_sample(path: Path, sample: int) -> t.List[str]:
+    texts = []
+    with open_dump(path) as file:
+        for line in tqdm(islice(file, sample), total=sample, desc="Loading"):
+            data = json.loads(line)
+            texts.extend(data[field] for field in TEXT_FIELDS if data.get(field) is not None)
+
+    return texts
+
+
+def timed(name: str, function: t.Callable[[str], str], texts: t.List[str]) -> t.Tuple[t.List[str], float]:
+    start = time.perf_counter()
+    results = [function(text) for text in tqdm(texts, desc=name)]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fast-path text normalizer with plain latex conversion")
+    parser.add_argument(
+        "--path",
+        type=Path,
+        default=Path("arxiv-metadata-oai-snapshot.json"),
+        help="Path to the dump file",
+    )
+
+    parser.add_argument(
+        "--sample",
+        "-n",
+        type=int,
+        default=100_000,
+        help="Number of papers taken from the beginning of the dump",
+    )
+    args = parser.parse_args()
+
+    texts = load_sample(args.path, args.sample)
+
+    latex_context = LatexNodes2Text()
+    normalizer = TextNormalizer()
+
+    expected, reference_time = timed("Reference", lambda text: reference_fix_text(latex_context, text), texts)
+    got, normalizer_time = timed("Normalizer", normalizer, texts)
+
+    mismatches = [(text, a, b) for text, a, b in zip(texts, expected, got) if a != b]
+    for text, a, b in mismatches[:10]:
+        print(f"Mismatch for {text!r}:\n\texpected: {a!r}\n\tgot:      {b!r}")
+
+    latex_free = sum(1 for text in texts if LATEX_MARKERS.search(text) is None)
+
+    print(f"Strings:         {len(texts)}")
+    print(f"Latex free:      {latex_free} ({latex_free / max(len(texts), 1) * 100:.2f}%)")
+    print(f"Cache:           {normalizer.cache_info()}")
+    print(f"Reference:       {reference_time:.2f}s")
+    print(f"Normalizer:      {normalizer_time:.2f}s ({reference_time / max(normalizer_time, 1e-9):.2f}x)")
+    print(f"Mismatches:      {len(mismatches)}")
+
+    exit(1 if mismatches else 0)
@@ -1,26 +1,46 @@
 import argparse
-import json
-import locale
-import time
+import pickle
 import typing as t
 from csv import DictReader
 from datetime import datetime
 from itertools import batched
 from logging import Logger
-from multiprocessing import Process, Queue
 from pathlib import Path
-from queue import Empty, Full
 from threading import Thread
 
 from elasticsearch import Elasticsearch, helpers
-from pylatexenc.latex2text import LatexNodes2Text
 from sqlalchemy import Engine
-from sqlmodel import Session, SQLModel, col, func
+from sqlmodel import Session, SQLModel, col, delete, func, select
 from tqdm import tqdm
 
 from arxivsearch.database import ArxivCategoriesModel, ArxivPaperModel, setup_database
-from arxivsearch.elastic import setup_elastic
+from arxivsearch.elastic import CLIENT_OPTIONS, setup_elastic
 from arxivsearch.logger import setup_logger
+from ingest.checkpoint import Intervals, Manifest
+from ingest.elastic import (
+    bulk_load_elastic,
+    collect_old_indices,
+    freeze_partitions,
+    get_aliased_indices,
+    mark_loaded,
+    new_index_name,
+    swap_alias,
+    validate_index,
+    writable,
+)
+from ingest.fanout import fan_out_into_bases
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.partitions import Partitioning, find_partitioning, target_indices
+from ingest.pipeline import (
+    loaded_path,
+    processed_path,
+    run_preprocessing,
+    run_sharded_preprocessing,
+)
+from ingest.postgres import copy_into_postgres
+from ingest.readers import READ_CHUNK_SIZE, READERS, read_in_parallel, todo_spans
+from ingest.records import open_processed
+from ingest.scheduler import PipelineError
 
 INDEXNAME = "arxiv"
 
@@ -29,7 +49,8 @@ index_mapping = {
         "id": {"type": "keyword"},
         "submitter": {"type": "keyword"},
         "authors": {"type": "keyword"},
-        "title": {"type": "text"},
+        # completion keeps title prefixes in memory of every shard for /api/suggest
+        "title": {"type": "text", "fields": {"suggest": {"type": "completion"}}},
         "comments": {"type": "text"},
         "journal-ref": {"type": "text"},
         "doi": {"type": "keyword"},
@@ -41,9 +62,10 @@ index_mapping = {
 }
 
 
-def do_elastic_fixes(line: dict) -> dict:
+def do_elastic_fixes(line: dict, index: str = INDEXNAME, partitioning: t.Optional[Partitioning] = None) -> dict:
     # to be inserted elastic required weird ass format
-    return {"_id": line["id"], "_index": INDEXNAME, "_source": line}
+    target = partitioning.route(index, line) if partitioning else index
+    return {"_id": line["id"], "_index": target, "_source": line}
 
 
 def do_postgres_fixes(line: dict) -> dict:
@@ -54,166 +76,6 @@ def do_postgres_fixes(line: dict) -> dict:
     return line
 
 
-def try_and_put(queue: Queue, data: t.Any):
-    while True:
-        try:
-            queue.put(data, timeout=1)
-            break
-        except Full:
-            time.sleep(0.1)
-            continue
-
-
-class Reader(Process):
-    def __init__(self, path: Path, reader_queue: Queue, num_processors: int, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.path = path
-        self.reader_queue = reader_queue
-        self.num_processors = num_processors
-
-    def run(self):
-        with open(self.path, "r") as file:
-            length = sum(1 for _ in file)
-            file.seek(0)
-            for line in tqdm(file, total=length):
-                data = json.loads(line)
-
-                if data["submitter"] is None:
-                    continue
-
-                try_and_put(self.reader_queue, data)
-
-        # reader has finished, waiting for queue to be empty before closing
-        while not self.reader_queue.empty():
-            time.sleep(0.1)
-
-        # send None to all processors
-        for _ in range(self.num_processors):
-            try_and_put(self.reader_queue, None)
-
-
-class Processor(Process):
-    def __init__(self, reader_queue: Queue, writer_queue: Queue, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.reader_queue = reader_queue
-        self.writer_queue = writer_queue
-        locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
-        self.latex_context = LatexNodes2Text()
-
-    def fix_text(self, content: str) -> str:
-        # text defucker 3001
-        content = str(self.latex_context.latex_to_text(content))
-        content = content.replace("\n", " ")
-        return " ".join([i for i in content.split(" ") if len(i) > 0])  # remove multiple spaces
-
-    def process(self, parsed_line: dict) -> dict:
-
-        try:
-            # id is ok
-            # submitter is being check in a producer
-            # authors are fucked up, but lets try and fix them
-            authors = set()
-            for author in parsed_line["authors_parsed"]:
-                full_name = " ".join(author).replace("\n", "")
-                full_name, *_ = full_name.split("  ")  # two spaces
-                authors.add(full_name.strip())
-
-            # THIS MAY BE WRONG, but lets assume that submitter is also an author
-            authors.add(parsed_line["submitter"])
-            parsed_line["authors"] = list(authors)
-
-            # title could be fucked up
-            parsed_line["title"] = self.fix_text(parsed_line["title"])
-
-            # we dont care about comments, but we defuck them anyway
-            if parsed_line["comments"] is None:
-                parsed_line["comments"] = ""
-            else:
-                parsed_line["comments"] = self.fix_text(parsed_line["comments"])
-
-            # journal-ref is nullable for some reason
-            # doi is ok, yet sometimes nullable
-
-            # categories are saved like this: <major category>.<sub category>; we want to save both major as itself
-            # and major + minor as second category, we are lucky that all arxiv categories are at most two elements.
-            # but some articles already have major and minor categories set properly
-            parsed_categories = set()
-            categories: t.List[str] = parsed_line["categories"].split(" ")
-
-            for category in categories:
-                if "." in category:
-                    major, _ = category.split(".")
-                    parsed_categories.add(major)
-                    parsed_categories.add(category)
-                else:
-                    parsed_categories.add(category)
-
-            parsed_line["categories"] = list(parsed_categories)
-
-            # extract create_date
-            updates = [datetime.strptime(i["created"], "%a, %d %b %Y %H:%M:%S %Z") for i in parsed_line["versions"]]
-            sorted_dates = sorted(updates)
-
-            parsed_line["create_date"] = sorted_dates[0].strftime("%Y-%m-%d")
-            parsed_line["update_date"] = sorted_dates[-1].strftime("%Y-%m-%d")
-
-            # abstract is fucked up for sure
-            parsed_line["abstract"] = self.fix_text(parsed_line["abstract"])
-
-            # update_date is ok
-            return parsed_line
-
-        except Exception:
-            # line is fucked up, we dont care
-            return {}
-
-    def run(self):
-        while True:
-            try:
-                line = self.reader_queue.get(timeout=1)
-                if line is None:
-                    try_and_put(self.writer_queue, None)
-                    break
-            except Empty:
-                # case: empty but not closed, wait for the data
-                continue
-
-            data = self.process(line)
-
-            if data:
-                try_and_put(self.writer_queue, data)
-
-
-class Writer(Process):
-    def __init__(self, path: Path, writer_queue: Queue, no_processors: int, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.path = path
-        self.writer_queue = writer_queue
-        self.no_processors = no_processors
-        self.nones = 0
-
-    def run(self):
-        with open(self.path, "w") as file:
-            while True:
-                try:
-                    line = self.writer_queue.get(timeout=1)
-                    if line is None:
-                        self.nones += 1
-                        if self.nones == self.no_processors:
-                            break
-                        continue
-
-                except Empty:
-                    # case: empty but not closed, wait for the data
-                    continue
-
-                except ValueError:
-                    # case: queue closed *should never happen*
-                    break
-
-                file.write(json.dumps(line) + "\n")
-
-
 def setup_categories(engine: Engine, logger: Logger, path_to_categories: Path, force: int = 0):
     logger.info("Setting up categories...")
 
@@ -238,11 +100,192 @@ def setup_categories(engine: Engine, logger: Logger, path_to_categories: Path, f
         session.commit()
 
 
-def setup_bases(engine: Engine, elastic: Elasticsearch, logger: Logger, path_to_dump: Path, force: int = 0):
-    logger.info("Setting up bases...")
+def insert_into_elastic(
+    elastic: Elasticsearch,
+    logger: Logger,
+    path_to_dump: Path,
+    index: str = INDEXNAME,
+    readers: int = READERS,
+    pos: int = 0,
+    manifest: t.Optional[Manifest] = None,
+    partitioning: t.Optional[Partitioning] = None,
+    monitor: t.Optional[Monitor] = None,
+):
+    monitor = monitor or Monitor()
+    metrics = monitor.worker("elastic")
+    # parts already in elastic are skipped, chunks of the rest come from reader processes in any order
+    completed = manifest.completed("elastic") if manifest else Intervals()
+    with open_processed(path_to_dump) as source:
+        spans = todo_spans(source, completed, readers)
+        # chunks never cross a span, so every one of them covers a continuous part of the file
+        total = sum(-(-source.count(span) // READ_CHUNK_SIZE) for span in spans)
+        chunks = read_in_parallel(path_to_dump, spans, readers, monitor=monitor, stage="elastic-reader")
+        try:
+            for data in tqdm(chunks, total=total, position=pos):
+                chunk = pickle.loads(data)
+                actions = [do_elastic_fixes(record, index, partitioning) for _, record in chunk]
+                errors = 0
+                for ok, _ in helpers.parallel_bulk(elastic, actions):
+                    if not ok:
+                        logger.error("Error while inserting into elastic")
+                        errors += 1
+
+                span = (chunk[0][0][0], chunk[-1][0][1])
+                metrics.add(records=len(actions) - errors, errors=errors, bytes=source.nbytes(span))
+                completed.add(*span)
+                if manifest:
+                    manifest.update("elastic", completed=completed.to_list())
+        except PipelineError as e:
+            logger.error(f"{e}, data in elastic is incomplete")
+            return
+
+    if manifest:
+        manifest.update("elastic", done=True)
+
+
+def insert_into_postgres(
+    engine: Engine,
+    logger: Logger,
+    path_to_dump: Path,
+    parts: int = 25,
+    pos: int = 1,
+    replace: bool = False,
+    manifest: t.Optional[Manifest] = None,
+    metrics: t.Optional[WorkerMetrics] = None,
+):
+    metrics = metrics or WorkerMetrics("postgres")
+    with open_processed(path_to_dump) as source:
+        # everything before the offset is already committed
+        offset = manifest.completed("postgres").watermark() if manifest else 0
+        resumed = offset > 0
+        length = source.count((offset, source.extent))
+        records = source.read((offset, source.extent))
+        for i, batch in tqdm(enumerate(batched(records, (length // parts) + 1)), total=parts, position=pos):
+            with Session(engine) as session:
+                objs = [ArxivPaperModel(**do_postgres_fixes(record)) for _, record in batch]
+                # first batch after resume could have been committed right before the crash, without checkpoint
+                if replace or (resumed and i == 0):
+                    # arxiv_id is not unique in the table, so older rows have to go before inserting new ones
+                    for ids in batched([obj.arxiv_id for obj in objs], 10_000):
+                        session.exec(delete(ArxivPaperModel).where(col(ArxivPaperModel.arxiv_id).in_(ids)))
+
+                session.add_all(objs)
+                session.commit()
+
+            metrics.add(records=len(objs), bytes=source.nbytes((offset, batch[-1][0][1])))
+            offset = batch[-1][0][1]
+            if manifest:
+                manifest.update("postgres", completed=[[0, offset]])
+
+            logger.debug(f"Inserted {(i + 1)/ parts * 100:.2f}% of data into postgres")
+
+    if manifest:
+        manifest.update("postgres", done=True)
+
+
+def load_into_bases(
+    engine: Engine,
+    elastic: Elasticsearch,
+    logger: Logger,
+    path: Path,
+    replace: bool = False,
+    copy_workers: int = 0,
+    defer_indexes: bool = False,
+    elastic_bulk: bool = False,
+    index: str = INDEXNAME,
+    live_index: bool = False,
+    fanout: bool = False,
+    manifest: t.Optional[Manifest] = None,
+    monitor: t.Optional[Monitor] = None,
+    partitioning: t.Optional[Partitioning] = None,
+):
+    if fanout:
+        stages = [stage for stage in ("elastic", "postgres") if not (manifest and manifest.is_done(stage))]
+        if not stages:
+            logger.info("Both bases are already loaded, skipping")
+            return
+
+        # file is parsed once and every record goes to both bases, each one loading in its own process
+        fan_out_into_bases(
+            engine,
+            elastic,
+            logger,
+            path,
+            index,
+            SQLModel.metadata.tables["arxiv_papers"],
+            stages=stages,
+            replace=replace,
+            tune_index=not live_index,
+            defer_indexes=defer_indexes and not replace,
+            manifest=manifest,
+            monitor=monitor,
+            partitioning=partitioning,
+            client_options=CLIENT_OPTIONS,
+        )
+        return
+
+    # every loader reports to the same stages as the sinks of the fan-out do
+    monitor = monitor or Monitor()
+    threads = []
+
+    # elastic overwrites documents with the same _id by itself, postgres needs to be told to
+    if manifest and manifest.is_done("elastic"):
+        logger.info("Elastic is already loaded, skipping")
+    elif elastic_bulk:
+        # refresh and replicas are only turned off when index is not serving anything yet
+        threads.append(
+            Thread(
+                target=bulk_load_elastic,
+                args=(elastic, logger, path, index),
+                kwargs={
+                    "tune_index": not live_index,
+                    "manifest": manifest,
+                    "partitioning": partitioning,
+                    "monitor": monitor,
+                },
+            )
+        )
+    else:
+        threads.append(
+            Thread(
+                target=insert_into_elastic,
+                args=(elastic, logger, path, index),
+                kwargs={"manifest": manifest, "partitioning": partitioning, "monitor": monitor},
+            )
+        )
+
+    if manifest and manifest.is_done("postgres"):
+        logger.info("Postgres is already loaded, skipping")
+    elif copy_workers > 0 and not replace:
+        table = SQLModel.metadata.tables["arxiv_papers"]
+        threads.append(
+            Thread(
+                target=copy_into_postgres,
+                args=(engine, table, logger, path),
+                kwargs={
+                    "workers": copy_workers,
+                    "defer_indexes": defer_indexes,
+                    "manifest": manifest,
+                    "monitor": monitor,
+                },
+            )
+        )
+    else:
+        threads.append(
+            Thread(
+                target=insert_into_postgres,
+                args=(engine, logger, path),
+                kwargs={"replace": replace, "manifest": manifest, "metrics": monitor.worker("postgres")},
+            )
+        )
+
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
 
+
+def bases_exist(engine: Engine, elastic: Elasticsearch, logger: Logger) -> bool:
     logger.info("Checking whether data already exists in both databases")
-    postgres_amount = 0
+    postgres_amount = elastic_amount = 0
     try:
         elastic_amount = int(elastic.cat.count(index="arxiv", format="json")[0]["count"])
         with Session(engine) as session:
@@ -254,85 +297,247 @@ def setup_bases(engine: Engine, elastic: Elasticsearch, logger: Logger, path_to_
     except Exception as e:
         logger.error(f"Error while checking elasticsearch: {e}")
 
-    if elastic_amount == postgres_amount and postgres_amount > 0 and force == 0:
-        logger.info("Data already exists in both databases, skipping setup")
-        return
+    return elastic_amount == postgres_amount and postgres_amount > 0
 
-    logger.debug("Clearing existing data in elasticsearch")
-    if elastic.indices.exists(index="arxiv"):
-        elastic.indices.delete(index="arxiv")
 
-    elastic.indices.create(index="arxiv", mappings=index_mapping)
+def prepare_bases(
+    engine: Engine,
+    elastic: Elasticsearch,
+    logger: Logger,
+    versioned: bool = False,
+    partitioning: t.Optional[Partitioning] = None,
+) -> str:
+    # returns name of the index data should be loaded into, with partitioning it is the base of partition names
+    if versioned:
+        # old index and postgres rows keep serving searches until the new index is swapped in
+        index = new_index_name(INDEXNAME)
+        logger.debug(f"Building new index version {index}")
+        for target in target_indices(index, partitioning):
+            elastic.indices.create(index=target, mappings=index_mapping)
+
+        SQLModel.metadata.create_all(engine, [SQLModel.metadata.tables["arxiv_papers"]])
+        return index
+
+    logger.debug("Clearing existing data in elasticsearch")
+    if elastic.indices.exists_alias(name=INDEXNAME):
+        # left by versioned or partitioned setup, there is no index of that name, only the ones behind it
+        for index in get_aliased_indices(elastic, INDEXNAME):
+            elastic.indices.delete(index=index)
+    elif elastic.indices.exists(index=INDEXNAME):
+        elastic.indices.delete(index=INDEXNAME)
+
+    for target in target_indices(INDEXNAME, partitioning):
+        elastic.indices.create(index=target, mappings=index_mapping)
+
+    if partitioning:
+        # searches go through the alias, the same way as with versioned indices
+        logger.debug(f"Partitioning {INDEXNAME} into {len(partitioning.starts)} indices")
+        elastic.indices.update_aliases(
+            actions=[{"add": {"indices": partitioning.indices(INDEXNAME), "alias": INDEXNAME}}]
+        )
 
     SQLModel.metadata.drop_all(engine, [SQLModel.metadata.tables["arxiv_papers"]])
     SQLModel.metadata.create_all(engine, [SQLModel.metadata.tables["arxiv_papers"]])
+    return INDEXNAME
 
-    logger.info("Starting to parse lines")
-    result_path = path_to_dump.with_name("arxiv-processed.jsonl")
 
-    if force == 1:
-        if not result_path.exists():
-            logger.error("File does not exist, cannot delete")
-            return
+def get_known_papers(engine: Engine) -> t.Dict[str, str]:
+    with Session(engine) as session:
+        query = select(ArxivPaperModel.arxiv_id, ArxivPaperModel.update_date).execution_options(yield_per=100_000)
+        return {arxiv_id: update_date.strftime("%Y-%m-%d") for arxiv_id, update_date in session.exec(query)}
+
+
+def update_bases(
+    engine: Engine,
+    elastic: Elasticsearch,
+    logger: Logger,
+    path_to_dump: Path,
+    sharded: bool = False,
+    no_processors: t.Optional[int] = None,
+    elastic_bulk: bool = False,
+    fanout: bool = False,
+    monitor: t.Optional[Monitor] = None,
+):
+    logger.info("Updating bases with papers that are new or changed since last setup...")
+
+    if not elastic.indices.exists(index="arxiv"):
+        elastic.indices.create(index="arxiv", mappings=index_mapping)
 
-    else:
-        reader_queue = Queue(maxsize=1000)
-        writer_queue = Queue(maxsize=1000)
+    SQLModel.metadata.create_all(engine, [SQLModel.metadata.tables["arxiv_papers"]])
 
-        no_processors = 12
+    known = get_known_papers(engine)
+    logger.info(f"Found {len(known)} papers already in postgres")
 
-        reader = Reader(path_to_dump, reader_queue, no_processors)
-        processors = [Processor(reader_queue, writer_queue) for _ in range(no_processors)]
-        writer = Writer(result_path, writer_queue, no_processors)
+    delta_path = path_to_dump.with_name("arxiv-delta.jsonl")
+    preprocess = run_sharded_preprocessing if sharded else run_preprocessing
+    try:
+        preprocess(logger, path_to_dump, delta_path, no_processors, known=known, monitor=monitor)
+    except PipelineError as e:
+        logger.error(f"Preprocessing failed: {e}")
+        return
 
-        reader.start()
-        [processor.start() for processor in processors]
-        writer.start()
+    with open_processed(delta_path) as delta:
+        changed = delta.count()
 
-        reader.join()
-        [processor.join() for processor in processors]
-        writer.join()
+    logger.info(f"Found {changed} new or changed papers")
+    if changed == 0:
+        logger.info("Nothing to update")
+        return
 
-        reader_queue.close()
-        writer_queue.close()
+    # alias over partitions cannot be written to, papers go straight into the partition of their year
+    found = find_partitioning(get_aliased_indices(elastic, INDEXNAME))
+    index, partitioning = found if found else (INDEXNAME, None)
 
-        logger.info("Finished preprocessing lines")
+    # new versions of old papers land in frozen years too
+    with writable(elastic, logger, target_indices(index, partitioning)):
+        try:
+            load_into_bases(
+                engine,
+                elastic,
+                logger,
+                delta_path,
+                replace=True,
+                elastic_bulk=elastic_bulk,
+                index=index,
+                live_index=True,
+                fanout=fanout,
+                monitor=monitor,
+                partitioning=partitioning,
+            )
+        except PipelineError as e:
+            logger.error(f"Updating failed: {e}")
+            return
 
-    def insert_into_elastic(path_to_dump: Path, parts: int = 25, pos: int = 0):
-        with open(path_to_dump, "r") as file:
-            length = sum(1 for _ in file)
-            file.seek(0)
-            for i, batch in tqdm(enumerate(batched(file, (length // parts) + 1)), total=parts, position=pos):
-                batch = [do_elastic_fixes(json.loads(line)) for line in batch]
-                for ok, _ in helpers.parallel_bulk(elastic, batch):
-                    if not ok:
-                        logger.error("Error while inserting into elastic")
-                        continue
+        mark_loaded(elastic, logger, target_indices(index, partitioning))
+
+    logger.info("Finished updating data in both databases")
+
+
+def setup_bases(
+    engine: Engine,
+    elastic: Elasticsearch,
+    logger: Logger,
+    path_to_dump: Path,
+    force: int = 0,
+    sharded: bool = False,
+    no_processors: t.Optional[int] = None,
+    copy_workers: int = 0,
+    defer_indexes: bool = False,
+    elastic_bulk: bool = False,
+    versioned: bool = False,
+    keep_versions: int = 1,
+    resume: bool = False,
+    binary: bool = False,
+    fanout: bool = False,
+    shards: bool = False,
+    monitor: t.Optional[Monitor] = None,
+    partition: t.Optional[str] = None,
+    freeze_before: t.Optional[int] = None,
+):
+    logger.info("Setting up bases...")
+
+    manifest = Manifest(path_to_dump.with_name("arxiv-manifest.json"))
 
-                logger.debug(f"Inserted {(i + 1)/ parts * 100:.2f}% of data into elastic")
+    if resume and manifest.matches(path_to_dump):
+        index = manifest.data["index"]
+        versioned = manifest.data["versioned"]
+        # preprocessed file keeps the format it was started with
+        binary = manifest.data.get("binary", False)
+        shards = manifest.data.get("shards", False)
+        partitions = manifest.data.get("partitions")
+        partitioning = Partitioning(partitions) if partitions else None
+        result_path = processed_path(path_to_dump, binary)
+        logger.info(f"Resuming previous setup into {index} from {manifest.path}")
 
-    def insert_into_postgres(path_to_dump: Path, parts: int = 25, pos: int = 1):
-        with open(path_to_dump, "r") as file:
-            length = sum(1 for _ in file)
-            file.seek(0)
-            for i, batch in tqdm(enumerate(batched(file, (length // parts) + 1)), total=parts, position=pos):
-                with Session(engine) as session:
-                    objs = [ArxivPaperModel(**do_postgres_fixes(json.loads(entry))) for entry in batch]
-                    session.add_all(objs)
-                    session.commit()
+    else:
+        if bases_exist(engine, elastic, logger) and force == 0:
+            logger.info("Data already exists in both databases, skipping setup")
+            return
 
-                logger.debug(f"Inserted {(i + 1)/ parts * 100:.2f}% of data into postgres")
+        result_path = processed_path(path_to_dump, binary)
+        if force == 1 and not loaded_path(result_path, shards).exists():
+            logger.error("File does not exist, cannot delete")
+            return
 
-    t1 = Thread(target=insert_into_elastic, args=(result_path,))
-    t2 = Thread(target=insert_into_postgres, args=(result_path,))
+        partitioning = Partitioning.scheme(partition) if partition else None
+        index = prepare_bases(engine, elastic, logger, versioned=versioned, partitioning=partitioning)
+        manifest.reset(
+            path_to_dump,
+            index=index,
+            versioned=versioned,
+            binary=binary,
+            shards=shards,
+            partitions=partitioning.starts if partitioning else None,
+        )
+
+        if force == 1:
+            manifest.update("preprocess", done=True)
+
+    # loaders get list of the shards instead of a single file
+    processed = loaded_path(result_path, shards)
+    if manifest.is_done("preprocess"):
+        logger.info("Using already preprocessed lines")
 
-    t1.start()
-    t2.start()
+    else:
+        if not processed.exists():
+            manifest.reset_stage("preprocess")
 
-    t1.join()
-    t2.join()
+        logger.info("Starting to parse lines")
+        preprocess = run_sharded_preprocessing if sharded else run_preprocessing
+        try:
+            preprocess(
+                logger, path_to_dump, result_path, no_processors, manifest=manifest, shards=shards, monitor=monitor
+            )
+        except PipelineError as e:
+            logger.error(f"Preprocessing failed: {e}, rerun with --resume to continue")
+            return
+
+        # writer process kept the manifest up to date, not this one
+        manifest.load()
+        logger.info("Finished preprocessing lines")
+
+    try:
+        load_into_bases(
+            engine,
+            elastic,
+            logger,
+            processed,
+            copy_workers=copy_workers,
+            defer_indexes=defer_indexes,
+            elastic_bulk=elastic_bulk,
+            index=index,
+            replace=versioned,
+            fanout=fanout,
+            manifest=manifest,
+            monitor=monitor,
+            partitioning=partitioning,
+        )
+    except PipelineError as e:
+        logger.error(f"Loading failed: {e}, rerun with --resume to continue")
+        return
+
+    if not (manifest.is_done("elastic") and manifest.is_done("postgres")):
+        logger.error("Loading did not finish, rerun with --resume to continue")
+        return
 
     logger.info("Finished inserting data into both databases")
+
+    targets = target_indices(index, partitioning)
+    mark_loaded(elastic, logger, targets)
+    if partitioning and freeze_before:
+        freeze_partitions(elastic, logger, targets, freeze_before)
+
+    if versioned:
+        with open_processed(processed) as source:
+            expected = source.count()
+        if not validate_index(elastic, logger, ",".join(targets), expected):
+            logger.error(f"Not swapping alias, {INDEXNAME} still points to the previous version")
+            return
+
+        swap_alias(elastic, logger, INDEXNAME, targets)
+        collect_old_indices(elastic, logger, INDEXNAME, keep=keep_versions)
+
+    manifest.finish()
     logger.info("Have a nice day! :)")
 
 
@@ -342,7 +547,7 @@ if __name__ == "__main__":
         "--path",
         type=Path,
         default=Path("arxiv-metadata-oai-snapshot.json"),
-        help="Path to the dump file",
+        help="Path to the dump file, .gz, .bz2, .xz and .zst files are decompressed on the fly",
     )
 
     parser.add_argument(
@@ -368,6 +573,105 @@ if __name__ == "__main__":
         + "\n\t1: delete data and use partially processed data"
         + "\n\t2: delete data and create new data from dump",
     )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Split the dump into byte ranges and let every processor read its own range",
+    )
+    parser.add_argument(
+        "--incremental",
+        "-i",
+        action="store_true",
+        help="Only upsert papers that are new or got a new version since last setup, ignores --force",
+    )
+
+    parser.add_argument(
+        "--processors",
+        "-p",
+        type=int,
+        default=None,
+        help="Number of processors used for preprocessing the dump, "
+        + "by default it is picked from the number of cores and measured throughput",
+    )
+    parser.add_argument(
+        "--copy-workers",
+        type=int,
+        default=0,
+        help="Load postgres with COPY over that many parallel connections instead of ORM inserts, "
+        + "not used with --incremental",
+    )
+
+    parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        help="Drop arxiv_id and doi indexes before COPY and build them after the load",
+    )
+    parser.add_argument(
+        "--elastic-bulk",
+        action="store_true",
+        help="Stream documents into elastic with adaptive chunk size and retries, "
+        + "with refresh and replicas disabled for a full setup",
+    )
+    parser.add_argument(
+        "--versioned",
+        action="store_true",
+        help="Build into a new timestamped index and swap the arxiv alias to it once it is complete, "
+        + "postgres rows are replaced instead of dropped, so searches keep working during the rebuild",
+    )
+
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=1,
+        help="How many previous index versions to keep for a rollback with --versioned",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue unfinished setup of the same dump from checkpoints in arxiv-manifest.json",
+    )
+
+    parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="Write preprocessed papers as length-prefixed binary records with an offset index "
+        + "(arxiv-processed.bin) instead of json lines, loaders read them without parsing json",
+    )
+    parser.add_argument(
+        "--fanout",
+        action="store_true",
+        help="Parse preprocessed file once and feed elastic and postgres from separate processes, "
+        + "replaces --elastic-bulk and --copy-workers loaders",
+    )
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help="Let every processor write its own output shard instead of sending everything to a single writer, "
+        + "shards are listed in arxiv-processed.shards.json and loaded side by side",
+    )
+
+    parser.add_argument(
+        "--partition",
+        choices=["year", "era"],
+        default=None,
+        help="Split elastic index into one index per year or per era of create_date behind the arxiv alias, "
+        + "searches only touch indices overlapping the requested years",
+    )
+    parser.add_argument(
+        "--freeze-before",
+        type=int,
+        default=None,
+        help="Force merge partitions of years before this one and block them for writes, "
+        + "incremental updates lift the block for their duration",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve the latest throughput, queue depth and memory of every stage as json on localhost:PORT, "
+        + "samples are always appended to arxiv-metrics.jsonl next to the dump",
+    )
     args = parser.parse_args()
 
     engine = setup_database()
@@ -379,4 +683,40 @@ if __name__ == "__main__":
     if args.categories_only:
         exit(0)
 
-    setup_bases(engine, elastic, logger, args.path, force=args.force)
+    # every stage reports how fast it goes and how long it waits on its neighbours
+    with Monitor(args.path.with_name("arxiv-metrics.jsonl"), port=args.metrics_port) as monitor:
+        if args.incremental:
+            update_bases(
+                engine,
+                elastic,
+                logger,
+                args.path,
+                sharded=args.sharded,
+                no_processors=args.processors,
+                elastic_bulk=args.elastic_bulk,
+                fanout=args.fanout,
+                monitor=monitor,
+            )
+            exit(0)
+
+        setup_bases(
+            engine,
+            elastic,
+            logger,
+            args.path,
+            force=args.force,
+            sharded=args.sharded,
+            no_processors=args.processors,
+            copy_workers=args.copy_workers,
+            defer_indexes=args.defer_indexes,
+            elastic_bulk=args.elastic_bulk,
+            versioned=args.versioned,
+            keep_versions=args.keep_versions,
+            resume=args.resume,
+            binary=args.binary,
+            fanout=args.fanout,
+            shards=args.shards,
+            monitor=monitor,
+            partition=args.partition,
+            freeze_before=args.freeze_before,
+        )
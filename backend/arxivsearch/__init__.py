@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -6,18 +9,37 @@ from arxivsearch.logger import setup_logger
 
 logger = setup_logger()
 
-from arxivsearch.database import setup_database
-from arxivsearch.elastic import setup_elastic
+from arxivsearch.database import (
+    close_async_database,
+    setup_async_database,
+    setup_database,
+)
+from arxivsearch.database.helpers import preload_categories
+from arxivsearch.elastic import close_async_elastic, setup_async_elastic, setup_elastic
 from arxivsearch.routes import routers
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # nothing connects on import, so modules of the app can be imported without running databases
+    app.state.engine_database = setup_database()
+    app.state.engine_elasticsearch = setup_elastic()
+    # categories are read from the sync engine, doing it here keeps the first requests off a blocked event loop
+    await asyncio.to_thread(preload_categories)
+
+    # async clients bind their pools to the running event loop, so they live only as long as it does
+    app.state.async_engine_database = setup_async_database()
+    app.state.async_engine_elasticsearch = setup_async_elastic()
+    yield
+
+    await close_async_elastic()
+    await close_async_database()
+
+
 def create_app() -> FastAPI:
 
     logger.info("Hello from arxivsearch, starting up...")
-    app = FastAPI(redirect_slashes=False, debug=config.DEBUG)
-
-    app.state.engine_database = setup_database()
-    app.state.engine_elasticsearch = setup_elastic()
+    app = FastAPI(redirect_slashes=False, debug=config.DEBUG, lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import typing as t
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+import arxivsearch.config as config
+from arxivsearch.logger import get_logger
+
+logger = get_logger("cache")
+
+
+class CacheBackend(t.Protocol):
+    # blocking backends are called from a thread, so they never stall the event loop
+    blocking: bool
+
+    def get(self, key: str) -> t.Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes, ttl: float): ...
+
+    def size(self) -> int: ...
+
+
+class MemoryBackend:
+    # least recently used entries go first once their total size is over the limit, only this worker sees them
+    blocking = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, t.Tuple[float, bytes]] = OrderedDict()
+        self.bytes = 0
+        self.lock = Lock()
+
+    def get(self, key: str) -> t.Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[0] < time.time():
+                self.bytes -= len(self.entries.pop(key)[1])
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key)[1])
+
+            self.entries[key] = (time.time() + ttl, value)
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def size(self) -> int:
+        return self.bytes
+
+
+class DiskBackend:
+    # sqlite file shared by all workers on the machine, sqlite does the locking between processes
+    blocking = True
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            + "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+
+        # total size is kept up to date by triggers, so no write has to sum the whole table.
+        # files written before there was a counter get it counted once here
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "INSERT OR IGNORE INTO usage VALUES (0, (SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses))"
+        )
+        self.connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses "
+            + "BEGIN UPDATE usage SET bytes = bytes + LENGTH(new.value); END"
+        )
+        self.connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF value ON responses "
+            + "BEGIN UPDATE usage SET bytes = bytes + LENGTH(new.value) - LENGTH(old.value); END"
+        )
+        self.connection.execute(
+            "CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses "
+            + "BEGIN UPDATE usage SET bytes = bytes - LENGTH(old.value); END"
+        )
+        self.lock = Lock()
+
+    def get(self, key: str) -> t.Optional[bytes]:
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.connection.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        with self.lock, self.connection:
+            # other workers wait until the entry is in and everything fits again
+            self.connection.execute("BEGIN IMMEDIATE")
+            # replace would delete the old row without firing the delete trigger, upsert updates it instead
+            self.connection.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?) ON CONFLICT (key) "
+                + "DO UPDATE SET value = excluded.value, expires = excluded.expires, used = excluded.used",
+                (key, value, now + ttl, now),
+            )
+            # expired entries go first, then the least recently used ones until everything fits
+            self.connection.execute("DELETE FROM responses WHERE expires < ?", (now,))
+            excess = self.size() - self.max_bytes
+            if excess <= 0:
+                return
+
+            evicted = []
+            for evicted_key, length in self.connection.execute(
+                "SELECT key, LENGTH(value) FROM responses ORDER BY used"
+            ):
+                if excess <= 0:
+                    break
+                evicted.append((evicted_key,))
+                excess -= length
+
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def size(self) -> int:
+        return self.connection.execute("SELECT bytes FROM usage").fetchone()[0]
+
+
+class ResponseCache:
+    # responses are stored already serialized, a hit is sent as is without building any models
+    def __init__(self, backend: t.Optional[CacheBackend], ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(namespace: str, parts: t.Dict[str, t.Any], generation: t.Optional[int]) -> str:
+        # generation is a part of the key, after reload old entries are never read again and age out
+        payload = json.dumps({"parts": parts, "generation": generation}, sort_keys=True, separators=(",", ":"))
+        return f"{namespace}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    async def call(self, method: t.Callable[..., t.Any], *args) -> t.Any:
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+
+        return method(*args)
+
+    async def get(self, key: str) -> t.Optional[bytes]:
+        if self.backend is None:
+            return None
+
+        try:
+            value = await self.call(self.backend.get, key)
+        except Exception as e:
+            # broken or locked cache must not fail the search, it is only slower without it
+            logger.warning(f"Error while reading cached response {key}: {e}")
+            self.errors += 1
+            value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    async def set(self, key: str, value: bytes):
+        if self.backend is None:
+            return
+
+        try:
+            await self.call(self.backend.set, key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Error while caching response {key}: {e}")
+            self.errors += 1
+
+    async def stats(self) -> t.Dict[str, t.Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "bytes": await self.call(self.backend.size) if self.backend else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "errors": self.errors,
+        }
+
+
+def setup_response_cache() -> ResponseCache:
+    backend = None
+    if config.SEARCH_CACHE == "memory":
+        backend = MemoryBackend(config.SEARCH_CACHE_BYTES)
+    elif config.SEARCH_CACHE == "disk":
+        backend = DiskBackend(Path(config.SEARCH_CACHE_PATH), config.SEARCH_CACHE_BYTES)
+    elif config.SEARCH_CACHE != "none":
+        logger.warning(f"Unknown search cache backend {config.SEARCH_CACHE}, responses are not cached")
+
+    return ResponseCache(backend, config.SEARCH_CACHE_TTL)
+
+
+response_cache = setup_response_cache()
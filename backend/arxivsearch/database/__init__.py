@@ -2,12 +2,15 @@ import typing as t
 
 from fastapi import Depends
 from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import arxivsearch.config as config
 from arxivsearch.database.arxiv import ArxivCategoriesModel, ArxivPaperModel
 
 _engine: t.Optional[Engine] = None
+_async_engine: t.Optional[AsyncEngine] = None
 
 
 def setup_database() -> Engine:
@@ -21,6 +24,22 @@ def setup_database() -> Engine:
     return _engine
 
 
+def setup_async_database() -> AsyncEngine:
+    global _async_engine
+    if _async_engine:
+        return _async_engine
+
+    # psycopg has async connections under the same url, tables are created by the sync engine
+    _async_engine = create_async_engine(config.DATABASE_URL, pool_size=config.DATABASE_POOL_SIZE)
+
+    return _async_engine
+
+
+async def close_async_database():
+    if _async_engine:
+        await _async_engine.dispose()
+
+
 def get_database_session():
     global _engine
 
@@ -28,7 +47,25 @@ def get_database_session():
         yield session
 
 
+async def get_async_database_session():
+    if _async_engine is None:
+        setup_async_database()
+
+    async with AsyncSession(_async_engine) as session:
+        yield session
+
+
 models = [ArxivCategoriesModel, ArxivPaperModel]
 
-__all__ = ["ArxivPaperModel", "ArxivCategoriesModel", "models", "setup_database", "get_database_session"]
+__all__ = [
+    "ArxivPaperModel",
+    "ArxivCategoriesModel",
+    "models",
+    "setup_database",
+    "setup_async_database",
+    "close_async_database",
+    "get_database_session",
+    "get_async_database_session",
+]
 SessionDep = t.Annotated[Session, Depends(get_database_session)]
+AsyncSessionDep = t.Annotated[AsyncSession, Depends(get_async_database_session)]
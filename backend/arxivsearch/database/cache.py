@@ -0,0 +1,99 @@
+import time
+import typing as t
+from collections import OrderedDict
+
+from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import arxivsearch.config as config
+from arxivsearch.database.arxiv import ArxivPaperModel
+from arxivsearch.logger import get_logger
+
+logger = get_logger("cache")
+
+
+class PaperCache:
+    # least recently used papers go first, entries older than ttl are dropped when they are looked up.
+    # papers are detached from their session, they are only read when responses are built
+    def __init__(self, size: int, ttl: float = 0):
+        self.size = size
+        self.ttl = ttl
+        self.papers: OrderedDict[str, t.Tuple[float, ArxivPaperModel]] = OrderedDict()
+        self.generation: t.Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def sync(self, generation: t.Optional[int]):
+        # ingest bumps the generation whenever it loads data, cached rows may be outdated since then
+        if generation == self.generation:
+            return
+
+        logger.debug(f"Data generation changed from {self.generation} to {generation}, clearing paper cache")
+        self.papers.clear()
+        self.generation = generation
+        self.invalidations += 1
+
+    def get_many(self, ids: t.Iterable[str]) -> t.Tuple[t.Dict[str, ArxivPaperModel], t.List[str]]:
+        found, missing = {}, []
+        now = time.monotonic()
+        for arxiv_id in ids:
+            entry = self.papers.get(arxiv_id)
+            if entry is not None and self.ttl and now - entry[0] > self.ttl:
+                del self.papers[arxiv_id]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                missing.append(arxiv_id)
+                continue
+
+            self.papers.move_to_end(arxiv_id)
+            found[arxiv_id] = entry[1]
+
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, papers: t.Iterable[ArxivPaperModel]):
+        now = time.monotonic()
+        for paper in papers:
+            self.papers[paper.arxiv_id] = (now, paper)
+            self.papers.move_to_end(paper.arxiv_id)
+
+        while len(self.papers) > self.size:
+            self.papers.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> t.Dict[str, t.Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.papers),
+            "max_size": self.size,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+paper_cache = PaperCache(config.PAPER_CACHE_SIZE, config.PAPER_CACHE_TTL)
+
+
+async def get_papers(session: AsyncSession, ids: t.List[str], generation: t.Optional[int]) -> t.List[ArxivPaperModel]:
+    # only papers that are not cached go to postgres, the order of ids is not kept
+    paper_cache.sync(generation)
+    found, missing = paper_cache.get_many(ids)
+    if not missing:
+        return list(found.values())
+
+    results = await session.exec(select(ArxivPaperModel).where(col(ArxivPaperModel.arxiv_id).in_(missing)))
+    papers = list(results.all())
+    paper_cache.put_many(papers)
+
+    return [*found.values(), *papers]
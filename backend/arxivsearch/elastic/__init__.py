@@ -1,26 +1,45 @@
+import time
 import typing as t
 
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError
 from fastapi import Depends
 
 import arxivsearch.config as config
+from partition_names import overlapping
+
+INDEX = "arxiv"
+# every client talking to the cluster uses these, ingest sinks included
+CLIENT_OPTIONS = {"timeout": 30, "max_retries": 10, "retry_on_timeout": True}
 
 _elastic_client: t.Optional[Elasticsearch] = None
+_async_elastic_client: t.Optional[AsyncElasticsearch] = None
+# when indices behind the alias were looked up, their names and the generation of their data,
+# they only change on setup
+_index_state: t.Optional[t.Tuple[float, t.List[str], t.Optional[int]]] = None
 
 
 # TODO: replace with elasticsearch-dsl
 def setup_elastic() -> Elasticsearch:
     global _elastic_client
     if _elastic_client is None:
-        _elastic_client = Elasticsearch(
-            hosts=config.ELASTIC_URL,
-            timeout=30,
-            max_retries=10,
-            retry_on_timeout=True,
-        )
+        _elastic_client = Elasticsearch(hosts=config.ELASTIC_URL, **CLIENT_OPTIONS)
     return _elastic_client
 
 
+def setup_async_elastic() -> AsyncElasticsearch:
+    global _async_elastic_client
+    if _async_elastic_client is None:
+        _async_elastic_client = AsyncElasticsearch(
+            hosts=config.ELASTIC_URL, connections_per_node=config.ELASTIC_CONNECTIONS, **CLIENT_OPTIONS
+        )
+    return _async_elastic_client
+
+
+async def close_async_elastic():
+    if _async_elastic_client is not None:
+        await _async_elastic_client.close()
+
+
 def get_elastic_client():
     global _elastic_client
     if _elastic_client is None:
@@ -29,4 +48,48 @@ def get_elastic_client():
     yield _elastic_client
 
 
+async def get_async_elastic_client():
+    if _async_elastic_client is None:
+        setup_async_elastic()
+
+    yield _async_elastic_client
+
+
 ElasticDep = t.Annotated[Elasticsearch, Depends(get_elastic_client)]
+AsyncElasticDep = t.Annotated[AsyncElasticsearch, Depends(get_async_elastic_client)]
+
+
+async def get_index_state(elastic: AsyncElasticsearch) -> t.Tuple[t.List[str], t.Optional[int]]:
+    global _index_state
+    if _index_state is None or time.monotonic() - _index_state[0] > config.PARTITIONS_REFRESH:
+        try:
+            # mappings of everything behind the alias, or of the plain index, with _meta left by ingest
+            mappings = (await elastic.indices.get_mapping(index=INDEX)).body
+        except NotFoundError:
+            mappings = {}
+
+        # every load marks the indices it wrote to, indices from before that have none
+        generations = [mapping["mappings"].get("_meta", {}).get("generation") for mapping in mappings.values()]
+        generation = max((g for g in generations if g is not None), default=None)
+        _index_state = (time.monotonic(), list(mappings.keys()), generation)
+
+    return _index_state[1], _index_state[2]
+
+
+async def get_aliased_indices(elastic: AsyncElasticsearch) -> t.List[str]:
+    indices, _ = await get_index_state(elastic)
+    return indices
+
+
+async def get_generation(elastic: AsyncElasticsearch) -> t.Optional[int]:
+    _, generation = await get_index_state(elastic)
+    return generation
+
+
+async def get_search_indices(elastic: AsyncElasticsearch, year_start: int, year_end: int) -> str:
+    # with partitioned index only the years that can match are searched, everything else goes through the alias
+    found = overlapping(await get_aliased_indices(elastic), year_start, year_end)
+    if not found:
+        return INDEX
+
+    return ",".join(found)
@@ -1,5 +1,7 @@
 from fastapi.routing import APIRouter
 
+from arxivsearch.cache import response_cache
+from arxivsearch.database.cache import paper_cache
 from arxivsearch.logger import get_logger
 
 health_router = APIRouter(prefix="/health", tags=["main"])
@@ -9,3 +11,8 @@ logger = get_logger("health")
 @health_router.get("")
 def main():
     return {"status": "ok"}
+
+
+@health_router.get("/cache")
+async def cache():
+    return {"papers": paper_cache.stats(), "responses": await response_cache.stats()}
@@ -79,12 +79,15 @@ class Pagination(BaseModel):
     current_page: int = Field(..., description="Current page number")
     size: int = Field(..., description="Number of results per page")
 
+    total_is_lower_bound: bool = Field(False, description="Total number of results was not counted past this value")
+
     class Config:
         json_schema_extra = {
             "total_records": 1000,
             "total_pages": 100,
             "current_page": 1,
             "size": 10,
+            "total_is_lower_bound": False,
         }
 
 
@@ -126,6 +129,29 @@ class SearchQuery(BaseModel):
             raise ValueError("Invalid subject categories provided")
         return self
 
+    def normalized(self) -> "SearchQuery":
+        # queries that give the same results look the same, so they share a cache entry.
+        # search is analyzed and lowercased by elastic, authors and facets are keywords, only whitespace goes there
+        return self.model_copy(
+            update={
+                "search": " ".join(self.search.lower().split()),
+                "author": " ".join(self.author.split()) or None if self.author else None,
+                "subject": sorted(set(self.subject or [])),
+                "facet_by": sorted(
+                    {(facet.field, facet.value): facet for facet in self.facet_by or []}.values(),
+                    key=lambda facet: (facet.field, facet.value),
+                ),
+            }
+        )
+
+
+class FacetsResponse(BaseModel):
+    time_to_search: int = Field(..., description="Time taken to count facets in ms, 0 when they were cached")
+
+    available_facets: t.List[FacetByResult] = Field(..., description="Facets available for the search")
+
+    found_per_year: t.Dict[int, int] = Field(..., description="Number of papers found per year")
+
 
 class SearchResponse(BaseModel):
     pagination: Pagination = Field(..., description="Pagination information for the search results")
@@ -136,3 +162,16 @@ class SearchResponse(BaseModel):
     available_facets: t.List[FacetByResult] = Field(..., description="Facets available for the search")
 
     found_per_year: t.Dict[int, int] = Field(..., description="Number of papers found per year")
+
+    next_cursor: str | None = Field(None, description="Cursor of the next page, only when paging with cursors")
+
+
+class BatchSearchResult(BaseModel):
+    response: SearchResponse | None = Field(None, description="Response of the query, same as from /search")
+    error: str | None = Field(None, description="Why the query failed, the rest of the batch is not affected")
+
+
+class SuggestResponse(BaseModel):
+    titles: t.List[str] = Field(..., description="Titles starting with the typed text")
+    authors: t.List[str] = Field(..., description="Authors whose name or surname starts with the typed text")
+    categories: t.List[SubcategoryModel] = Field(..., description="Categories and subcategories matching the text")
@@ -1,17 +1,28 @@
+import asyncio
+import base64
+import binascii
 import json
 import typing as t
 from datetime import date
 
-from fastapi import APIRouter, Query
+from elasticsearch import ApiError, AsyncElasticsearch, NotFoundError
+from fastapi import APIRouter, Body, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlmodel import col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 import arxivsearch.config as config
-from arxivsearch.database import SessionDep
-from arxivsearch.database.arxiv import ArxivPaperModel
-from arxivsearch.elastic import ElasticDep
+from arxivsearch.cache import response_cache
+from arxivsearch.database import AsyncSessionDep, setup_async_database
+from arxivsearch.database.arxiv import ArxivPaperModel, ArxivPaperModelBase
+from arxivsearch.database.cache import get_papers
+from arxivsearch.elastic import AsyncElasticDep, get_generation, get_search_indices
 from arxivsearch.logger import get_logger
 from arxivsearch.routes.models import (
+    BatchSearchResult,
     FacetByResult,
+    FacetsResponse,
     Pagination,
     SearchQuery,
     SearchResponse,
@@ -21,15 +32,50 @@ logger = get_logger("search")
 search_router = APIRouter(prefix="/search", tags=["search"])
 
 
-@search_router.post("", response_model=SearchResponse)
-def search(
-    search_query: SearchQuery,
-    session: SessionDep,
-    elastic: ElasticDep,
-    page: t.Annotated[int, Query(ge=0, description="Skip n first results")] = 0,
-    perpage: t.Annotated[int, Query(ge=1, lte=30, description="Limit results")] = 30,
-):
+def track_total_hits(policy: str) -> bool | int:
+    # exact counts every match, which keeps elastic from skipping documents that cannot make it to the top hits
+    if policy in ("exact", "off"):
+        return policy == "exact"
+
+    return int(policy)
+
+
+TRACK_TOTAL_HITS = track_total_hits(config.TOTAL_HITS)
+
+FIRST_CURSOR = "*"
+# with point in time every shard keeps its segments, ties in score are broken by their position in them
+CURSOR_SORT = [{"_score": {"order": "desc"}}, {"_shard_doc": {"order": "asc"}}]
+
+
+def encode_cursor(pit: str, after: t.List[t.Any], page: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"pit": pit, "after": after, "page": page}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> t.Dict[str, t.Any]:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not (
+            isinstance(state, dict)
+            and isinstance(state.get("pit"), str)
+            and isinstance(state.get("after"), list)
+            and isinstance(state.get("page"), int)
+        ):
+            raise ValueError("Invalid cursor fields")
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
+    return state
+
+
+async def close_point_in_time(elastic: AsyncElasticsearch, pit: str):
+    # expired point in time is already gone, there is nothing left to close
+    try:
+        await elastic.close_point_in_time(id=pit)
+    except ApiError as e:
+        logger.debug(f"Point in time was not closed: {e}")
+
+
+def build_query(search_query: SearchQuery) -> t.Dict[str, t.Any]:
     date_start = date(search_query.year_start, 1, 1)
     date_end = date(search_query.year_end + 1, 1, 1)
 
@@ -78,7 +124,11 @@ def search(
             ],
         },
     }
-    aggs = {
+    return query
+
+
+def build_aggs(search_query: SearchQuery) -> t.Dict[str, t.Any]:
+    return {
         "categories-agg": {
             "terms": {
                 "field": "categories",
@@ -100,43 +150,54 @@ def search(
         },
     }
 
-    # execute query
-    result = elastic.search(
-        index="arxiv",
-        sort={"_score": {"order": "desc"}},
-        query=query,
-        size=perpage,
-        from_=perpage * page,
-        aggs=aggs,
-        track_total_hits=True,
-    )
 
-    # parse result
-    time_to_search = result["took"]
+def paginate(result: t.Any, page: int, perpage: int) -> Pagination:
     hits = result["hits"]["hits"]
-    total_hits = result["hits"]["total"]["value"]
+    seen = perpage * page + len(hits)
+    total = result["hits"].get("total")
+    if total is None:
+        # nothing was counted, there is at least one more page when this one is full
+        return Pagination(
+            total_records=seen,
+            total_pages=page + 1 + (len(hits) == perpage),
+            current_page=page,
+            size=len(hits),
+            total_is_lower_bound=True,
+        )
 
-    if config.DEBUG:
-        logger.debug(f"Query: {json.dumps(query)}")
-        logger.debug(f"Result: {json.dumps(result.body)}")
-    logger.debug(f"Got {len(hits)} hits")
-    logger.debug(f"Got {total_hits} total hits")
-    logger.debug(f"Took {time_to_search} ms to search")
+    # counting stopped at the threshold, pages past it are still there
+    total_records = max(total["value"], seen)
+    return Pagination(
+        total_records=total_records,
+        total_pages=(total_records // perpage) + (total_records % perpage > 0),
+        current_page=page,
+        size=len(hits),
+        total_is_lower_bound=total["relation"] == "gte",
+    )
 
-    ids = [hit["_id"] for hit in hits]
 
-    logger.debug(f"Ids: {ids}")
+def search_key(search_query: SearchQuery, page: int, perpage: int, facets: bool, generation: t.Optional[int]) -> str:
+    return response_cache.key(
+        "search",
+        {"query": search_query.model_dump(mode="json"), "page": page, "perpage": perpage, "facets": facets},
+        generation,
+    )
+
+
+def facets_key(search_query: SearchQuery, generation: t.Optional[int]) -> str:
+    # facets only change with the query, every page of it shares them
+    return response_cache.key("facets", {"query": search_query.model_dump(mode="json")}, generation)
+
 
-    # get papers from database
-    with session.exec(select(ArxivPaperModel).where(col(ArxivPaperModel.arxiv_id).in_(ids))) as results:
-        papers = list(results.all())
+async def cached_facets(key: str) -> t.Optional[FacetsResponse]:
+    cached = await response_cache.get(key)
+    if cached is None:
+        return None
 
-    logger.debug(f"Got {len(papers)} papers from database")
+    return FacetsResponse.model_validate_json(cached).model_copy(update={"time_to_search": 0})
 
-    paper_map = dict.fromkeys(ids)
-    for paper in papers:
-        paper_map[paper.arxiv_id] = paper
 
+def parse_facets(result: t.Any) -> FacetsResponse:
     categories_facets = result["aggregations"]["categories-agg"]["buckets"]
     author_facets = result["aggregations"]["authors-agg"]["buckets"]
     year_facets = result["aggregations"]["year-agg"]["buckets"]
@@ -153,18 +214,338 @@ def search(
         str(facet["from_as_string"]): facet["doc_count"] for facet in year_facets if facet["from_as_string"] is not None
     }
 
-    pagination = Pagination(
-        total_records=total_hits,
-        total_pages=(total_hits // perpage) + (total_hits % perpage > 0),
-        current_page=page,
-        size=len(hits),
+    return FacetsResponse(time_to_search=result["took"], available_facets=all_facets, found_per_year=years)
+
+
+async def get_facets(
+    elastic: AsyncElasticsearch, index: str, search_query: SearchQuery, generation: t.Optional[int]
+) -> FacetsResponse:
+    key = facets_key(search_query, generation)
+    facets = await cached_facets(key)
+    if facets is not None:
+        return facets
+
+    # size 0 with no `now` in the query can be answered from the shard request cache
+    result = await elastic.search(
+        index=index,
+        query=build_query(search_query),
+        size=0,
+        aggs=build_aggs(search_query),
+        track_total_hits=False,
+        request_cache=True,
     )
 
-    # prepare response
+    facets = parse_facets(result)
+    await response_cache.set(key, facets.model_dump_json().encode())
+    return facets
+
+
+def build_response(
+    result: t.Any,
+    papers: t.Dict[str, ArxivPaperModel],
+    page: int,
+    perpage: int,
+    facets: FacetsResponse,
+    next_cursor: t.Optional[str] = None,
+) -> SearchResponse:
+    hits = result["hits"]["hits"]
+    pagination = paginate(result, page, perpage)
+
+    logger.debug(f"Got {len(hits)} hits")
+    logger.debug(f"Got {pagination.total_records}{'+' if pagination.total_is_lower_bound else ''} total hits")
+
+    time_to_search = max(result["took"], facets.time_to_search)
+    logger.debug(f"Took {time_to_search} ms to search")
+
+    # papers missing in postgres stay as empty slots, order of hits is kept
     return SearchResponse(
         pagination=pagination,
         time_to_search=time_to_search,
-        papers=paper_map.values(),
-        available_facets=all_facets,
-        found_per_year=years,
+        papers=[papers.get(hit["_id"]) for hit in hits],
+        available_facets=facets.available_facets,
+        found_per_year=facets.found_per_year,
+        next_cursor=next_cursor,
     )
+
+
+@search_router.post("/facets", response_model=FacetsResponse)
+async def search_facets(search_query: SearchQuery, elastic: AsyncElasticDep):
+    search_query = search_query.normalized()
+    index = await get_search_indices(elastic, search_query.year_start, search_query.year_end)
+
+    return await get_facets(elastic, index, search_query, await get_generation(elastic))
+
+
+async def export_papers(
+    elastic: AsyncElasticsearch, index: str, search_query: SearchQuery, fields: t.List[str]
+) -> t.AsyncIterator[bytes]:
+    # only one batch of ids and papers is held at a time, however many papers match
+    columns = [getattr(ArxivPaperModel, field) for field in fields]
+    pit = (await elastic.open_point_in_time(index=index, keep_alive=config.CURSOR_KEEP_ALIVE))["id"]
+    after = {}
+    try:
+        # response is already being sent, session of the request is not there anymore
+        async with AsyncSession(setup_async_database()) as session:
+            while True:
+                # order does not matter, scoring is skipped and documents come in the order they are stored
+                result = await elastic.search(
+                    pit={"id": pit, "keep_alive": config.CURSOR_KEEP_ALIVE},
+                    sort=[{"_shard_doc": {"order": "asc"}}],
+                    query={"constant_score": {"filter": build_query(search_query)}},
+                    size=config.EXPORT_BATCH,
+                    source=False,
+                    track_total_hits=False,
+                    **after,
+                )
+                pit, hits = result["pit_id"], result["hits"]["hits"]
+                if not hits:
+                    return
+
+                ids = [hit["_id"] for hit in hits]
+                rows = await session.exec(
+                    select(ArxivPaperModel.arxiv_id, *columns).where(col(ArxivPaperModel.arxiv_id).in_(ids))
+                )
+                papers = {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+                yield b"".join(
+                    json.dumps(papers[arxiv_id], default=lambda value: value.isoformat()).encode() + b"\n"
+                    for arxiv_id in ids
+                    if arxiv_id in papers
+                )
+                if len(hits) < config.EXPORT_BATCH:
+                    return
+
+                after = {"search_after": hits[-1]["sort"]}
+
+    finally:
+        # an error here would hide the one that ended the stream, or cut a complete one short
+        await close_point_in_time(elastic, pit)
+
+
+@search_router.post("/export")
+async def search_export(
+    search_query: SearchQuery,
+    elastic: AsyncElasticDep,
+    fields: t.Annotated[
+        t.List[str] | None, Query(description="Fields of papers to export, all of them when not given")
+    ] = None,
+):
+    known = list(ArxivPaperModelBase.model_fields.keys())
+    fields = fields or known
+    unknown = [field for field in fields if field not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    search_query = search_query.normalized()
+    index = await get_search_indices(elastic, search_query.year_start, search_query.year_end)
+
+    return StreamingResponse(export_papers(elastic, index, search_query, fields), media_type="application/x-ndjson")
+
+
+def error_reason(item: t.Dict[str, t.Any]) -> str:
+    error = item["error"]
+    return error.get("reason", error.get("type")) if isinstance(error, dict) else str(error)
+
+
+NO_FACETS = FacetsResponse(time_to_search=0, available_facets=[], found_per_year={})
+
+
+@search_router.post("/batch", response_model=t.List[BatchSearchResult])
+async def search_batch(
+    queries: t.Annotated[
+        t.List[t.Dict[str, t.Any]],
+        Body(max_length=config.BATCH_MAX_QUERIES, description="Search queries, each one is validated on its own"),
+    ],
+    session: AsyncSessionDep,
+    elastic: AsyncElasticDep,
+    page: t.Annotated[int, Query(ge=0, description="Skip n first results of every query")] = 0,
+    perpage: t.Annotated[int, Query(ge=1, lte=30, description="Limit results of every query")] = 30,
+    facets: t.Annotated[bool, Query(description="Count facets and papers per year of every query")] = True,
+):
+    # every query that is not cached goes into a single _msearch, hits of all of them are hydrated at once
+    generation = await get_generation(elastic)
+    results: t.List[t.Optional[BatchSearchResult]] = [None] * len(queries)
+    pending: t.List[t.Dict[str, t.Any]] = []
+    searches: t.List[t.Dict[str, t.Any]] = []
+
+    for i, raw in enumerate(queries):
+        try:
+            search_query = SearchQuery.model_validate(raw).normalized()
+        except ValidationError as e:
+            results[i] = BatchSearchResult(error="; ".join(error["msg"] for error in e.errors()))
+            continue
+
+        key = search_key(search_query, page, perpage, facets, generation)
+        cached = await response_cache.get(key)
+        if cached is not None:
+            results[i] = BatchSearchResult(response=SearchResponse.model_validate_json(cached))
+            continue
+
+        query = build_query(search_query)
+        index = await get_search_indices(elastic, search_query.year_start, search_query.year_end)
+        item = {"position": i, "key": key, "hits": len(searches) // 2, "facets": NO_FACETS}
+        searches += [
+            {"index": index},
+            {
+                "query": query,
+                "sort": [{"_score": {"order": "desc"}}],
+                "size": perpage,
+                "from": perpage * page,
+                "track_total_hits": TRACK_TOTAL_HITS,
+            },
+        ]
+
+        if facets:
+            item["facets_key"] = facets_key(search_query, generation)
+            item["facets"] = await cached_facets(item["facets_key"])
+            if item["facets"] is None:
+                item["facets_at"] = len(searches) // 2
+                searches += [
+                    {"index": index, "request_cache": True},
+                    {"query": query, "size": 0, "aggs": build_aggs(search_query), "track_total_hits": False},
+                ]
+
+        pending.append(item)
+
+    responses = (await elastic.msearch(searches=searches))["responses"] if searches else []
+    logger.debug(f"Ran {len(searches) // 2} searches for {len(pending)} out of {len(queries)} queries")
+
+    ids = [
+        hit["_id"]
+        for item in pending
+        if "error" not in responses[item["hits"]]
+        for hit in responses[item["hits"]]["hits"]["hits"]
+    ]
+    papers = {paper.arxiv_id: paper for paper in await get_papers(session, ids, generation)}
+    logger.debug(f"Got {len(papers)} papers from cache and database for {len(ids)} hits")
+
+    for item in pending:
+        result = responses[item["hits"]]
+        found_facets = responses[item["facets_at"]] if "facets_at" in item else None
+        failed = next((found for found in (result, found_facets) if found and "error" in found), None)
+        if failed is not None:
+            results[item["position"]] = BatchSearchResult(error=error_reason(failed))
+            continue
+
+        if found_facets is not None:
+            item["facets"] = parse_facets(found_facets)
+            await response_cache.set(item["facets_key"], item["facets"].model_dump_json().encode())
+
+        response = build_response(result, papers, page, perpage, item["facets"])
+        await response_cache.set(item["key"], response.model_dump_json().encode())
+        results[item["position"]] = BatchSearchResult(response=response)
+
+    return results
+
+
+@search_router.post("", response_model=SearchResponse)
+async def search(
+    search_query: SearchQuery,
+    session: AsyncSessionDep,
+    elastic: AsyncElasticDep,
+    page: t.Annotated[int, Query(ge=0, description="Skip n first results")] = 0,
+    perpage: t.Annotated[int, Query(ge=1, lte=30, description="Limit results")] = 30,
+    facets: t.Annotated[
+        bool, Query(description="Count facets and papers per year, next pages can get them from /search/facets")
+    ] = True,
+    cursor: t.Annotated[
+        str | None,
+        Query(description=f"Page with next_cursor of the previous response instead of page, {FIRST_CURSOR} starts"),
+    ] = None,
+):
+    search_query = search_query.normalized()
+    generation = await get_generation(elastic)
+    key = search_key(search_query, page, perpage, facets, generation)
+    # cursors hold a point in time of their own, they are not shared between clients
+    cached = await response_cache.get(key) if cursor is None else None
+    if cached is not None:
+        logger.debug(f"Serving cached response {key}")
+        return Response(content=cached, media_type="application/json")
+
+    query = build_query(search_query)
+    index = await get_search_indices(elastic, search_query.year_start, search_query.year_end)
+
+    state = decode_cursor(cursor) if cursor not in (None, FIRST_CURSOR) else None
+    if cursor is not None:
+        page = state["page"] + 1 if state else 0
+    pit = state["pit"] if state else None
+
+    async def find_hits() -> t.Any:
+        nonlocal pit
+        if cursor is None:
+            return await elastic.search(
+                index=index,
+                sort={"_score": {"order": "desc"}},
+                query=query,
+                size=perpage,
+                from_=perpage * page,
+                track_total_hits=TRACK_TOTAL_HITS,
+            )
+
+        # deep pages cost the same as the first one, there is no from_ and no result window
+        after = {"search_after": state["after"]} if state else {}
+        if pit is None:
+            pit = (await elastic.open_point_in_time(index=index, keep_alive=config.CURSOR_KEEP_ALIVE))["id"]
+
+        try:
+            result = await elastic.search(
+                pit={"id": pit, "keep_alive": config.CURSOR_KEEP_ALIVE},
+                sort=CURSOR_SORT,
+                query=query,
+                size=perpage,
+                track_total_hits=TRACK_TOTAL_HITS,
+                **after,
+            )
+        except NotFoundError:
+            raise HTTPException(status_code=410, detail="Cursor expired, start the search again")
+
+        # elastic may hand out a new id of the same point in time with every response
+        pit = result["pit_id"]
+        return result
+
+    async def find_papers() -> t.Tuple[t.Any, t.List[ArxivPaperModel]]:
+        result = await find_hits()
+
+        ids = [hit["_id"] for hit in result["hits"]["hits"]]
+        logger.debug(f"Ids: {ids}")
+
+        # get papers from cache, rest from database
+        return result, await get_papers(session, ids, generation)
+
+    async def find_facets() -> FacetsResponse:
+        if not facets:
+            return FacetsResponse(time_to_search=0, available_facets=[], found_per_year={})
+
+        return await get_facets(elastic, index, search_query, generation)
+
+    # point in time is kept only for a cursor handed out, last page or any error closes it right away
+    keep_pit = False
+    try:
+        # facets do not depend on the page, they are counted while hits are fetched from postgres
+        (result, papers), found_facets = await asyncio.gather(find_papers(), find_facets())
+
+        # parse result, both requests run side by side
+        hits = result["hits"]["hits"]
+
+        if config.DEBUG:
+            logger.debug(f"Query: {json.dumps(query)}")
+            logger.debug(f"Result: {json.dumps(result.body)}")
+        logger.debug(f"Got {len(papers)} papers from cache and database")
+
+        next_cursor = None
+        if cursor is not None and len(hits) == perpage:
+            next_cursor = encode_cursor(pit, hits[-1]["sort"], page)
+
+        # prepare response
+        response = build_response(
+            result, {paper.arxiv_id: paper for paper in papers}, page, perpage, found_facets, next_cursor
+        )
+        keep_pit = next_cursor is not None
+    finally:
+        if pit is not None and not keep_pit:
+            await close_point_in_time(elastic, pit)
+
+    content = response.model_dump_json().encode()
+    if cursor is None:
+        await response_cache.set(key, content)
+    return Response(content=content, media_type="application/json")
@@ -0,0 +1,34 @@
+import asyncio
+import typing as t
+
+from elasticsearch import ApiError
+from fastapi import APIRouter, Query
+
+import arxivsearch.config as config
+from arxivsearch.elastic import AsyncElasticDep
+from arxivsearch.logger import get_logger
+from arxivsearch.routes.models import SuggestResponse
+from arxivsearch.suggest import author_suggestions, suggest_categories, suggest_titles
+
+logger = get_logger("suggest")
+suggest_router = APIRouter(prefix="/suggest", tags=["search"])
+
+
+@suggest_router.get("", response_model=SuggestResponse)
+async def suggest(
+    elastic: AsyncElasticDep,
+    q: t.Annotated[str, Query(min_length=1, max_length=100, description="What was typed so far")],
+    limit: t.Annotated[int, Query(ge=1, le=10, description="Limit suggestions of every kind")] = 5,
+):
+    # authors and categories are answered from memory, only titles go to elastic
+    authors = await author_suggestions.search(elastic, q, limit)
+    categories = suggest_categories(q, limit)
+
+    try:
+        titles = await asyncio.wait_for(suggest_titles(elastic, q, limit), timeout=config.SUGGEST_TIMEOUT)
+    except (ApiError, asyncio.TimeoutError) as e:
+        # indices created before title.suggest was in the mapping cannot complete titles
+        logger.debug(f"No title suggestions for {q}: {e}")
+        titles = []
+
+    return SuggestResponse(titles=titles, authors=authors, categories=categories)
@@ -0,0 +1,176 @@
+import asyncio
+import typing as t
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+
+from elasticsearch import AsyncElasticsearch
+
+import arxivsearch.config as config
+from arxivsearch.database.helpers import get_categories
+from arxivsearch.elastic import INDEX, get_generation
+from arxivsearch.logger import get_logger
+
+logger = get_logger("suggest")
+
+# prefixes of more keys than this are too slow to rank on every keystroke, their top names are kept ready.
+# any other prefix is ranked by scanning all of its keys, so no keystroke scans more than this
+MAX_SCAN = 20_000
+AUTHORS_PAGE = 10_000
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class PrefixIndex:
+    # every name is findable from its start and from its last word, so both "geoffrey h" and "hinton" work.
+    # keys are sorted, names under a prefix form a continuous range of them
+    def __init__(self, entries: t.Iterable[t.Tuple[str, int]], top: int = 10, max_scan: int = MAX_SCAN):
+        keys = []
+        self.names: t.List[str] = []
+        self.counts = array("I")
+        for name, count in entries:
+            words = normalize(name).split()
+            if not words:
+                continue
+
+            position = len(self.names)
+            self.names.append(name)
+            self.counts.append(count)
+            keys.append((" ".join(words), position))
+            if len(words) > 1:
+                keys.append((words[-1], position))
+
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = array("I", [position for _, position in keys])
+
+        # walking down from the empty prefix, only into prefixes which are still too large to scan.
+        # every prefix one character longer is a continuous range inside the range of the shorter one
+        self.ranked: t.Dict[str, t.List[int]] = {}
+        stack = [("", 0, len(self.keys))]
+        while stack:
+            prefix, start, end = stack.pop()
+            depth = len(prefix) + 1
+            # keys equal to the prefix itself sort first, they are not under any longer prefix
+            while start < end and len(self.keys[start]) < depth:
+                start += 1
+
+            while start < end:
+                child = self.keys[start][:depth]
+                child_end = bisect_left(self.keys, child + "\uffff", start, end)
+                if child_end - start > max_scan:
+                    self.ranked[child] = self.rank(start, child_end, top)
+                    stack.append((child, start, child_end))
+                start = child_end
+
+    def rank(self, start: int, end: int, limit: int) -> t.List[int]:
+        # positions of names, with most papers first and every name only once
+        positions = set(self.positions[start:end])
+        return nlargest(limit, positions, key=lambda position: self.counts[position])
+
+    def search(self, prefix: str, limit: int) -> t.List[str]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        positions = self.ranked.get(prefix)
+        if positions is None:
+            start = bisect_left(self.keys, prefix)
+            positions = self.rank(start, bisect_left(self.keys, prefix + "\uffff", start), limit)
+
+        return [self.names[position] for position in positions[:limit]]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+async def read_authors(elastic: AsyncElasticsearch) -> t.List[t.Tuple[str, int]]:
+    # every distinct value of the authors keyword with the number of its papers, page by page
+    authors, after = [], {}
+    while True:
+        result = await elastic.search(
+            index=INDEX,
+            size=0,
+            aggs={
+                "authors": {
+                    "composite": {"size": AUTHORS_PAGE, "sources": [{"name": {"terms": {"field": "authors"}}}], **after}
+                }
+            },
+        )
+        aggregation = result["aggregations"]["authors"]
+        authors.extend(
+            (bucket["key"]["name"], bucket["doc_count"])
+            for bucket in aggregation["buckets"]
+            if bucket["doc_count"] >= config.SUGGEST_AUTHOR_MIN_PAPERS
+        )
+
+        if "after_key" not in aggregation or not aggregation["buckets"]:
+            return authors
+
+        after = {"after": aggregation["after_key"]}
+
+
+class AuthorSuggestions:
+    # index is rebuilt in the background whenever data is reloaded, the previous one keeps answering meanwhile
+    def __init__(self):
+        self.index: t.Optional[PrefixIndex] = None
+        self.generation: t.Optional[int] = None
+        self.task: t.Optional[asyncio.Task] = None
+
+    async def build(self, elastic: AsyncElasticsearch, generation: t.Optional[int]):
+        try:
+            authors = await read_authors(elastic)
+            # sorting millions of keys would stall every other request on the loop
+            self.index = await asyncio.to_thread(PrefixIndex, authors)
+            self.generation = generation
+            logger.info(f"Built author suggestions from {len(self.index)} authors")
+        except Exception as e:
+            logger.error(f"Error while building author suggestions: {e}")
+
+    async def search(self, elastic: AsyncElasticsearch, prefix: str, limit: int) -> t.List[str]:
+        generation = await get_generation(elastic)
+        stale = self.index is None or generation != self.generation
+        if stale and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.build(elastic, generation))
+
+        return self.index.search(prefix, limit) if self.index else []
+
+
+author_suggestions = AuthorSuggestions()
+
+
+def suggest_categories(prefix: str, limit: int) -> t.List[t.Dict[str, str]]:
+    # there are only about 150 categories, checking every one of them is fast enough
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+
+    found = []
+    for category_id, category in get_categories().items():
+        candidates = [{"id": category_id, "name": category["name"]}, *category["subcategories"].values()]
+        for candidate in candidates:
+            words = normalize(candidate["name"]).split()
+            if candidate["id"].lower().startswith(prefix) or any(
+                " ".join(words[i:]).startswith(prefix) for i in range(len(words))
+            ):
+                found.append(candidate)
+
+    return found[:limit]
+
+
+async def suggest_titles(elastic: AsyncElasticsearch, prefix: str, limit: int) -> t.List[str]:
+    # completion suggester keeps its structure in memory, it does not search the index at all
+    result = await elastic.search(
+        index=INDEX,
+        source=False,
+        suggest={
+            "titles": {
+                "prefix": prefix,
+                "completion": {"field": "title.suggest", "size": limit, "skip_duplicates": True},
+            }
+        },
+    )
+
+    return [option["text"] for option in result["suggest"]["titles"][0]["options"]]
@@ -0,0 +1,132 @@
+import bisect
+import json
+import os
+import typing as t
+from pathlib import Path
+from threading import Lock
+
+from ingest.ranges import ByteRange
+
+
+class Intervals:
+    # sorted list of disjoint [start, end) byte ranges, neighbours are merged as they come
+    def __init__(self, ranges: t.Iterable[t.Sequence[int]] = ()):
+        self.ranges: t.List[ByteRange] = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def add(self, start: int, end: int):
+        if start >= end:
+            return
+
+        i = bisect.bisect_left(self.ranges, (start, end))
+        # merge with everything that touches or overlaps new range
+        while i > 0 and self.ranges[i - 1][1] >= start:
+            i -= 1
+        j = i
+        while j < len(self.ranges) and self.ranges[j][0] <= end:
+            start, end = min(start, self.ranges[j][0]), max(end, self.ranges[j][1])
+            j += 1
+
+        self.ranges[i:j] = [(start, end)]
+
+    def covers(self, byte_range: ByteRange) -> bool:
+        return not self.gaps(byte_range)
+
+    def gaps(self, byte_range: ByteRange) -> t.List[ByteRange]:
+        # parts of byte_range which are not covered yet
+        position, end = byte_range
+        gaps = []
+        for covered_start, covered_end in self.ranges:
+            if covered_end <= position:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > position:
+                gaps.append((position, covered_start))
+            position = max(position, covered_end)
+
+        if position < end:
+            gaps.append((position, end))
+
+        return gaps
+
+    def watermark(self, start: int = 0) -> int:
+        # everything in [start, watermark) is covered
+        for covered_start, covered_end in self.ranges:
+            if covered_start <= start < covered_end:
+                return covered_end
+
+        return start
+
+    def total(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+    def to_list(self) -> t.List[t.List[int]]:
+        return [list(byte_range) for byte_range in self.ranges]
+
+
+class Manifest:
+    # durable progress of a setup run, every update is written to disk before returning
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = Lock()
+        self.data: t.Dict[str, t.Any] = {}
+        self.load()
+
+    def load(self):
+        if self.path.exists():
+            with open(self.path, "r") as file:
+                self.data = json.load(file)
+
+    def save(self):
+        # write next to it and swap, so crash mid-write never leaves half a manifest
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump(self.data, file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, self.path)
+
+    @staticmethod
+    def describe(source: Path) -> t.Dict[str, t.Any]:
+        # dump may be already gone when only preprocessed file is being loaded
+        if not source.exists():
+            return {"path": str(source.resolve())}
+
+        stat = source.stat()
+        return {"path": str(source.resolve()), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def matches(self, source: Path) -> bool:
+        # resuming only makes sense for the very same dump
+        return self.data.get("source") == self.describe(source) and not self.data.get("finished", False)
+
+    def reset(self, source: Path, **values):
+        with self.lock:
+            self.data = {"source": self.describe(source), "finished": False, "stages": {}, **values}
+            self.save()
+
+    def stage(self, name: str) -> t.Dict[str, t.Any]:
+        return self.data.setdefault("stages", {}).setdefault(name, {"done": False, "completed": []})
+
+    def completed(self, name: str) -> Intervals:
+        return Intervals(self.stage(name)["completed"])
+
+    def is_done(self, name: str) -> bool:
+        return self.stage(name)["done"]
+
+    def update(self, name: str, **values):
+        with self.lock:
+            self.stage(name).update(values)
+            self.save()
+
+    def reset_stage(self, name: str):
+        with self.lock:
+            self.data.setdefault("stages", {})[name] = {"done": False, "completed": []}
+            self.save()
+
+    def finish(self):
+        with self.lock:
+            self.data["finished"] = True
+            self.save()
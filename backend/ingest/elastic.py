@@ -0,0 +1,390 @@
+import json
+import pickle
+import time
+import typing as t
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from logging import Logger
+from pathlib import Path
+from threading import Lock, Thread
+
+from elasticsearch import ApiError, Elasticsearch
+from tqdm import tqdm
+
+from ingest.checkpoint import Intervals, Manifest
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.partitions import Partitioning, target_indices
+from ingest.ranges import ByteRange
+from ingest.readers import READERS, read_in_parallel, todo_spans
+from ingest.records import ProcessedFile, open_processed
+from partition_names import parse_partition
+
+# how long single bulk request should take, chunk size is adjusted to stay around it
+TARGET_LATENCY = 2.0
+MIN_CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 20_000
+MAX_RETRIES = 5
+
+# statuses worth retrying, everything else (mapping errors etc.) will fail the same way again
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+def read_actions(
+    path: Path,
+    index: str,
+    pos: int = 0,
+    completed: t.Optional[Intervals] = None,
+    partitioning: t.Optional[Partitioning] = None,
+    readers: int = READERS,
+    monitor: t.Optional[Monitor] = None,
+) -> t.Iterator[t.Tuple[ByteRange, dict]]:
+    # every action comes with the part of the file it was read from, for checkpointing.
+    # records are parsed by reader processes, spans of different readers come interleaved
+    completed = completed or Intervals()
+    with open_processed(path) as source:
+        spans = todo_spans(source, completed, readers)
+        extent, unit = source.extent, source.unit
+
+    chunks = read_in_parallel(path, spans, readers, monitor=monitor, stage="elastic-reader")
+    with tqdm(total=extent, initial=completed.total(), unit=unit, unit_scale=True, position=pos) as bar:
+        for data in chunks:
+            for span, record in pickle.loads(data):
+                target = partitioning.route(index, record) if partitioning else index
+                yield span, {"_id": record["id"], "_index": target, "_source": record}
+                bar.update(span[1] - span[0])
+
+
+@contextmanager
+def bulk_load_settings(elastic: Elasticsearch, indices: t.List[str], logger: Logger):
+    # refreshing and replicating segments that will be merged anyway is a waste during the load
+    index = ",".join(indices)
+    previous = {}
+    for name, settings in elastic.indices.get_settings(index=index).items():
+        values = settings["settings"]["index"]
+        previous[name] = values.get("refresh_interval"), values.get("number_of_replicas")
+
+    logger.debug(f"Disabling refresh and replicas on {index} for the load")
+    elastic.indices.put_settings(index=index, settings={"refresh_interval": "-1", "number_of_replicas": 0})
+
+    try:
+        yield
+
+    finally:
+        # None resets refresh_interval to its default
+        for name, (refresh_interval, replicas) in previous.items():
+            logger.debug(f"Restoring refresh_interval={refresh_interval} and number_of_replicas={replicas} on {name}")
+            elastic.indices.put_settings(
+                index=name, settings={"refresh_interval": refresh_interval, "number_of_replicas": replicas}
+            )
+
+    elastic.indices.refresh(index=index)
+
+    logger.debug(f"Force merging {index}")
+    elastic.options(request_timeout=3600).indices.forcemerge(index=index, max_num_segments=1)
+
+
+class ChunkSizer:
+    # AIMD-ish, grows slowly while bulks are fast, halves on rejections or slow bulks
+    def __init__(self, size: int = 1000):
+        self.size = size
+        self.lock = Lock()
+
+    def observe(self, latency: float, rejected: bool):
+        with self.lock:
+            if rejected or latency > TARGET_LATENCY:
+                self.size = max(MIN_CHUNK_SIZE, self.size // 2)
+            elif latency < TARGET_LATENCY / 2:
+                self.size = min(MAX_CHUNK_SIZE, int(self.size * 1.25))
+
+
+class BulkReport:
+    def __init__(self):
+        self.indexed = 0
+        self.retried = 0
+        self.failed: t.List[t.Tuple[dict, t.Any]] = []
+        self.lock = Lock()
+
+    def __str__(self) -> str:
+        return f"indexed {self.indexed}, retried {self.retried}, failed {len(self.failed)}"
+
+
+def contiguous(spans: t.Iterable[ByteRange]) -> t.List[ByteRange]:
+    # chunk can take actions of several readers, only the parts that really follow each other are merged
+    merged: t.List[ByteRange] = []
+    for start, end in spans:
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+class BulkLoader:
+    def __init__(
+        self,
+        elastic: Elasticsearch,
+        logger: Logger,
+        threads: int = 4,
+        manifest: t.Optional[Manifest] = None,
+        metrics: t.Optional[WorkerMetrics] = None,
+        source: t.Optional[ProcessedFile] = None,
+    ):
+        self.elastic = elastic
+        self.logger = logger
+        self.threads = threads
+        self.sizer = ChunkSizer()
+        self.report = BulkReport()
+        self.manifest = manifest
+        self.completed = manifest.completed("elastic") if manifest else Intervals()
+        # source is only needed to tell how many bytes of it every chunk was
+        self.metrics = metrics
+        self.source = source
+        self.counted = (0, 0)
+        self.errors: t.List[Exception] = []
+
+    def send(self, actions: t.List[dict]) -> t.Tuple[t.List[dict], bool]:
+        # returns actions that should be retried and whether elastic pushed back
+        operations = []
+        for action in actions:
+            operations.append({"index": {"_index": action["_index"], "_id": action["_id"]}})
+            operations.append(action["_source"])
+
+        start = time.perf_counter()
+        try:
+            response = self.elastic.bulk(operations=operations)
+        except ApiError as e:
+            if e.status_code not in RETRYABLE_STATUSES:
+                raise
+            self.sizer.observe(time.perf_counter() - start, True)
+            return actions, True
+
+        retry, rejected, indexed = [], False, 0
+        for action, item in zip(actions, response["items"]):
+            result = item["index"]
+            if result["status"] < 300:
+                indexed += 1
+                continue
+
+            if result["status"] in RETRYABLE_STATUSES:
+                rejected = True
+                retry.append(action)
+            else:
+                with self.report.lock:
+                    self.report.failed.append((action, result.get("error")))
+
+        self.sizer.observe(time.perf_counter() - start, rejected)
+        with self.report.lock:
+            self.report.indexed += indexed
+
+        return retry, rejected
+
+    def send_with_retries(self, actions: t.List[dict]):
+        for attempt in range(MAX_RETRIES + 1):
+            sent = len(actions)
+            actions, _ = self.send(actions)
+            if not actions:
+                return
+
+            with self.report.lock:
+                self.report.retried += len(actions)
+
+            self.logger.debug(f"Retrying {len(actions)} out of {sent} documents, attempt {attempt + 1}")
+            time.sleep(min(2**attempt, 30))
+
+        with self.report.lock:
+            self.report.failed.extend((action, "too many retries") for action in actions)
+
+    def checkpoint(self, chunk: t.List[t.Tuple[ByteRange, dict]]):
+        # failed documents are in the report, retrying them on resume would fail the same way
+        spans = contiguous(span for span, _ in chunk)
+        with self.report.lock:
+            for span in spans:
+                self.completed.add(*span)
+            if self.manifest:
+                self.manifest.update("elastic", completed=self.completed.to_list())
+
+            if self.metrics:
+                # report is shared by all threads, whatever it gained since the last checkpoint is counted now
+                indexed, failed = self.report.indexed, len(self.report.failed)
+                self.metrics.add(
+                    records=indexed - self.counted[0],
+                    errors=failed - self.counted[1],
+                    bytes=sum(self.source.nbytes(span) for span in spans) if self.source else 0,
+                )
+                self.counted = (indexed, failed)
+
+    def worker(self, actions: t.Iterator[t.Tuple[ByteRange, dict]], lock: Lock):
+        while True:
+            with lock:
+                try:
+                    chunk = list(islice(actions, self.sizer.size))
+                except Exception as e:
+                    # actions cannot be read any further, other threads get nothing more and stop as well
+                    self.errors.append(e)
+                    return
+
+            if not chunk:
+                return
+
+            try:
+                self.send_with_retries([action for _, action in chunk])
+            except Exception as e:
+                # dont let one broken chunk kill the thread, rest of the data is still fine.
+                # chunk goes to the failed report and is checkpointed like any other, otherwise the stage
+                # would never be done and every resumed run would replay it
+                self.logger.error(f"Error while inserting into elastic: {e}")
+                with self.report.lock:
+                    self.report.failed.extend((action, str(e)) for _, action in chunk)
+
+            self.checkpoint(chunk)
+
+    def load(self, actions: t.Iterator[t.Tuple[ByteRange, dict]]) -> BulkReport:
+        # actions are pulled lazily by all threads, nothing is materialized besides the chunk in flight
+        lock = Lock()
+        threads = [Thread(target=self.worker, args=(actions, lock)) for _ in range(self.threads)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        return self.report
+
+
+def write_failed(path: Path, report: BulkReport):
+    with open(path, "w") as file:
+        for action, error in report.failed:
+            file.write(json.dumps({"id": action["_id"], "error": error}) + "\n")
+
+
+def bulk_load_elastic(
+    elastic: Elasticsearch,
+    logger: Logger,
+    path: Path,
+    index: str,
+    tune_index: bool = True,
+    pos: int = 0,
+    manifest: t.Optional[Manifest] = None,
+    partitioning: t.Optional[Partitioning] = None,
+    readers: int = READERS,
+    monitor: t.Optional[Monitor] = None,
+) -> BulkReport:
+    monitor = monitor or Monitor()
+    with open_processed(path) as source:
+        loader = BulkLoader(elastic, logger, manifest=manifest, metrics=monitor.worker("elastic"), source=source)
+        actions = read_actions(path, index, pos, loader.completed, partitioning, readers=readers, monitor=monitor)
+
+        if tune_index:
+            with bulk_load_settings(elastic, target_indices(index, partitioning), logger):
+                report = loader.load(actions)
+        else:
+            report = loader.load(actions)
+        extent = source.extent
+
+    logger.info(f"Finished loading into elastic: {report}, last chunk size {loader.sizer.size}")
+    if report.failed:
+        failed_path = path.with_name(f"{path.stem}-elastic-failed.jsonl")
+        write_failed(failed_path, report)
+        logger.error(f"{len(report.failed)} documents could not be inserted into elastic, see {failed_path}")
+
+    if loader.errors:
+        logger.error(f"Reading {path} failed, data in elastic is incomplete: {loader.errors[0]}")
+
+    if manifest and loader.completed.covers((0, extent)):
+        manifest.update("elastic", done=True)
+
+    return report
+
+
+def new_index_name(alias: str) -> str:
+    return f"{alias}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def get_aliased_indices(elastic: Elasticsearch, alias: str) -> t.List[str]:
+    if not elastic.indices.exists_alias(name=alias):
+        return []
+
+    return list(elastic.indices.get_alias(name=alias).keys())
+
+
+def validate_index(elastic: Elasticsearch, logger: Logger, index: str, expected: int) -> bool:
+    elastic.indices.refresh(index=index)
+    count = elastic.count(index=index)["count"]
+    if count != expected:
+        logger.error(f"Index {index} has {count} documents, expected {expected}")
+        return False
+
+    logger.debug(f"Index {index} has all {count} documents")
+    return True
+
+
+def swap_alias(elastic: Elasticsearch, logger: Logger, alias: str, indices: t.List[str]):
+    # partitioned version is a group of indices, all of them go behind the alias at once
+    actions = [{"remove": {"index": old, "alias": alias}} for old in get_aliased_indices(elastic, alias)]
+
+    # index from before versioning has the same name as the alias, it has to go in the same atomic call
+    if elastic.indices.exists(index=alias) and not actions:
+        logger.debug(f"Removing unversioned index {alias}")
+        actions.append({"remove_index": {"index": alias}})
+
+    actions.append({"add": {"indices": indices, "alias": alias}})
+    elastic.indices.update_aliases(actions=actions)
+    logger.info(f"Alias {alias} now points to {', '.join(indices)}")
+
+
+def version_of(index: str) -> str:
+    # partitions of one version share their base name
+    parsed = parse_partition(index)
+    return parsed[0] if parsed else index
+
+
+def collect_old_indices(elastic: Elasticsearch, logger: Logger, alias: str, keep: int = 1):
+    # versions sort by their timestamp, newest `keep` ones not behind the alias are left for a rollback
+    live = {version_of(index) for index in get_aliased_indices(elastic, alias)}
+    indices = [index for index in elastic.indices.get(index=f"{alias}-*").keys() if version_of(index) not in live]
+    versions = sorted({version_of(index) for index in indices})
+
+    old = set(versions[: max(len(versions) - keep, 0)])
+    for index in sorted(indices):
+        if version_of(index) in old:
+            logger.debug(f"Deleting old index version {index}")
+            elastic.indices.delete(index=index)
+
+
+def freeze_partitions(elastic: Elasticsearch, logger: Logger, indices: t.List[str], before: int):
+    # years that are over only change when an old paper gets a new version, they are merged into a single
+    # segment and blocked for writes, updates lift the block for their duration
+    for index in indices:
+        parsed = parse_partition(index)
+        if parsed is None or parsed[1][1] is None or parsed[1][1] >= before:
+            continue
+
+        logger.debug(f"Freezing {index}")
+        elastic.options(request_timeout=3600).indices.forcemerge(index=index, max_num_segments=1)
+        elastic.indices.put_settings(index=index, settings={"index.blocks.write": True})
+
+
+def mark_loaded(elastic: Elasticsearch, logger: Logger, indices: t.List[str]):
+    # web app keeps papers and responses cached until the generation in _meta of its indices changes
+    generation = time.time_ns()
+    logger.debug(f"Marking {', '.join(indices)} as loaded, generation {generation}")
+    elastic.indices.put_mapping(index=",".join(indices), meta={"generation": generation})
+
+
+@contextmanager
+def writable(elastic: Elasticsearch, logger: Logger, indices: t.List[str]):
+    # settings come back as strings
+    frozen = [
+        name
+        for name, settings in elastic.indices.get_settings(index=",".join(indices)).items()
+        if settings["settings"]["index"].get("blocks", {}).get("write") == "true"
+    ]
+    for index in frozen:
+        logger.debug(f"Lifting write block of {index}")
+        elastic.indices.put_settings(index=index, settings={"index.blocks.write": False})
+
+    try:
+        yield
+
+    finally:
+        for index in frozen:
+            elastic.indices.put_settings(index=index, settings={"index.blocks.write": True})
@@ -0,0 +1,330 @@
+import pickle
+import time
+import typing as t
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from itertools import batched
+from logging import Logger
+from multiprocessing import Process, Queue, Value
+from multiprocessing.sharedctypes import Synchronized
+from pathlib import Path
+from queue import Empty, Full
+from threading import Thread
+
+import psycopg
+from elasticsearch import Elasticsearch
+from sqlalchemy import Engine, Table
+from tqdm import tqdm
+
+from ingest.checkpoint import Intervals, Manifest
+from ingest.elastic import BulkLoader, bulk_load_settings, write_failed
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.partitions import Partitioning, target_indices
+from ingest.postgres import (
+    COLUMN_TYPES,
+    copy_statement,
+    drop_indexes,
+    get_conninfo,
+    to_row,
+)
+from ingest.readers import READERS, read_in_parallel, todo_spans
+from ingest.records import RecordFile, open_processed
+from ingest.scheduler import PipelineError
+
+FANOUT_CHUNK_SIZE = 2_000  # records parsed at once by a reader and handed to every sink
+SINK_BUFFER = 8  # in chunks, slow sink holds the reader back only once its own buffer is full
+
+
+class Sink(Process, ABC):
+    # consumes pickled chunks of (span, record) from its own buffer, until None comes
+    stage: str
+
+    def __init__(
+        self,
+        buffer: Queue,
+        done_queue: Queue,
+        progress: Synchronized,
+        *args,
+        completed: t.Optional[Intervals] = None,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.buffer = buffer
+        self.done_queue = done_queue
+        self.progress = progress
+        self.completed = completed or Intervals()
+        self.metrics = metrics or WorkerMetrics(self.stage)
+
+    def setup(self):
+        pass
+
+    @abstractmethod
+    def write(self, records: t.List[dict]): ...
+
+    def teardown(self):
+        pass
+
+    def run(self):
+        self.setup()
+        for data in iter(lambda: self.metrics.get(self.buffer), None):
+            chunk = pickle.loads(data)
+            # chunk may be read only because the other sink is behind, this one could have it already
+            records = [record for span, record in chunk if not self.completed.covers(span)]
+            if records:
+                self.write(records)
+            self.metrics.add(records=len(records), bytes=len(data))
+
+            # manifest is owned by the parent, it only gets to know what is safely stored
+            self.done_queue.put((self.stage, (chunk[0][0][0], chunk[-1][0][1])))
+            with self.progress.get_lock():
+                self.progress.value += len(chunk)
+
+        self.teardown()
+
+
+class ElasticSink(Sink):
+    stage = "elastic"
+
+    def __init__(
+        self,
+        nodes: t.List[t.Any],
+        index: str,
+        logger: Logger,
+        failed_path: Path,
+        *args,
+        partitioning: t.Optional[Partitioning] = None,
+        client_options: t.Optional[t.Dict[str, t.Any]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.nodes = nodes
+        self.client_options = client_options or {}
+        self.index = index
+        self.logger = logger
+        self.failed_path = failed_path
+        self.partitioning = partitioning
+
+    def target(self, record: dict) -> str:
+        return self.partitioning.route(self.index, record) if self.partitioning else self.index
+
+    def setup(self):
+        # client of the parent is not safe to use after fork, its connections are shared
+        self.loader = BulkLoader(Elasticsearch(hosts=self.nodes, **self.client_options), self.logger)
+
+    def write(self, records: t.List[dict]):
+        failed = len(self.loader.report.failed)
+        actions = [{"_id": record["id"], "_index": self.target(record), "_source": record} for record in records]
+        for part in batched(actions, self.loader.sizer.size):
+            try:
+                self.loader.send_with_retries(list(part))
+            except Exception as e:
+                # same as threaded loader, part goes to the failed report and the rest of the data goes on
+                self.logger.error(f"Error while inserting into elastic: {e}")
+                with self.loader.report.lock:
+                    self.loader.report.failed.extend((action, str(e)) for action in part)
+        self.metrics.add(errors=len(self.loader.report.failed) - failed)
+
+    def teardown(self):
+        self.logger.info(f"Elastic sink finished: {self.loader.report}, last chunk size {self.loader.sizer.size}")
+        if self.loader.report.failed:
+            write_failed(self.failed_path, self.loader.report)
+            self.logger.error(
+                f"{len(self.loader.report.failed)} documents could not be inserted, see {self.failed_path}"
+            )
+
+
+class PostgresSink(Sink):
+    stage = "postgres"
+
+    def __init__(self, conninfo: str, table: str, *args, replace: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conninfo = conninfo
+        self.table = table
+        self.replace = replace
+
+    def setup(self):
+        self.connection = psycopg.connect(self.conninfo, autocommit=True)
+
+    def write(self, records: t.List[dict]):
+        # every chunk is a separate transaction, crash loses at most the one in flight
+        with self.connection.transaction(), self.connection.cursor() as cursor:
+            if self.replace:
+                # arxiv_id is not unique in the table, so older rows have to go before inserting new ones
+                ids = [record["id"] for record in records]
+                cursor.execute(f"DELETE FROM {self.table} WHERE arxiv_id = ANY(%s)", (ids,))
+
+            with cursor.copy(copy_statement(self.table)) as copy:
+                copy.set_types(COLUMN_TYPES)
+                for record in records:
+                    copy.write_row(to_row(record))
+
+    def teardown(self):
+        self.connection.close()
+
+
+def put_while_alive(sink: Sink, data: t.Optional[bytes], metrics: WorkerMetrics) -> bool:
+    # blocks as long as the sink is alive, crashed one would never make room in its buffer
+    while True:
+        try:
+            metrics.put(sink.buffer, data, timeout=1)
+            return True
+        except Full:
+            if not sink.is_alive():
+                return False
+
+
+def feed(chunks: t.Iterator[bytes], sinks: t.List[Sink], metrics: WorkerMetrics, errors: t.List[Exception]):
+    # records are parsed and pickled by the readers, every sink gets the very same bytes
+    alive = list(sinks)
+    try:
+        for data in chunks:
+            alive = [sink for sink in alive if put_while_alive(sink, data, metrics)]
+            if not alive:
+                return
+    except Exception as e:
+        # raised by the parent once sinks are done, a thread has nobody to raise it to
+        errors.append(e)
+    finally:
+        # sinks wait for more data until None comes, whatever happened here
+        for sink in alive:
+            put_while_alive(sink, None, metrics)
+
+
+def fan_out_into_bases(
+    engine: Engine,
+    elastic: Elasticsearch,
+    logger: Logger,
+    path: Path,
+    index: str,
+    table: Table,
+    stages: t.Sequence[str] = ("elastic", "postgres"),
+    replace: bool = False,
+    tune_index: bool = False,
+    defer_indexes: bool = False,
+    manifest: t.Optional[Manifest] = None,
+    monitor: t.Optional[Monitor] = None,
+    partitioning: t.Optional[Partitioning] = None,
+    client_options: t.Optional[t.Dict[str, t.Any]] = None,
+    readers: int = READERS,
+):
+    monitor = monitor or Monitor()
+    done_queue = Queue()
+    completed = {stage: manifest.completed(stage) if manifest else Intervals() for stage in stages}
+
+    sinks: t.List[Sink] = []
+    if "elastic" in stages:
+        nodes = [node.config for node in elastic.transport.node_pool.all()]
+        failed_path = path.with_name(f"{path.stem}-elastic-failed.jsonl")
+        buffer = Queue(SINK_BUFFER)
+        sinks.append(
+            ElasticSink(
+                nodes,
+                index,
+                logger,
+                failed_path,
+                buffer,
+                done_queue,
+                Value("Q", 0),
+                completed=completed["elastic"],
+                metrics=monitor.worker("elastic", buffer),
+                partitioning=partitioning,
+                client_options=client_options,
+            )
+        )
+
+    # resumed run could have committed chunks that never made it into the manifest, so every chunk replaces
+    # its rows. arxiv_id index is kept for that, otherwise each of these deletes would scan the whole table
+    resumed = "postgres" in stages and bool(manifest and manifest.stage("postgres").get("started"))
+    if manifest and "postgres" in stages:
+        manifest.update("postgres", started=True)
+
+    if "postgres" in stages:
+        buffer = Queue(SINK_BUFFER)
+        sinks.append(
+            PostgresSink(
+                get_conninfo(engine),
+                table.name,
+                buffer,
+                done_queue,
+                Value("Q", 0),
+                replace=replace or resumed,
+                completed=completed["postgres"],
+                metrics=monitor.worker("postgres", buffer),
+            )
+        )
+
+    with open_processed(path) as source:
+        # only parts that at least one of the sinks still misses are read
+        extent = source.extent
+        todo = Intervals(gap for sink in sinks for gap in sink.completed.gaps((0, extent)))
+        spans = todo_spans(source, Intervals(todo.gaps((0, extent))), readers)
+        # counting is free only when positions are records
+        total = sum(source.count(span) for span in todo.ranges) if source.unit == RecordFile.unit else None
+
+    def record_done():
+        while True:
+            try:
+                stage, span = done_queue.get_nowait()
+            except Empty:
+                break
+
+            completed[stage].add(*span)
+            if manifest:
+                manifest.update(stage, completed=completed[stage].to_list())
+
+    keep = ["arxiv_id"] if resumed else []
+    indexes = drop_indexes(engine, table, keep) if defer_indexes and "postgres" in stages else []
+    settings = (
+        bulk_load_settings(elastic, target_indices(index, partitioning), logger)
+        if tune_index and "elastic" in stages
+        else nullcontext()
+    )
+
+    with settings:
+        logger.debug(f"Fanning out {path} into {', '.join(stages)}")
+        errors: t.List[Exception] = []
+        # feeder only hands pickled chunks over, parsing is spread over the reader processes
+        chunks = read_in_parallel(path, spans, readers, FANOUT_CHUNK_SIZE, monitor=monitor, stage="feed")
+        feeder = Thread(target=feed, args=(chunks, sinks, monitor.worker("feed"), errors))
+        [sink.start() for sink in sinks]
+        feeder.start()
+
+        # every sink goes at its own pace, bars show how fast each of them is
+        bars = [tqdm(total=total, desc=sink.stage, unit="papers", position=i) for i, sink in enumerate(sinks)]
+        start, finished = time.monotonic(), {}
+        while len(finished) < len(sinks):
+            record_done()
+            for sink, bar in zip(sinks, bars):
+                bar.update(sink.progress.value - bar.n)
+                if not sink.is_alive() and sink.stage not in finished:
+                    finished[sink.stage] = time.monotonic() - start
+            time.sleep(0.5)
+
+        feeder.join()
+        # readers are still there when every sink died before the end
+        chunks.close()
+        [sink.join() for sink in sinks]
+        record_done()
+        [bar.close() for bar in bars]
+
+    for sink in sinks:
+        elapsed = max(finished[sink.stage], 1e-9)
+        logger.info(
+            f"{sink.stage} sink took {sink.progress.value} papers in {elapsed:.1f}s "
+            + f"({sink.progress.value / elapsed:.0f} papers/s)"
+        )
+
+        if sink.exitcode != 0:
+            # nobody is going to read what is left in the buffer, dont wait for it on exit
+            sink.buffer.cancel_join_thread()
+            logger.error(f"{sink.stage} sink died with exit code {sink.exitcode}, data in {sink.stage} is incomplete")
+        elif manifest and completed[sink.stage].covers((0, extent)):
+            manifest.update(sink.stage, done=True)
+
+    for table_index in indexes:
+        logger.debug(f"Creating index {table_index.name}")
+        table_index.create(engine)
+
+    if errors:
+        raise PipelineError(f"Reading {path} failed, sinks got only part of it: {errors[0]}") from errors[0]
@@ -0,0 +1,166 @@
+import json
+import os
+import resource
+import time
+import typing as t
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Array, Queue
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+METRICS_INTERVAL = 5.0  # in seconds, how often all stages are sampled and written down
+# bytes are the dump for reader and processors, written output for writer, pickled chunks for readers of
+# the processed file and sinks of the fan-out, and the processed file for every other loader
+FIELDS = ("records", "bytes", "errors", "blocked_put", "blocked_get", "rss")
+INDEX = {name: i for i, name in enumerate(FIELDS)}
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # without procfs there is only the peak, which is in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class WorkerMetrics:
+    # counters of a single process in shared memory, only that process writes them and monitor in
+    # the parent reads them, so there is no lock
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.values = Array("d", len(FIELDS), lock=False)
+
+    def add(self, **amounts: float):
+        for name, amount in amounts.items():
+            self.values[INDEX[name]] += amount
+        self.values[INDEX["rss"]] = current_rss()
+
+    def put(self, queue: Queue, item: t.Any, **kwargs):
+        start = time.perf_counter()
+        try:
+            queue.put(item, **kwargs)
+        finally:
+            self.values[INDEX["blocked_put"]] += time.perf_counter() - start
+
+    def get(self, queue: Queue, **kwargs) -> t.Any:
+        start = time.perf_counter()
+        try:
+            return queue.get(**kwargs)
+        finally:
+            self.values[INDEX["blocked_get"]] += time.perf_counter() - start
+
+    def snapshot(self) -> t.Dict[str, float]:
+        return dict(zip(FIELDS, self.values))
+
+
+def queue_depth(queue: Queue) -> t.Optional[int]:
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        # qsize is not there on macOS
+        return None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.monitor.latest).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        pass
+
+
+class Monitor:
+    # collects metrics of all stages in the parent process, writes them as json lines and serves the latest
+    # sample on localhost. without path and port it only hands out metrics, nobody reads them
+    def __init__(self, path: t.Optional[Path] = None, port: t.Optional[int] = None, interval: float = METRICS_INTERVAL):
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.workers: t.List[WorkerMetrics] = []
+        self.queues: t.Dict[str, Queue] = {}
+        self.lock = Lock()
+        self.stopped = Event()
+        self.latest: t.Dict[str, t.Any] = {}
+        self.previous: t.Dict[str, t.Dict[str, float]] = {}
+        self.last_sample = time.monotonic()
+
+    def worker(self, stage: str, queue: t.Optional[Queue] = None) -> WorkerMetrics:
+        # has to be called before the worker is started, shared memory is inherited on fork.
+        # queue is where the stage takes its work from
+        metrics = WorkerMetrics(stage)
+        with self.lock:
+            self.workers.append(metrics)
+            if queue is not None:
+                self.queues[stage] = queue
+
+        return metrics
+
+    def sample(self) -> t.Dict[str, t.Any]:
+        now = time.monotonic()
+        elapsed = max(now - self.last_sample, 1e-9)
+        with self.lock:
+            workers, queues = list(self.workers), dict(self.queues)
+
+        stages: t.Dict[str, t.Dict[str, t.Any]] = {}
+        for metrics in workers:
+            values = metrics.snapshot()
+            stage = stages.setdefault(metrics.stage, {"workers": 0, **{name: 0.0 for name in FIELDS}, "max_rss": 0.0})
+            stage["workers"] += 1
+            stage["max_rss"] = max(stage["max_rss"], values["rss"])
+            for name in FIELDS:
+                stage[name] += values[name]
+
+        for name, stage in stages.items():
+            previous = self.previous.get(name, {})
+            stage["records_per_s"] = (stage["records"] - previous.get("records", 0)) / elapsed
+            stage["bytes_per_s"] = (stage["bytes"] - previous.get("bytes", 0)) / elapsed
+            stage["queue"] = queue_depth(queues[name]) if name in queues else None
+
+        self.previous = {name: {"records": stage["records"], "bytes": stage["bytes"]} for name, stage in stages.items()}
+        self.last_sample = now
+        self.latest = {"time": time.time(), "interval": elapsed, "stages": stages}
+        return self.latest
+
+    def write(self, snapshot: t.Dict[str, t.Any]):
+        if self.path is None:
+            return
+
+        with open(self.path, "a") as file:
+            file.write(json.dumps(snapshot) + "\n")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write(self.sample())
+
+    def __enter__(self) -> "Monitor":
+        if self.path is None and self.port is None:
+            return self
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+            self.server.monitor = self
+            Thread(target=self.server.serve_forever, daemon=True).start()
+
+        return self
+
+    def __exit__(self, *args):
+        if self.path is None and self.port is None:
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        # last sample covers whatever happened since the previous one
+        self.write(self.sample())
+        if self.port is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,56 @@
+import typing as t
+from bisect import bisect_right
+from datetime import date
+
+from partition_names import YearRange, parse_partition, partition_name
+
+FIRST_YEAR = 1986  # SELECT create_date FROM arxiv_papers ORDER BY create_date ASC LIMIT 1;
+# arxiv grows every year, so later eras are shorter to keep indices of comparable size
+ERAS = (1986, 2000, 2010, 2015, 2018, 2020, 2022, 2024)
+
+
+class Partitioning:
+    # papers go into indices by the year of their create_date. every index covers a closed range of years,
+    # except for the last one, which takes everything newer, so next years need no new index
+    def __init__(self, starts: t.Iterable[int]):
+        self.starts = sorted(set(starts))
+
+    @classmethod
+    def yearly(cls, first: int = FIRST_YEAR) -> "Partitioning":
+        return cls(range(first, date.today().year + 1))
+
+    @classmethod
+    def eras(cls) -> "Partitioning":
+        return cls(ERAS)
+
+    @classmethod
+    def scheme(cls, name: str) -> "Partitioning":
+        return cls.yearly() if name == "year" else cls.eras()
+
+    def ranges(self) -> t.List[YearRange]:
+        ends = [start - 1 for start in self.starts[1:]]
+        return list(zip(self.starts, [*ends, None]))
+
+    def name(self, index: str, year_range: YearRange) -> str:
+        return partition_name(index, year_range)
+
+    def indices(self, index: str) -> t.List[str]:
+        return [self.name(index, year_range) for year_range in self.ranges()]
+
+    def route(self, index: str, record: dict) -> str:
+        # papers older than the first partition still have to go somewhere
+        i = max(bisect_right(self.starts, int(record["create_date"][:4])) - 1, 0)
+        return self.name(index, self.ranges()[i])
+
+
+def find_partitioning(indices: t.Iterable[str]) -> t.Optional[t.Tuple[str, Partitioning]]:
+    # base index and partitioning of indices behind an alias, None when it is a single plain index
+    parsed = [parse_partition(name) for name in indices]
+    if not parsed or None in parsed or len({base for base, _ in parsed}) != 1:
+        return None
+
+    return parsed[0][0], Partitioning(start for _, (start, _) in parsed)
+
+
+def target_indices(index: str, partitioning: t.Optional[Partitioning] = None) -> t.List[str]:
+    return partitioning.indices(index) if partitioning else [index]
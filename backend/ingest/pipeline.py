@@ -0,0 +1,477 @@
+import json
+import locale
+import mmap
+import time
+import typing as t
+from datetime import datetime
+from logging import Logger
+from multiprocessing import Process, Queue, Value
+from multiprocessing.sharedctypes import Synchronized
+from pathlib import Path
+
+from tqdm import tqdm
+
+from ingest.checkpoint import Intervals, Manifest
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.ranges import ByteRange, iter_chunks, split_into_ranges
+from ingest.records import (
+    encode_json_lines,
+    encode_tuples,
+    is_binary,
+    open_writer,
+    shard_list_path,
+)
+from ingest.scheduler import Autoscaler, WorkerCount, default_processors, supervise
+from ingest.shards import ShardOutput, ShardSet
+from ingest.streams import is_compressed, iter_stream_chunks
+from ingest.text import TextNormalizer
+
+CHECKPOINT_INTERVAL = 10  # in seconds, how often writer records its progress in the manifest
+
+
+def processed_path(path_to_dump: Path, binary: bool = False) -> Path:
+    return path_to_dump.with_name("arxiv-processed.bin" if binary else "arxiv-processed.jsonl")
+
+
+def loaded_path(result_path: Path, shards: bool = False) -> Path:
+    return shard_list_path(result_path) if shards else result_path
+
+
+def version_dates(versions: t.List[dict]) -> t.List[datetime]:
+    return sorted(datetime.strptime(i["created"], "%a, %d %b %Y %H:%M:%S %Z") for i in versions)
+
+
+class Reader(Process):
+    def __init__(
+        self,
+        path: Path,
+        reader_queue: Queue,
+        workers: WorkerCount,
+        *args,
+        completed: t.Optional[Intervals] = None,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.reader_queue = reader_queue
+        self.workers = workers
+        # parts of the dump that are already processed by previous run
+        self.completed = completed or Intervals()
+        self.metrics = metrics or WorkerMetrics("reader")
+
+    def send(self, byte_range: ByteRange, chunk: t.List[bytes]):
+        self.metrics.put(self.reader_queue, (byte_range, chunk))
+        self.metrics.add(records=len(chunk), bytes=byte_range[1] - byte_range[0])
+
+    def read_compressed(self):
+        # decompression happens here, so it overlaps with parsing in processors. progress is in compressed bytes
+        with tqdm(total=self.path.stat().st_size, unit="B", unit_scale=True) as bar:
+            for byte_range, chunk, consumed in iter_stream_chunks(self.path, self.completed):
+                self.send(byte_range, chunk)
+                bar.update(consumed - bar.n)
+
+    def run(self):
+        if is_compressed(self.path):
+            self.read_compressed()
+            self.send_sentinels()
+            return
+
+        # raw lines are sent in chunks, parsing them is processors job
+        size = self.path.stat().st_size
+        with (
+            open(self.path, "rb") as file,
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+            tqdm(total=size, initial=self.completed.total(), unit="B", unit_scale=True) as bar,
+        ):
+            for gap in self.completed.gaps((0, size)):
+                for byte_range, chunk in iter_chunks(mm, gap):
+                    self.send(byte_range, chunk)
+                    bar.update(byte_range[1] - byte_range[0])
+
+        self.send_sentinels()
+
+    def send_sentinels(self):
+        # send None to all processors, queue is fifo so they come after the data. pool is closed first,
+        # so no processor can be started without getting its own None
+        for _ in range(self.workers.close()):
+            self.reader_queue.put(None)
+
+
+class Processor(Process):
+    def __init__(
+        self,
+        reader_queue: Queue,
+        writer_queue: Queue,
+        *args,
+        known: t.Optional[t.Dict[str, str]] = None,
+        encode: t.Callable[[t.List[dict]], bytes] = encode_json_lines,
+        output: t.Optional[ShardOutput] = None,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.reader_queue = reader_queue
+        self.writer_queue = writer_queue
+        # arxiv_id -> update_date of papers already in bases, they are skipped unless they got a new version
+        self.known = known
+        # how processed chunk is serialized, has to match what writer expects
+        self.encode = encode
+        # own output shard, when set chunks are written here instead of being sent to the writer
+        self.output = output
+        self.metrics = metrics or WorkerMetrics("processor")
+        locale.setlocale(locale.LC_ALL, "en_US.UTF-8")
+        self.normalizer = TextNormalizer()
+
+    def is_unchanged(self, parsed_line: dict) -> bool:
+        if self.known is None or parsed_line["id"] not in self.known:
+            return False
+
+        try:
+            latest = version_dates(parsed_line["versions"])[-1]
+        except Exception:
+            return False
+
+        return latest.strftime("%Y-%m-%d") == self.known[parsed_line["id"]]
+
+    def fix_text(self, content: str) -> str:
+        # text defucker 3001, latex is parsed only when there is any
+        return self.normalizer(content)
+
+    def process(self, parsed_line: dict) -> dict:
+
+        try:
+            # id is ok
+            # submitter is being check in a producer
+            # authors are fucked up, but lets try and fix them
+            authors = set()
+            for author in parsed_line["authors_parsed"]:
+                full_name = " ".join(author).replace("\n", "")
+                full_name, *_ = full_name.split("  ")  # two spaces
+                authors.add(full_name.strip())
+
+            # THIS MAY BE WRONG, but lets assume that submitter is also an author
+            authors.add(parsed_line["submitter"])
+            parsed_line["authors"] = list(authors)
+
+            # title could be fucked up
+            parsed_line["title"] = self.fix_text(parsed_line["title"])
+
+            # we dont care about comments, but we defuck them anyway
+            if parsed_line["comments"] is None:
+                parsed_line["comments"] = ""
+            else:
+                parsed_line["comments"] = self.fix_text(parsed_line["comments"])
+
+            # journal-ref is nullable for some reason
+            # doi is ok, yet sometimes nullable
+
+            # categories are saved like this: <major category>.<sub category>; we want to save both major as itself
+            # and major + minor as second category, we are lucky that all arxiv categories are at most two elements.
+            # but some articles already have major and minor categories set properly
+            parsed_categories = set()
+            categories: t.List[str] = parsed_line["categories"].split(" ")
+
+            for category in categories:
+                if "." in category:
+                    major, _ = category.split(".")
+                    parsed_categories.add(major)
+                    parsed_categories.add(category)
+                else:
+                    parsed_categories.add(category)
+
+            parsed_line["categories"] = list(parsed_categories)
+
+            # extract create_date
+            sorted_dates = version_dates(parsed_line["versions"])
+
+            parsed_line["create_date"] = sorted_dates[0].strftime("%Y-%m-%d")
+            parsed_line["update_date"] = sorted_dates[-1].strftime("%Y-%m-%d")
+
+            # abstract is fucked up for sure
+            parsed_line["abstract"] = self.fix_text(parsed_line["abstract"])
+
+            # update_date is ok
+            return parsed_line
+
+        except Exception:
+            # line is fucked up, we dont care
+            return {}
+
+    def process_lines(self, lines: t.Iterable[bytes]) -> t.Iterator[dict]:
+        for line in lines:
+            data = json.loads(line)
+            if data["submitter"] is None or self.is_unchanged(data):
+                continue
+
+            data = self.process(data)
+            if data:
+                yield data
+            else:
+                self.metrics.add(errors=1)
+
+    def emit(self, chunks: t.Iterable[t.Tuple[ByteRange, t.List[bytes]]]):
+        # writer gets already serialized chunks, so it only has to write them down. byte range of the
+        # source chunk goes along, so writer knows which part of the dump is safely processed
+        if self.output is not None:
+            self.output.open()
+
+        for byte_range, lines in chunks:
+            # everything that neither elastic nor postgres will ever use is dropped by encode
+            records = list(self.process_lines(lines))
+            chunk = self.encode(records)
+            self.metrics.add(records=len(records), bytes=byte_range[1] - byte_range[0])
+            if self.output is not None:
+                self.output.write(byte_range, chunk)
+            else:
+                self.metrics.put(self.writer_queue, (byte_range, chunk, len(records)))
+
+        if self.output is not None:
+            self.output.close()
+        else:
+            self.writer_queue.put(None)
+
+    def run(self):
+        self.emit(iter(lambda: self.metrics.get(self.reader_queue), None))
+
+
+class ShardedProcessor(Processor):
+    # processor that reads its own part of the dump, without the need of a central reader
+    def __init__(
+        self,
+        path: Path,
+        byte_range: ByteRange,
+        progress: Value,
+        writer_queue: Queue,
+        *args,
+        completed: t.Optional[Intervals] = None,
+        **kwargs,
+    ):
+        super().__init__(None, writer_queue, *args, **kwargs)
+        self.path = path
+        self.byte_range = byte_range
+        self.progress = progress
+        self.completed = completed or Intervals()
+
+    def report_progress(self, amount: int):
+        with self.progress.get_lock():
+            self.progress.value += amount
+
+    def read_range(self) -> t.Iterator[t.Tuple[ByteRange, t.List[bytes]]]:
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for gap in self.completed.gaps(self.byte_range):
+                for byte_range, lines in iter_chunks(mm, gap):
+                    yield byte_range, lines
+                    self.report_progress(byte_range[1] - byte_range[0])
+
+    def run(self):
+        self.emit(self.read_range())
+
+
+class Writer(Process):
+    def __init__(
+        self,
+        path: Path,
+        writer_queue: Queue,
+        workers: WorkerCount,
+        *args,
+        manifest: t.Optional[Manifest] = None,
+        progress: t.Optional[Synchronized] = None,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.writer_queue = writer_queue
+        self.workers = workers
+        self.manifest = manifest
+        # bytes of the dump written down, used for measuring throughput of the whole pipeline
+        self.progress = progress
+        self.metrics = metrics or WorkerMetrics("writer")
+
+    def checkpoint(self, output: t.Any, completed: Intervals, done: bool = False):
+        # data has to be on disk before manifest says so
+        self.manifest.update("preprocess", **output.sync(), completed=completed.to_list(), done=done)
+
+    def run(self):
+        completed, state = Intervals(), {}
+        if self.manifest is not None:
+            completed = self.manifest.completed("preprocess")
+            state = self.manifest.stage("preprocess")
+
+        # json lines or binary records, depending on the extension of the path
+        output = open_writer(self.path, state)
+        last_checkpoint, finished = time.monotonic(), 0
+        # every processor ends its stream with a single None, pool is closed before the first one is sent
+        while finished != self.workers.final():
+            item = self.metrics.get(self.writer_queue)
+            if item is None:
+                finished += 1
+                continue
+
+            byte_range, chunk, records = item
+            output.write(chunk)
+            self.metrics.add(records=records, bytes=len(chunk))
+            completed.add(*byte_range)
+            if self.progress is not None:
+                with self.progress.get_lock():
+                    self.progress.value += byte_range[1] - byte_range[0]
+
+            if self.manifest is not None and time.monotonic() - last_checkpoint > CHECKPOINT_INTERVAL:
+                self.checkpoint(output, completed)
+                last_checkpoint = time.monotonic()
+
+        if self.manifest is not None:
+            self.checkpoint(output, completed, done=True)
+        else:
+            output.sync()
+
+        output.close()
+
+
+def run_preprocessing(
+    logger: Logger,
+    path_to_dump: Path,
+    result_path: Path,
+    no_processors: t.Optional[int] = None,
+    known: t.Optional[t.Dict[str, str]] = None,
+    manifest: t.Optional[Manifest] = None,
+    shards: bool = False,
+    monitor: t.Optional[Monitor] = None,
+):
+    completed = manifest.completed("preprocess") if manifest else None
+    monitor = monitor or Monitor()
+
+    # without explicit number pool starts at half of the cores and grows while it pays off
+    maximum = no_processors or default_processors()
+    initial = no_processors or max(1, maximum // 2)
+
+    # queues hold chunks of CHUNK_SIZE bytes, not single records
+    maxsize = 2 * maximum
+    reader_queue = Queue(maxsize=maxsize)
+    writer_queue = Queue(maxsize=maxsize)
+    workers = WorkerCount(initial)
+    shard_set = ShardSet(result_path, manifest) if shards else None
+    progress = shard_set.progress if shard_set else Value("Q", 0)
+
+    encode = encode_tuples if is_binary(result_path) else encode_json_lines
+
+    def make_processor() -> Processor:
+        # with shards every processor writes its own output, there is no writer in between
+        output = shard_set.next() if shard_set else None
+        metrics = monitor.worker("processor", reader_queue)
+        return Processor(reader_queue, writer_queue, known=known, encode=encode, output=output, metrics=metrics)
+
+    reader = Reader(path_to_dump, reader_queue, workers, completed=completed, metrics=monitor.worker("reader"))
+    processors = [make_processor() for _ in range(initial)]
+    stages = [reader, *processors]
+    if shard_set is None:
+        metrics = monitor.worker("writer", writer_queue)
+        stages.append(Writer(result_path, writer_queue, workers, manifest=manifest, progress=progress, metrics=metrics))
+
+    autoscaler = Autoscaler(
+        make_processor,
+        workers,
+        reader_queue,
+        writer_queue,
+        maxsize,
+        progress,
+        maximum,
+        logger,
+    )
+
+    def tick() -> t.List[Process]:
+        if shard_set is not None:
+            shard_set.record_done()
+        return autoscaler()
+
+    logger.debug(f"Preprocessing with {initial} processors, up to {maximum}")
+    [stage.start() for stage in stages]
+
+    try:
+        supervise(stages, tick=tick)
+    finally:
+        reader_queue.close()
+        writer_queue.close()
+
+    if shard_set is not None:
+        shard_set.finish()
+
+
+def run_sharded_preprocessing(
+    logger: Logger,
+    path_to_dump: Path,
+    result_path: Path,
+    no_processors: t.Optional[int] = None,
+    known: t.Optional[t.Dict[str, str]] = None,
+    manifest: t.Optional[Manifest] = None,
+    shards: bool = False,
+    monitor: t.Optional[Monitor] = None,
+):
+    if is_compressed(path_to_dump):
+        # compressed stream can only be read from the start, there are no ranges to split it into
+        logger.info(f"{path_to_dump} is compressed, it is going to be read by a single reader")
+        return run_preprocessing(
+            logger,
+            path_to_dump,
+            result_path,
+            no_processors,
+            known=known,
+            manifest=manifest,
+            shards=shards,
+            monitor=monitor,
+        )
+
+    completed = manifest.completed("preprocess") if manifest else Intervals()
+    no_processors = no_processors or default_processors()
+    monitor = monitor or Monitor()
+
+    writer_queue = Queue(maxsize=2 * no_processors)
+    progress = Value("Q", completed.total())
+
+    encode = encode_tuples if is_binary(result_path) else encode_json_lines
+    shard_set = ShardSet(result_path, manifest) if shards else None
+    ranges = split_into_ranges(path_to_dump, no_processors)
+    processors = [
+        ShardedProcessor(
+            path_to_dump,
+            byte_range,
+            progress,
+            writer_queue,
+            completed=completed,
+            known=known,
+            encode=encode,
+            output=shard_set.next() if shard_set else None,
+            metrics=monitor.worker("processor"),
+        )
+        for byte_range in ranges
+    ]
+    stages = list(processors)
+    if shard_set is None:
+        # every range has its own processor, so the pool is known and closed from the start
+        workers = WorkerCount(len(processors))
+        workers.close()
+        stages.append(
+            Writer(
+                result_path, writer_queue, workers, manifest=manifest, metrics=monitor.worker("writer", writer_queue)
+            )
+        )
+
+    logger.debug(f"Preprocessing {len(ranges)} ranges with separate processors")
+    [stage.start() for stage in stages]
+
+    # progress is reported in bytes, so there is no need to count lines beforehand
+    with tqdm(total=path_to_dump.stat().st_size, unit="B", unit_scale=True) as bar:
+
+        def show_progress():
+            if shard_set is not None:
+                shard_set.record_done()
+            bar.update(progress.value - bar.n)
+
+        try:
+            supervise(stages, tick=show_progress)
+        finally:
+            writer_queue.close()
+
+    if shard_set is not None:
+        shard_set.finish()
@@ -0,0 +1,192 @@
+import time
+import typing as t
+from logging import Logger
+from multiprocessing import Process, Queue, Value
+from multiprocessing.sharedctypes import Synchronized
+from pathlib import Path
+from queue import Empty
+
+import psycopg
+from sqlalchemy import Engine, Index, Table
+from tqdm import tqdm
+
+from ingest.checkpoint import Intervals, Manifest
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.ranges import ByteRange
+from ingest.records import open_processed
+
+SLICES_PER_WORKER = 8  # more slices means finer checkpoints, every slice is committed on its own
+
+# column in postgres -> field in preprocessed file
+COLUMNS = {
+    "arxiv_id": "id",
+    "doi": "doi",
+    "authors": "authors",
+    "submitter": "submitter",
+    "title": "title",
+    "abstract": "abstract",
+    "journal_ref": "journal-ref",
+    "categories": "categories",
+    "comments": "comments",
+    "create_date": "create_date",
+    "update_date": "update_date",
+}
+COLUMN_TYPES = ["text", "text", "text[]", "text", "text", "text", "text", "text[]", "text", "timestamp", "timestamp"]
+
+
+def get_conninfo(engine: Engine) -> str:
+    # engine url is sqlalchemy specific (postgresql+psycopg://), psycopg wants plain one
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def to_row(line: dict) -> t.Tuple[t.Any, ...]:
+    return tuple(line[field] for field in COLUMNS.values())
+
+
+def copy_statement(table: str) -> str:
+    return f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN"
+
+
+class CopyWorker(Process):
+    # streams its own slices of preprocessed file into postgres through a separate COPY connection
+    def __init__(
+        self,
+        conninfo: str,
+        table: str,
+        path: Path,
+        byte_ranges: t.List[ByteRange],
+        progress: Synchronized,
+        done_queue: Queue,
+        *args,
+        resumed: bool = False,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.conninfo = conninfo
+        self.table = table
+        self.path = path
+        self.byte_ranges = byte_ranges
+        self.progress = progress
+        self.done_queue = done_queue
+        self.resumed = resumed
+        self.metrics = metrics or WorkerMetrics("postgres")
+
+    def run(self):
+        statement = copy_statement(self.table)
+        with open_processed(self.path) as source, psycopg.connect(self.conninfo, autocommit=True) as connection:
+            for byte_range in self.byte_ranges:
+                # every slice is a separate transaction, but the parent records it only some time after the commit.
+                # crash in between leaves the slice in the table and not in the manifest, it is copied again later
+                records = 0
+                try:
+                    with connection.transaction(), connection.cursor() as cursor:
+                        if self.resumed:
+                            # arxiv_id is not unique in the table, so rows of the previous attempt have to go first
+                            ids = [record["id"] for _, record in source.read(byte_range)]
+                            cursor.execute(f"DELETE FROM {self.table} WHERE arxiv_id = ANY(%s)", (ids,))
+
+                        with cursor.copy(statement) as copy:
+                            copy.set_types(COLUMN_TYPES)
+                            for _, record in source.read(byte_range):
+                                copy.write_row(to_row(record))
+                                records += 1
+                except Exception:
+                    # whole slice is rolled back, this worker is done
+                    self.metrics.add(errors=source.count(byte_range))
+                    raise
+
+                self.metrics.add(records=records, bytes=source.nbytes(byte_range))
+                self.done_queue.put(byte_range)
+                with self.progress.get_lock():
+                    self.progress.value += byte_range[1] - byte_range[0]
+
+
+def drop_indexes(engine: Engine, table: Table, keep: t.Collection[str] = ()) -> t.List[Index]:
+    # indexes only on columns in keep stay, they are created again when a crashed run left them dropped
+    indexes = []
+    for index in table.indexes:
+        if {column.name for column in index.columns} <= set(keep):
+            index.create(engine, checkfirst=True)
+            continue
+
+        index.drop(engine, checkfirst=True)
+        indexes.append(index)
+
+    return indexes
+
+
+def copy_into_postgres(
+    engine: Engine,
+    table: Table,
+    logger: Logger,
+    path: Path,
+    workers: int = 4,
+    defer_indexes: bool = True,
+    pos: int = 1,
+    manifest: t.Optional[Manifest] = None,
+    monitor: t.Optional[Monitor] = None,
+):
+    # keeping indexes up to date row by row is way slower than building them once on a full table
+    indexes = drop_indexes(engine, table) if defer_indexes else []
+
+    # slices already copied by previous run are skipped, what is left gets split between workers.
+    # any of them could have been committed without being recorded, once the stage started they are replaced
+    completed = manifest.completed("postgres") if manifest else Intervals()
+    resumed = bool(manifest and manifest.stage("postgres").get("started"))
+    if manifest:
+        manifest.update("postgres", started=True)
+    with open_processed(path) as source:
+        slices = [gap for byte_range in source.split(workers * SLICES_PER_WORKER) for gap in completed.gaps(byte_range)]
+        extent, unit = source.extent, source.unit
+
+    conninfo = get_conninfo(engine)
+    progress = Value("Q", completed.total())
+    done_queue = Queue()
+    monitor = monitor or Monitor()
+    copiers = [
+        CopyWorker(
+            conninfo,
+            table.name,
+            path,
+            slices[i::workers],
+            progress,
+            done_queue,
+            resumed=resumed,
+            metrics=monitor.worker("postgres"),
+        )
+        for i in range(min(workers, len(slices)))
+    ]
+
+    def record_done():
+        while True:
+            try:
+                completed.add(*done_queue.get_nowait())
+            except Empty:
+                break
+
+            if manifest:
+                manifest.update("postgres", completed=completed.to_list())
+
+    logger.debug(f"Copying {len(slices)} slices into postgres using {len(copiers)} connections")
+    [copier.start() for copier in copiers]
+    with tqdm(total=extent, unit=unit, unit_scale=True, position=pos) as bar:
+        while any(copier.is_alive() for copier in copiers):
+            record_done()
+            bar.update(progress.value - bar.n)
+            time.sleep(0.5)
+
+        [copier.join() for copier in copiers]
+        record_done()
+        bar.update(progress.value - bar.n)
+
+    failed = [copier for copier in copiers if copier.exitcode != 0]
+    if failed:
+        logger.error(f"{len(failed)} out of {len(copiers)} COPY connections failed, data in postgres is incomplete")
+
+    for index in indexes:
+        logger.debug(f"Creating index {index.name}")
+        index.create(engine)
+
+    if manifest and not failed:
+        manifest.update("postgres", done=True)
@@ -0,0 +1,63 @@
+import mmap
+import typing as t
+from pathlib import Path
+
+ByteRange = t.Tuple[int, int]
+
+CHUNK_SIZE = 1 << 20  # in bytes, how much data is sent between processes at once
+
+
+def split_into_ranges(path: Path, parts: int) -> t.List[ByteRange]:
+    # split file into `parts` byte ranges, each one starting right after a newline, so every line
+    # belongs to exactly one range. small files may end up with less ranges than requested
+    size = path.stat().st_size
+    if size == 0:
+        return []
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        boundaries = [0]
+        for i in range(1, parts):
+            newline = mm.find(b"\n", max(size * i // parts, boundaries[-1]))
+            if newline == -1:
+                break
+
+            boundary = newline + 1
+            if boundary > boundaries[-1] and boundary < size:
+                boundaries.append(boundary)
+
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def iter_range(mm: mmap.mmap, byte_range: ByteRange) -> t.Iterator[bytes]:
+    # yields raw lines (with trailing newline) from given range of already mapped file
+    start, end = byte_range
+    mm.seek(start)
+    while mm.tell() < end:
+        line = mm.readline()
+        if not line:
+            break
+        yield line
+
+
+def iter_chunks(
+    mm: mmap.mmap, byte_range: ByteRange, size: int = CHUNK_SIZE
+) -> t.Iterator[t.Tuple[ByteRange, t.List[bytes]]]:
+    # line aligned chunks of about `size` bytes, together with the part of the file they came from
+    position, end = byte_range
+    chunk, chunk_start = [], position
+    mm.seek(position)
+    while position < end:
+        line = mm.readline()
+        if not line:
+            break
+
+        chunk.append(line)
+        position += len(line)
+        if position - chunk_start >= size:
+            yield (chunk_start, position), chunk
+            chunk, chunk_start = [], position
+            mm.seek(position)
+
+    if chunk:
+        yield (chunk_start, position), chunk
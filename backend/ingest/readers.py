@@ -0,0 +1,100 @@
+import pickle
+import typing as t
+from itertools import batched
+from multiprocessing import Process, Queue
+from pathlib import Path
+from queue import Empty
+
+from ingest.checkpoint import Intervals
+from ingest.metrics import Monitor, WorkerMetrics
+from ingest.records import ProcessedFile, Span, open_processed
+from ingest.scheduler import PipelineError
+
+READERS = 4  # processes parsing the processed file for a loader, one of them alone keeps just a single core busy
+SPANS_PER_READER = 4  # shards are never merged into one span, so small ones just make more of them
+READ_CHUNK_SIZE = 2_000  # records pickled together and handed to the loader at once
+READ_BUFFER = 2  # in chunks per reader, parsed records wait for the loader only this long
+
+
+def todo_spans(source: ProcessedFile, completed: Intervals, readers: int) -> t.List[Span]:
+    # spans of the file that are not loaded yet, none of them crosses a shard boundary
+    return [gap for span in source.split(readers * SPANS_PER_READER) for gap in completed.gaps(span)]
+
+
+class SpanReader(Process):
+    # parses its share of spans on its own core. chunks never cross a span and are sent pickled,
+    # so the loader decides whether it needs them parsed at all
+    def __init__(
+        self,
+        path: Path,
+        spans: t.List[Span],
+        queue: Queue,
+        *args,
+        chunk_size: int = READ_CHUNK_SIZE,
+        metrics: t.Optional[WorkerMetrics] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.spans = spans
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.metrics = metrics or WorkerMetrics("reader")
+
+    def run(self):
+        try:
+            with open_processed(self.path) as source:
+                for span in self.spans:
+                    for chunk in batched(source.read(span), self.chunk_size):
+                        data = pickle.dumps(list(chunk), protocol=pickle.HIGHEST_PROTOCOL)
+                        self.metrics.add(records=len(chunk), bytes=len(data))
+                        self.metrics.put(self.queue, data)
+        finally:
+            # the loader counts these to know every reader is done, failed one also exits with an error
+            self.queue.put(None)
+
+
+def read_in_parallel(
+    path: Path,
+    spans: t.List[Span],
+    readers: int = READERS,
+    chunk_size: int = READ_CHUNK_SIZE,
+    monitor: t.Optional[Monitor] = None,
+    stage: str = "reader",
+) -> t.Generator[bytes, None, None]:
+    # pickled chunks of (span, record) in whatever order the readers get to them. raises once all of them
+    # are read when any reader failed, so the loader keeps what it got until then
+    monitor = monitor or Monitor()
+    queue = Queue(readers * READ_BUFFER)
+    processes = [
+        SpanReader(path, spans[i::readers], queue, chunk_size=chunk_size, metrics=monitor.worker(stage))
+        for i in range(min(readers, len(spans)))
+    ]
+    [process.start() for process in processes]
+
+    finished = 0
+    try:
+        while finished < len(processes):
+            try:
+                data = queue.get(timeout=1)
+            except Empty:
+                # killed reader never sends its None
+                if any(process.is_alive() for process in processes):
+                    continue
+                break
+
+            if data is None:
+                finished += 1
+            else:
+                yield data
+    except GeneratorExit:
+        # loader stopped early, readers would wait for room in the queue forever
+        [process.terminate() for process in processes]
+        raise
+    finally:
+        [process.join() for process in processes]
+
+    failed = [process for process in processes if process.exitcode != 0]
+    if failed:
+        codes = ", ".join(str(process.exitcode) for process in failed)
+        raise PipelineError(f"{len(failed)} out of {len(processes)} readers of {path} failed with exit codes {codes}")
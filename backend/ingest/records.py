@@ -0,0 +1,319 @@
+import json
+import marshal
+import mmap
+import os
+import pickle
+import struct
+import typing as t
+from array import array
+from itertools import accumulate
+from pathlib import Path
+
+from ingest.ranges import ByteRange, iter_range, split_into_ranges
+
+# fields used by elastic and postgres, everything else is dropped after processing
+PROCESSED_FIELDS = (
+    "id",
+    "submitter",
+    "authors",
+    "title",
+    "comments",
+    "journal-ref",
+    "doi",
+    "categories",
+    "abstract",
+    "update_date",
+    "create_date",
+)
+CATEGORIES = PROCESSED_FIELDS.index("categories")
+
+# binary format: <name>.bin holds records as u32 length + pickled tuple of PROCESSED_FIELDS,
+# <name>.bin.idx holds u64 offsets of every record, <name>.bin.json holds version, fields and category dictionary.
+# protocol is pinned, so files stay readable by any python, marshal is only used between processes of one run
+LENGTH = struct.Struct("<I")
+PICKLE_PROTOCOL = 5
+FORMAT_VERSION = 2
+
+# list of output shards written by separate processors, they are read as if they were a single file
+SHARDS_SUFFIX = ".shards.json"
+
+# positions in files are bytes for json lines and record numbers for binary files
+Span = ByteRange
+
+
+def is_binary(path: Path) -> bool:
+    return path.suffix == ".bin"
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
+
+
+def meta_path(path: Path) -> Path:
+    return path.with_name(path.name + ".json")
+
+
+def shard_list_path(result_path: Path) -> Path:
+    return result_path.with_name(result_path.stem + SHARDS_SUFFIX)
+
+
+def is_shard_list(path: Path) -> bool:
+    return path.name.endswith(SHARDS_SUFFIX)
+
+
+def encode_json_lines(records: t.List[dict]) -> bytes:
+    return "".join(json.dumps({key: record[key] for key in PROCESSED_FIELDS}) + "\n" for record in records).encode()
+
+
+def check_version(meta: t.Dict[str, t.Any], path: Path):
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported format version {meta.get('version')} of {path}, expected {FORMAT_VERSION}, "
+            + "preprocess the dump again"
+        )
+
+
+def encode_tuples(records: t.List[dict]) -> bytes:
+    # processors send plain tuples, dictionary encoding is done by the only one who owns the dictionary
+    return marshal.dumps([tuple(record[key] for key in PROCESSED_FIELDS) for record in records])
+
+
+class JsonLinesWriter:
+    def __init__(self, path: Path, state: t.Optional[t.Dict[str, int]] = None):
+        output_size = (state or {}).get("output_size", 0)
+        self.file = open(path, "r+b" if output_size else "wb")
+        # anything written after the last checkpoint is going to be processed again
+        self.file.truncate(output_size)
+        self.file.seek(output_size)
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+
+    def sync(self) -> t.Dict[str, int]:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"output_size": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class RecordWriter:
+    def __init__(self, path: Path, state: t.Optional[t.Dict[str, int]] = None):
+        self.path = path
+        state = state or {}
+        output_size, records = state.get("output_size", 0), state.get("records", 0)
+
+        self.categories: t.Dict[str, int] = {}
+        if records and meta_path(path).exists():
+            with open(meta_path(path), "r") as file:
+                meta = json.load(file)
+
+            # records written so far are kept, they have to be in the very same format
+            check_version(meta, path)
+            self.categories = {name: i for i, name in enumerate(meta["categories"])}
+
+        self.file = open(path, "r+b" if output_size else "wb")
+        self.file.truncate(output_size)
+        self.file.seek(output_size)
+
+        self.index = open(index_path(path), "r+b" if records else "wb")
+        self.index.truncate(records * 8)
+        self.index.seek(records * 8)
+        self.records = records
+
+    def category_id(self, category: str) -> int:
+        return self.categories.setdefault(category, len(self.categories))
+
+    def write(self, chunk: bytes):
+        offsets = array("Q")
+        position = self.file.tell()
+        for record in marshal.loads(chunk):
+            record = list(record)
+            record[CATEGORIES] = [self.category_id(category) for category in record[CATEGORIES]]
+            data = pickle.dumps(tuple(record), protocol=PICKLE_PROTOCOL)
+
+            self.file.write(LENGTH.pack(len(data)))
+            self.file.write(data)
+            offsets.append(position)
+            position += LENGTH.size + len(data)
+
+        self.index.write(offsets.tobytes())
+        self.records += len(offsets)
+
+    def sync(self) -> t.Dict[str, int]:
+        # dictionary goes first, it is only ever extended, so it is fine when it knows more than data
+        with open(meta_path(self.path), "w") as file:
+            json.dump(
+                {"version": FORMAT_VERSION, "fields": PROCESSED_FIELDS, "categories": list(self.categories)}, file
+            )
+            file.flush()
+            os.fsync(file.fileno())
+
+        for file in (self.file, self.index):
+            file.flush()
+            os.fsync(file.fileno())
+
+        return {"output_size": self.file.tell(), "records": self.records}
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+class Closing:
+    # processed files are opened once and read by many spans, with statement closes what they hold open
+    def close(self):
+        pass
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JsonLinesFile(Closing):
+    # processed file as written by the pipeline, positions are bytes
+    unit = "B"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.extent = path.stat().st_size
+
+    def split(self, parts: int) -> t.List[Span]:
+        return split_into_ranges(self.path, parts)
+
+    def read(self, span: Span) -> t.Iterator[t.Tuple[Span, dict]]:
+        # empty file cannot be mapped
+        if span[0] >= span[1]:
+            return
+
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = span[0]
+            for line in iter_range(mm, span):
+                yield (position, position + len(line)), json.loads(line)
+                position += len(line)
+
+    def nbytes(self, span: Span) -> int:
+        return span[1] - span[0]
+
+    def count(self, span: t.Optional[Span] = None) -> int:
+        start, end = span or (0, self.extent)
+        if start >= end:
+            return 0
+
+        with open(self.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return sum(1 for _ in iter_range(mm, (start, end)))
+
+
+class RecordFile(Closing):
+    # binary processed file, positions are record numbers and any record can be read directly
+    unit = "papers"
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(meta_path(path), "r") as file:
+            meta = json.load(file)
+
+        check_version(meta, path)
+        self.fields = meta["fields"]
+        self.categories = meta["categories"]
+
+        with open(index_path(path), "rb") as file:
+            self.offsets = array("Q", file.read())
+
+        self.extent = len(self.offsets)
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.extent else b""
+
+    def __len__(self) -> int:
+        return self.extent
+
+    def __getitem__(self, i: int) -> dict:
+        offset = self.offsets[i]
+        (length,) = LENGTH.unpack_from(self.mm, offset)
+        record = dict(zip(self.fields, pickle.loads(self.mm[offset + LENGTH.size : offset + LENGTH.size + length])))
+        record["categories"] = [self.categories[category] for category in record["categories"]]
+        return record
+
+    def split(self, parts: int) -> t.List[Span]:
+        bounds = sorted({self.extent * i // parts for i in range(parts + 1)})
+        return list(zip(bounds, bounds[1:]))
+
+    def read(self, span: Span) -> t.Iterator[t.Tuple[Span, dict]]:
+        for i in range(*span):
+            yield (i, i + 1), self[i]
+
+    def nbytes(self, span: Span) -> int:
+        # size of the records on disk, the last one ends where the file does
+        start, end = span
+        if start >= end:
+            return 0
+
+        return (self.offsets[end] if end < self.extent else len(self.mm)) - self.offsets[start]
+
+    def count(self, span: t.Optional[Span] = None) -> int:
+        start, end = span or (0, self.extent)
+        return end - start
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+
+
+class ShardedFile(Closing):
+    # positions of every shard start where the previous shard ends
+    def __init__(self, path: Path):
+        with open(path, "r") as file:
+            names = json.load(file)["shards"]
+
+        self.shards = [open_processed(path.with_name(name)) for name in names]
+        self.unit = self.shards[0].unit if self.shards else "B"
+        self.starts = list(accumulate((shard.extent for shard in self.shards), initial=0))
+        self.extent = self.starts[-1]
+
+    def pieces(self, span: Span) -> t.Iterator[t.Tuple[JsonLinesFile | RecordFile, int, Span]]:
+        for shard, start in zip(self.shards, self.starts):
+            local = (max(span[0], start) - start, min(span[1], start + shard.extent) - start)
+            if local[0] < local[1]:
+                yield shard, start, local
+
+    def split(self, parts: int) -> t.List[Span]:
+        # shards are split on their own, so no span crosses a shard boundary
+        spans = []
+        for shard, start in zip(self.shards, self.starts):
+            shard_parts = max(1, parts * shard.extent // max(self.extent, 1))
+            spans.extend((a + start, b + start) for a, b in shard.split(shard_parts))
+
+        return spans
+
+    def read(self, span: Span) -> t.Iterator[t.Tuple[Span, dict]]:
+        for shard, start, local in self.pieces(span):
+            for (a, b), record in shard.read(local):
+                yield (a + start, b + start), record
+
+    def nbytes(self, span: Span) -> int:
+        return sum(shard.nbytes(local) for shard, _, local in self.pieces(span))
+
+    def count(self, span: t.Optional[Span] = None) -> int:
+        return sum(shard.count(local) for shard, _, local in self.pieces(span or (0, self.extent)))
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+ProcessedFile = JsonLinesFile | RecordFile | ShardedFile
+
+
+def open_processed(path: Path) -> ProcessedFile:
+    if is_shard_list(path):
+        return ShardedFile(path)
+
+    return RecordFile(path) if is_binary(path) else JsonLinesFile(path)
+
+
+def open_writer(path: Path, state: t.Optional[t.Dict[str, int]] = None) -> JsonLinesWriter | RecordWriter:
+    return RecordWriter(path, state) if is_binary(path) else JsonLinesWriter(path, state)
@@ -0,0 +1,138 @@
+import os
+import time
+import typing as t
+from logging import Logger
+from multiprocessing import Queue, Value
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from multiprocessing.sharedctypes import Synchronized
+
+SAMPLE_INTERVAL = 5.0  # in seconds, how long throughput is measured before deciding on pool size
+MIN_GAIN = 0.05  # new processor has to add at least that much throughput, otherwise pool stops growing
+BACKED_UP = 0.75  # queue this full means whoever reads from it is the bottleneck
+
+
+class PipelineError(Exception):
+    pass
+
+
+def default_processors() -> int:
+    # reader and writer get a core each, everything else goes to processors
+    return max(1, (os.cpu_count() or 1) - 2)
+
+
+class WorkerCount:
+    # number of processors shared between processes, once closed it never changes again. closed value is
+    # stored as ~count, so pool of zero can be told apart from a closed one
+    def __init__(self, initial: int = 0):
+        self.value = Value("i", initial)
+
+    def add(self) -> bool:
+        with self.value.get_lock():
+            if self.value.value < 0:
+                return False
+            self.value.value += 1
+            return True
+
+    def close(self) -> int:
+        with self.value.get_lock():
+            if self.value.value >= 0:
+                self.value.value = ~self.value.value
+            return ~self.value.value
+
+    def final(self) -> t.Optional[int]:
+        value = self.value.value
+        return ~value if value < 0 else None
+
+
+def is_backed_up(queue: Queue, maxsize: int) -> bool:
+    try:
+        return queue.qsize() >= maxsize * BACKED_UP
+    except NotImplementedError:
+        # qsize is not there on macOS, pool just does not grow
+        return False
+
+
+class Autoscaler:
+    # grows processor pool while processors are the bottleneck and every new one still pays off
+    def __init__(
+        self,
+        spawn: t.Callable[[], BaseProcess],
+        workers: WorkerCount,
+        reader_queue: Queue,
+        writer_queue: Queue,
+        maxsize: int,
+        progress: Synchronized,
+        maximum: int,
+        logger: Logger,
+    ):
+        self.spawn = spawn
+        self.workers = workers
+        self.reader_queue = reader_queue
+        self.writer_queue = writer_queue
+        self.maxsize = maxsize
+        self.progress = progress
+        self.maximum = maximum
+        self.logger = logger
+
+        self.last_sample, self.last_progress = time.monotonic(), progress.value
+        self.before_growth: t.Optional[float] = None
+        self.saturated = False
+
+    def __call__(self) -> t.List[BaseProcess]:
+        now = time.monotonic()
+        if self.saturated or now - self.last_sample < SAMPLE_INTERVAL:
+            return []
+
+        throughput = (self.progress.value - self.last_progress) / (now - self.last_sample)
+        self.last_sample, self.last_progress = now, self.progress.value
+
+        count = self.workers.value.value
+        # closed pool means reader is done, there is nothing left to scale for
+        if count < 0 or count >= self.maximum:
+            return []
+
+        # reader waiting on processors, while writer keeps up with them
+        if not is_backed_up(self.reader_queue, self.maxsize) or is_backed_up(self.writer_queue, self.maxsize):
+            return []
+
+        if self.before_growth is not None and throughput < self.before_growth * (1 + MIN_GAIN):
+            self.logger.debug(f"Processor pool saturated at {count} processors, {throughput / 2**20:.1f} MiB/s")
+            self.saturated = True
+            return []
+
+        if not self.workers.add():
+            return []
+
+        self.logger.debug(f"Adding processor {count + 1}, throughput so far {throughput / 2**20:.1f} MiB/s")
+        self.before_growth = throughput
+        process = self.spawn()
+        process.start()
+        return [process]
+
+
+def supervise(
+    processes: t.List[BaseProcess],
+    tick: t.Optional[t.Callable[[], t.Optional[t.List[BaseProcess]]]] = None,
+    interval: float = 0.5,
+):
+    # blocks until all processes exit. first one that dies with an error takes all others down with it,
+    # otherwise its peers would wait for its data forever. tick can start new processes to watch
+    alive = {process.sentinel: process for process in processes}
+    while alive:
+        for sentinel in wait(list(alive), timeout=interval):
+            process = alive.pop(sentinel)
+            process.join()
+            if process.exitcode == 0:
+                continue
+
+            for other in alive.values():
+                other.terminate()
+            for other in alive.values():
+                other.join()
+
+            raise PipelineError(f"{process.name} died with exit code {process.exitcode}")
+
+        if tick is not None:
+            for process in tick() or []:
+                alive[process.sentinel] = process
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+import typing as t
+from multiprocessing import Queue, Value
+from multiprocessing.sharedctypes import Synchronized
+from pathlib import Path
+from queue import Empty
+
+from ingest.checkpoint import Intervals, Manifest
+from ingest.ranges import ByteRange
+from ingest.records import open_writer, shard_list_path
+
+CHECKPOINT_INTERVAL = 10  # in seconds, how often every shard reports what is safely on disk
+
+
+def shard_path(result_path: Path, index: int) -> Path:
+    return result_path.with_name(f"{result_path.stem}-{index:03d}{result_path.suffix}")
+
+
+class ShardOutput:
+    # output of a single processor, lives in the processor after fork. parent only gets to know
+    # about data that is already synced to disk
+    def __init__(
+        self,
+        index: int,
+        path: Path,
+        state: t.Dict[str, int],
+        done_queue: Queue,
+        progress: Synchronized,
+    ):
+        self.index = index
+        self.path = path
+        self.state = state
+        self.done_queue = done_queue
+        self.progress = progress
+
+    def open(self):
+        self.writer = open_writer(self.path, self.state)
+        self.pending = Intervals()
+        self.last_checkpoint = time.monotonic()
+
+    def write(self, byte_range: ByteRange, chunk: bytes):
+        self.writer.write(chunk)
+        self.pending.add(*byte_range)
+        with self.progress.get_lock():
+            self.progress.value += byte_range[1] - byte_range[0]
+
+        if time.monotonic() - self.last_checkpoint > CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.done_queue.put((self.index, self.writer.sync(), self.pending.to_list()))
+        self.pending = Intervals()
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
+        self.writer.close()
+
+
+class ShardSet:
+    # hands out shards to processors and keeps the manifest up to date with what they report
+    def __init__(self, result_path: Path, manifest: t.Optional[Manifest] = None):
+        self.result_path = result_path
+        self.manifest = manifest
+        self.done_queue = Queue()
+        # bytes of the dump written down by all shards, used for measuring throughput
+        self.progress = Value("Q", 0)
+
+        stage = manifest.stage("preprocess") if manifest else {}
+        self.completed = manifest.completed("preprocess") if manifest else Intervals()
+        self.states: t.Dict[int, t.Dict[str, int]] = {int(i): state for i, state in stage.get("shards", {}).items()}
+
+        # whatever was written after the last checkpoint is processed again, even if no processor takes
+        # this shard over in this run
+        for index, state in self.states.items():
+            open_writer(shard_path(result_path, index), state).close()
+
+        self.count = 0
+
+    def next(self) -> ShardOutput:
+        index, self.count = self.count, self.count + 1
+        self.states.setdefault(index, {})
+        self.write_list()
+
+        return ShardOutput(
+            index, shard_path(self.result_path, index), self.states[index], self.done_queue, self.progress
+        )
+
+    def write_list(self):
+        path = shard_list_path(self.result_path)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump({"shards": [shard_path(self.result_path, i).name for i in sorted(self.states)]}, file)
+
+        os.replace(temporary, path)
+
+    def record_done(self):
+        updated = False
+        while True:
+            try:
+                index, state, ranges = self.done_queue.get_nowait()
+            except Empty:
+                break
+
+            self.states[index] = state
+            for start, end in ranges:
+                self.completed.add(start, end)
+            updated = True
+
+        if updated and self.manifest:
+            shards = {str(index): state for index, state in self.states.items()}
+            self.manifest.update("preprocess", shards=shards, completed=self.completed.to_list())
+
+    def finish(self):
+        self.record_done()
+        if self.manifest:
+            self.manifest.update("preprocess", done=True)
@@ -0,0 +1,93 @@
+import bz2
+import gzip
+import io
+import lzma
+import typing as t
+from pathlib import Path
+
+from ingest.checkpoint import Intervals
+from ingest.ranges import CHUNK_SIZE, ByteRange
+
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zst")
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in COMPRESSED_SUFFIXES
+
+
+def decompressing_reader(raw: t.BinaryIO, suffix: str) -> t.BinaryIO:
+    # all of them handle concatenated members / streams / frames, as produced by pigz, pbzip2 or zstd -T
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw)
+    if suffix == ".bz2":
+        return bz2.BZ2File(raw)
+    if suffix == ".xz":
+        return lzma.LZMAFile(raw)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Reading .zst dumps requires the zstd extra, install it with `uv sync --extra zstd`")
+
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+
+
+def open_dump(path: Path) -> t.BinaryIO:
+    # binary, line iterable stream of the dump, decompressed on the fly when needed
+    if not is_compressed(path):
+        return open(path, "rb")
+
+    return decompressing_reader(open(path, "rb"), path.suffix)
+
+
+def split_by_gaps(
+    byte_range: ByteRange, lines: t.List[bytes], completed: Intervals
+) -> t.Iterator[t.Tuple[ByteRange, t.List[bytes]]]:
+    # parts of the chunk not processed yet, completed ranges always start and end on a line boundary
+    position, i = byte_range[0], 0
+    for start, end in completed.gaps(byte_range):
+        while position < start:
+            position += len(lines[i])
+            i += 1
+
+        chunk_start, chunk = position, []
+        while position < end:
+            chunk.append(lines[i])
+            position += len(lines[i])
+            i += 1
+
+        yield (chunk_start, position), chunk
+
+
+def iter_stream_chunks(
+    path: Path, completed: t.Optional[Intervals] = None, size: int = CHUNK_SIZE
+) -> t.Iterator[t.Tuple[ByteRange, t.List[bytes], int]]:
+    # line aligned chunks of decompressed dump, byte ranges are offsets in decompressed data, so checkpoints
+    # mean the same thing as for a plain dump. every chunk comes with amount of compressed bytes read so far
+    completed = completed or Intervals()
+    with open(path, "rb") as raw, decompressing_reader(raw, path.suffix) as stream:
+        position, rest = 0, b""
+        while True:
+            data = stream.read(size)
+            if not data:
+                break
+
+            # everything after the last newline goes to the next chunk
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            data, rest = data[:cut], data[cut:]
+            if not data:
+                continue
+
+            # splitlines would also break on \r, only \n ends a line here
+            lines = io.BytesIO(data).readlines()
+            byte_range = (position, position + len(data))
+            position += len(data)
+
+            # resumed run still has to decompress everything before the gap, but nothing else is done with it
+            for gap, chunk in split_by_gaps(byte_range, lines, completed):
+                yield gap, chunk, raw.tell()
+
+        if rest:
+            for gap, chunk in split_by_gaps((position, position + len(rest)), [rest], completed):
+                yield gap, chunk, raw.tell()
@@ -0,0 +1,334 @@
+import json
+import random
+import typing as t
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from tqdm import tqdm
+
+# primary category -> relative share of submissions, roughly as in the snapshot
+PRIMARY_CATEGORIES = {
+    "cs.LG": 9.0,
+    "cs.CV": 6.5,
+    "cs.AI": 3.0,
+    "cs.CL": 4.0,
+    "cs.RO": 1.5,
+    "cs.CR": 1.5,
+    "cs.IT": 2.0,
+    "cs.DS": 1.0,
+    "math.AP": 2.5,
+    "math.PR": 2.5,
+    "math.CO": 2.5,
+    "math.AG": 2.0,
+    "math.NT": 1.5,
+    "math.OC": 2.0,
+    "math.DG": 1.5,
+    "hep-th": 5.0,
+    "hep-ph": 5.5,
+    "hep-ex": 1.5,
+    "gr-qc": 2.5,
+    "quant-ph": 6.5,
+    "astro-ph.GA": 3.0,
+    "astro-ph.CO": 2.5,
+    "astro-ph.SR": 2.5,
+    "astro-ph.HE": 2.0,
+    "cond-mat.mes-hall": 3.0,
+    "cond-mat.mtrl-sci": 3.5,
+    "cond-mat.str-el": 2.5,
+    "cond-mat.stat-mech": 2.0,
+    "cond-mat.supr-con": 1.0,
+    "physics.optics": 2.0,
+    "physics.flu-dyn": 1.0,
+    "nucl-th": 1.5,
+    "stat.ME": 1.5,
+    "stat.ML": 2.0,
+    "eess.SP": 1.5,
+    "eess.IV": 1.0,
+    "q-bio.NC": 0.5,
+    "econ.EM": 0.3,
+    "q-fin.ST": 0.3,
+    "nlin.CD": 0.5,
+}
+# cross-lists mostly stay in the same archive, the rest goes to neighbouring fields
+NEIGHBOURS = {
+    "cs": ["stat.ML", "math.OC", "eess.SP", "cs.NE", "cs.SY"],
+    "math": ["math-ph", "math.FA", "math.CA", "cs.IT", "math.MP"],
+    "hep-th": ["gr-qc", "hep-ph", "math-ph", "cond-mat.str-el"],
+    "hep-ph": ["hep-ex", "hep-lat", "astro-ph.CO", "nucl-th"],
+    "hep-ex": ["hep-ph", "physics.ins-det"],
+    "gr-qc": ["hep-th", "astro-ph.CO", "astro-ph.HE"],
+    "quant-ph": ["cond-mat.mes-hall", "physics.optics", "cs.IT", "math-ph"],
+    "astro-ph": ["gr-qc", "hep-ph", "physics.space-ph"],
+    "cond-mat": ["quant-ph", "physics.comp-ph", "cond-mat.soft"],
+    "physics": ["cond-mat.mtrl-sci", "physics.comp-ph", "quant-ph"],
+    "nucl-th": ["hep-ph", "nucl-ex"],
+    "stat": ["cs.LG", "math.ST", "stat.TH", "stat.CO"],
+    "eess": ["cs.LG", "cs.IT", "cs.CV"],
+    "q-bio": ["cs.LG", "physics.bio-ph"],
+    "econ": ["stat.ME", "q-fin.EC"],
+    "q-fin": ["stat.ME", "econ.EM"],
+    "nlin": ["cond-mat.stat-mech", "math.DS"],
+}
+
+FIRST_NAMES = (
+    "Anna Wei Jan Maria John Yuki Pierre Olga Ahmed Li Piotr Elena David Sofia Hiroshi Carlos Jakub Fatima Lars "
+    "Chen Priya Ivan Laura Kenji Marta Tomasz Amir Julia Alessandro Xin Sarah Mikhail Ana Rafael Ingrid Juan"
+).split()
+LAST_NAMES = (
+    "Smith Wang Kowalski Müller Zhang Nowak Garcia Ivanov Tanaka Rossi Dubois Kim Li Johnson Nguyen Silva Petrov "
+    "Schmidt Liu Novak Lopez Yamamoto Andersson Chen Kumar Popescu Fischer Sato Wiśniewski Hernández Brown Singh "
+    "Zehner Barcicki Schrödinger Erdős Gödel"
+).split()
+# name as it appears in authors string, in latex for the ones that have diacritics
+LATEX_NAMES = {"Müller": 'M\\"uller', "Schrödinger": 'Schr\\"odinger', "Erdős": "Erd\\H{o}s", "Gödel": 'G\\"odel'}
+SUFFIXES = ["", "", "", "", "", "", "", "", "Jr", "III"]
+
+WORDS = (
+    "model models learning neural network networks quantum field theory theories gauge symmetry "
+    "boundary problem problems solution solutions equation equations nonlinear linear stochastic random "
+    "graph graphs algorithm algorithms optimal optimization convex bounds lower upper estimates "
+    "dark matter energy galaxy galaxies cluster clusters star formation black hole holes gravitational waves "
+    "spin chain lattice phase transition transitions topological insulator superconducting magnetic "
+    "deep reinforcement representation representations transformer language vision dataset benchmark "
+    "analysis approach method methods framework efficient robust scalable distributed adaptive "
+    "space spaces manifold manifolds operator operators group groups algebra algebras cohomology "
+    "measurement detector collider decay decays neutrino neutrinos mass masses scattering cross section "
+    "entanglement qubit qubits channel channels error correction coherent states state dynamics evolution "
+    "inference estimation regression classification clustering sparse low rank tensor kernel "
+    "and of for the in on with via from towards beyond using under between"
+).split()
+
+INLINE_MATH = [
+    "$\\alpha$",
+    "$O(n^2)$",
+    "$\\mathbb{R}^d$",
+    "$SU(N)$",
+    "$\\sqrt{s} = 13$ TeV",
+    "$\\mathcal{N}=4$",
+    "$L^p$",
+    "$\\epsilon$-approximation",
+    "$p$-adic",
+    "$z \\sim 2$",
+    "$\\Lambda$CDM",
+    "$k$-means",
+    "$\\ell_1$",
+    "$T_c$",
+]
+LATEX_TEXT = [
+    "\\emph{{{0}}}",
+    "\\textit{{{0}}}",
+    "\\textbf{{{0}}}",
+    "{0}\\footnote{{preliminary}}",
+    "\\cite{{{0}}}",
+    "``{0}''",
+]
+
+JOURNALS = [
+    "Phys. Rev. D {volume} ({year}) {page}",
+    "Phys. Rev. Lett. {volume}, {page} ({year})",
+    "J. High Energy Phys. {volume} ({year}) {page}",
+    "Astrophys. J. {volume}:{page},{year}",
+    "Commun. Math. Phys. {volume} ({year}) {page}-{end}",
+    "Nature {volume}, {page} ({year})",
+    "IEEE Trans. Inf. Theory {volume} ({year}) {page}",
+]
+LICENSES = [
+    None,
+    None,
+    "http://arxiv.org/licenses/nonexclusive-distrib/1.0/",
+    "http://creativecommons.org/licenses/by/4.0/",
+    "http://creativecommons.org/licenses/by-nc-sa/4.0/",
+]
+
+# english names, dump does not depend on the locale it is generated with
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+FIRST_MONTH = datetime(1991, 8, 1)
+LAST_MONTH = datetime(2025, 3, 1)
+NEW_IDS = datetime(2007, 4, 1)  # YYMM.NNNN ids started here, archive/YYMMNNN before
+FIVE_DIGITS = datetime(2015, 1, 1)  # YYMM.NNNNN from here on
+
+
+def format_created(date: datetime) -> str:
+    return f"{WEEKDAYS[date.weekday()]}, {date.day} {MONTHS[date.month - 1]} {date:%Y %H:%M:%S} GMT"
+
+
+def wrap(words: t.List[str], width: int, indent: str = "") -> str:
+    # dump keeps line breaks of the submission form, texts are wrapped at a fixed width
+    lines, line = [], indent
+    for word in words:
+        if len(line) + len(word) > width and line.strip():
+            lines.append(line)
+            line = indent
+        line += word if line == indent else " " + word
+
+    lines.append(line)
+    return "\n".join(lines)
+
+
+class CorpusGenerator:
+    # arxiv-like papers in the order of the snapshot, submission rate grows linearly over time
+    def __init__(self, count: int, seed: int = 0, latex_share: float = 0.3):
+        self.count = count
+        self.random = random.Random(seed)
+        self.latex_share = latex_share
+        self.categories = list(PRIMARY_CATEGORIES)
+        self.weights = list(PRIMARY_CATEGORIES.values())
+        self.month: t.Optional[datetime] = None
+        self.number = 0
+
+    def month_of(self, i: int) -> datetime:
+        # with linear growth, month of the i-th paper goes with the square root of its position
+        months = (LAST_MONTH.year - FIRST_MONTH.year) * 12 + LAST_MONTH.month - FIRST_MONTH.month
+        offset = int(months * (i / max(self.count, 1)) ** 0.5)
+        year, month = divmod(FIRST_MONTH.month - 1 + offset, 12)
+        return datetime(FIRST_MONTH.year + year, month + 1, 1)
+
+    def arxiv_id(self, month: datetime, primary: str) -> str:
+        if month != self.month:
+            self.month, self.number = month, 0
+        self.number += 1
+
+        if month < NEW_IDS:
+            return f"{primary.split('.')[0]}/{month:%y%m}{self.number:03d}"
+        if month < FIVE_DIGITS:
+            return f"{month:%y%m}.{self.number:04d}"
+        return f"{month:%y%m}.{self.number:05d}"
+
+    def pick_categories(self, primary: str) -> str:
+        archive = primary.split(".")[0]
+        categories = [primary]
+        for _ in range(self.random.choices([0, 1, 2, 3], [45, 30, 17, 8])[0]):
+            if self.random.random() < 0.6:
+                same = [category for category in self.categories if category.startswith(archive + ".")]
+                category = self.random.choice(same or NEIGHBOURS[archive])
+            else:
+                category = self.random.choice(NEIGHBOURS[archive])
+
+            if category not in categories:
+                categories.append(category)
+
+        return " ".join(categories)
+
+    def pick_authors(self) -> t.List[t.List[str]]:
+        # most papers have a handful of authors, collaborations have hundreds
+        if self.random.random() < 0.005:
+            amount = self.random.randint(100, 400)
+        else:
+            amount = min(1 + int(self.random.expovariate(1 / 3)), 30)
+
+        authors = []
+        for _ in range(amount):
+            first = self.random.choice(FIRST_NAMES)
+            # initials are at least as common as full first names
+            if self.random.random() < 0.5:
+                first = f"{first[0]}."
+            authors.append([self.random.choice(LAST_NAMES), first, self.random.choice(SUFFIXES)])
+
+        return authors
+
+    def authors_string(self, authors: t.List[t.List[str]]) -> str:
+        names = [
+            f"{first} {LATEX_NAMES.get(last, last)}" + (f" {suffix}" if suffix else "")
+            for last, first, suffix in authors
+        ]
+        if len(names) == 1:
+            return names[0]
+        return ", ".join(names[:-1]) + " and " + names[-1]
+
+    def sentence(self, amount: int, latex: bool) -> t.List[str]:
+        words = [self.random.choice(WORDS) for _ in range(amount)]
+        if latex:
+            for _ in range(self.random.randint(1, 3)):
+                position = self.random.randrange(len(words))
+                if self.random.random() < 0.6:
+                    words[position] = self.random.choice(INLINE_MATH)
+                else:
+                    words[position] = self.random.choice(LATEX_TEXT).format(words[position])
+
+        return words
+
+    def title(self) -> str:
+        words = self.sentence(self.random.randint(4, 16), self.random.random() < self.latex_share)
+        words[0] = words[0][:1].upper() + words[0][1:]
+        return wrap(words, 70, "  ").strip()
+
+    def abstract(self) -> str:
+        latex = self.random.random() < self.latex_share
+        words = []
+        for _ in range(self.random.randint(3, 10)):
+            sentence = self.sentence(self.random.randint(8, 28), latex and self.random.random() < 0.5)
+            sentence[0] = sentence[0][:1].upper() + sentence[0][1:]
+            sentence[-1] += "."
+            words.extend(sentence)
+
+        # every abstract in the dump starts with two spaces and ends with a newline
+        return wrap(words, 80, "  ") + "\n"
+
+    def versions(self, month: datetime) -> t.Tuple[t.List[t.Dict[str, str]], datetime]:
+        created = month + timedelta(days=self.random.randint(0, 27), seconds=self.random.randint(0, 86_399))
+        amount = min(1 + int(self.random.expovariate(1 / 0.7)), 12)
+
+        versions = []
+        for i in range(amount):
+            if i > 0:
+                created += timedelta(days=self.random.randint(1, 400), seconds=self.random.randint(0, 86_399))
+            versions.append({"version": f"v{i + 1}", "created": format_created(created)})
+
+        return versions, created
+
+    def comments(self) -> t.Optional[str]:
+        if self.random.random() < 0.25:
+            return None
+
+        comment = f"{self.random.randint(4, 60)} pages"
+        if self.random.random() < 0.7:
+            comment += f", {self.random.randint(1, 15)} figures"
+        if self.random.random() < 0.15:
+            comment += ", to appear in $\\mathcal{N}$ proceedings"
+        return comment
+
+    def journal_ref(self, year: int) -> t.Optional[str]:
+        if self.random.random() < 0.6:
+            return None
+
+        page = self.random.randint(1, 9999)
+        journal = self.random.choice(JOURNALS)
+        return journal.format(volume=self.random.randint(1, 999), year=year, page=page, end=page + 20)
+
+    def paper(self, i: int) -> t.Dict[str, t.Any]:
+        month = self.month_of(i)
+        primary = self.random.choices(self.categories, self.weights)[0]
+        authors = self.pick_authors()
+        versions, last = self.versions(month)
+        update_date = last + timedelta(days=self.random.randint(0, 30))
+
+        return {
+            "id": self.arxiv_id(month, primary),
+            # there are few papers without submitter, processors skip them
+            "submitter": None if self.random.random() < 0.001 else " ".join(reversed(authors[0][:2])),
+            "authors": self.authors_string(authors),
+            "title": self.title(),
+            "comments": self.comments(),
+            "journal-ref": self.journal_ref(month.year + 1),
+            "doi": f"10.{self.random.randint(1000, 9999)}/{i:x}" if self.random.random() < 0.45 else None,
+            "report-no": f"CERN-TH-{month.year}-{i % 300:03d}" if self.random.random() < 0.05 else None,
+            "categories": self.pick_categories(primary),
+            "license": self.random.choice(LICENSES),
+            "abstract": self.abstract(),
+            "versions": versions,
+            "update_date": f"{update_date:%Y-%m-%d}",
+            "authors_parsed": authors,
+        }
+
+    def __iter__(self) -> t.Iterator[t.Dict[str, t.Any]]:
+        for i in range(self.count):
+            yield self.paper(i)
+
+
+def write_corpus(path: Path, count: int, seed: int = 0, latex_share: float = 0.3):
+    # same layout as the snapshot, one compact json object per line
+    with open(path, "w") as file:
+        for paper in tqdm(CorpusGenerator(count, seed, latex_share), total=count, desc="Generating"):
+            file.write(json.dumps(paper, separators=(",", ":")) + "\n")
@@ -0,0 +1,37 @@
+import re
+import typing as t
+from functools import lru_cache
+
+from pylatexenc.latex2text import LatexNodes2Text
+
+# everything LatexNodes2Text does anything with, checked against every printable ascii character.
+# strings without any of these come out of latex_to_text unchanged, so there is no point in parsing them
+LATEX_MARKERS = re.compile(r"[\\$%&`{}~]|''|--")
+
+
+def collapse_whitespace(content: str) -> str:
+    content = content.replace("\n", " ")
+    return " ".join([i for i in content.split(" ") if len(i) > 0])  # remove multiple spaces
+
+
+class TextNormalizer:
+    def __init__(self, cache_size: int = 1 << 16, max_cached_length: int = 256):
+        self.latex_context = LatexNodes2Text()
+        self.max_cached_length = max_cached_length
+        self._cached = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, content: str) -> str:
+        if LATEX_MARKERS.search(content) is not None:
+            content = str(self.latex_context.latex_to_text(content))
+
+        return collapse_whitespace(content)
+
+    def __call__(self, content: str) -> str:
+        # abstracts are almost never repeated, caching them would only push out titles and comments
+        if len(content) > self.max_cached_length:
+            return self._normalize(content)
+
+        return self._cached(content)
+
+    def cache_info(self) -> t.NamedTuple:
+        return self._cached.cache_info()
@@ -0,0 +1,38 @@
+import re
+import typing as t
+
+# names of year partitions are the only thing search and ingest have to agree on about partitioned indices,
+# this module is shared by both and imports neither
+OPEN_END = "latest"
+PARTITION_NAME = re.compile(r"^(?P<base>.+)-y(?P<start>\d{4})-(?P<end>\d{4}|latest)$")
+
+YearRange = t.Tuple[int, t.Optional[int]]
+
+
+def partition_name(index: str, year_range: YearRange) -> str:
+    start, end = year_range
+    return f"{index}-y{start}-{OPEN_END if end is None else end}"
+
+
+def parse_partition(name: str) -> t.Optional[t.Tuple[str, YearRange]]:
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+
+    end = match["end"]
+    return match["base"], (int(match["start"]), None if end == OPEN_END else int(end))
+
+
+def overlapping(indices: t.Iterable[str], year_start: int, year_end: int) -> t.Optional[t.List[str]]:
+    # partitions that can hold papers created in [year_start, year_end], None when indices are not partitioned
+    found = []
+    for name in indices:
+        parsed = parse_partition(name)
+        if parsed is None:
+            return None
+
+        _, (start, end) = parsed
+        if start <= year_end and (end is None or end >= year_start):
+            found.append(name)
+
+    return found
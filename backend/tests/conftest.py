@@ -0,0 +1,19 @@
+import pytest
+
+import arxivsearch.database.helpers as helpers
+
+
+@pytest.fixture
+def categories(monkeypatch):
+    # categories are normally read from postgres on first use, these are enough to validate queries
+    monkeypatch.setattr(
+        helpers,
+        "parsed_categories",
+        {
+            "cs": {
+                "name": "Computer Science",
+                "subcategories": {"AI": {"id": "cs.AI", "name": "Artificial Intelligence"}},
+            },
+            "math": {"name": "Mathematics", "subcategories": {"CO": {"id": "math.CO", "name": "Combinatorics"}}},
+        },
+    )
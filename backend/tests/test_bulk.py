@@ -0,0 +1,68 @@
+import logging
+
+from ingest.checkpoint import Manifest
+from ingest.elastic import BulkLoader
+from ingest.metrics import WorkerMetrics
+from ingest.records import JsonLinesFile
+
+
+class BrokenElastic:
+    # indexes everything, except bulks with a poisoned document fail as a whole
+    def bulk(self, operations):
+        sources = operations[1::2]
+        if any(source.get("poisoned") for source in sources):
+            raise RuntimeError("mapper_parsing_exception")
+
+        return {"items": [{"index": {"status": 201}} for _ in sources]}
+
+
+def actions(count: int):
+    for i in range(count):
+        source = {"title": f"paper {i}", "poisoned": i == 3}
+        yield (i * 10, i * 10 + 10), {"_index": "arxiv", "_id": str(i), "_source": source}
+
+
+def test_failed_chunks_are_reported_and_checkpointed(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_text("{}\n")
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.reset(dump)
+
+    loader = BulkLoader(BrokenElastic(), logging.getLogger("test"), threads=2, manifest=manifest)
+    loader.sizer.size = 2
+    report = loader.load(actions(10))
+
+    assert report.indexed == 8
+    assert sorted(action["_id"] for action, _ in report.failed) == ["2", "3"]
+    assert all(error == "mapper_parsing_exception" for _, error in report.failed)
+    assert Manifest(tmp_path / "manifest.json").completed("elastic").to_list() == [[0, 100]]
+
+
+def test_loader_counts_records_errors_and_bytes(tmp_path):
+    path = tmp_path / "papers.jsonl"
+    path.write_bytes(b"x" * 9 + b"\n" * 91)
+    metrics = WorkerMetrics("elastic")
+    loader = BulkLoader(
+        BrokenElastic(), logging.getLogger("test"), threads=2, metrics=metrics, source=JsonLinesFile(path)
+    )
+    loader.sizer.size = 2
+    loader.load(actions(10))
+
+    values = metrics.snapshot()
+    assert (values["records"], values["errors"], values["bytes"]) == (8, 2, 100)
+
+
+def test_interleaved_spans_are_checkpointed_apart(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_text("{}\n")
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.reset(dump)
+
+    # two readers, each one going through its own half of the file
+    first, second = list(actions(4)), [((span[0] + 100, span[1] + 100), action) for span, action in actions(3)]
+    interleaved = [action for pair in zip(first, second) for action in pair] + first[3:]
+    loader = BulkLoader(BrokenElastic(), logging.getLogger("test"), threads=1, manifest=manifest)
+    loader.sizer.size = 3
+    loader.load(iter(interleaved))
+
+    assert Manifest(tmp_path / "manifest.json").completed("elastic").to_list() == [[0, 40], [100, 130]]
@@ -0,0 +1,105 @@
+import asyncio
+import sqlite3
+import time
+
+from arxivsearch.cache import DiskBackend, MemoryBackend, ResponseCache
+
+
+def stored_bytes(backend: DiskBackend) -> int:
+    return backend.connection.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()[0]
+
+
+def test_disk_size_follows_inserts_replaces_and_evictions(tmp_path):
+    backend = DiskBackend(tmp_path / "cache.sqlite", max_bytes=100)
+    backend.set("a", b"x" * 30, ttl=60)
+    backend.set("b", b"x" * 30, ttl=60)
+    backend.set("a", b"x" * 10, ttl=60)
+    assert backend.size() == stored_bytes(backend) == 40
+
+    backend.set("c", b"x" * 50, ttl=60)
+    backend.set("d", b"x" * 40, ttl=60)
+    assert backend.size() == stored_bytes(backend) <= 100
+    assert backend.get("c") == b"x" * 50
+    assert backend.get("d") == b"x" * 40
+
+
+def test_disk_evicts_least_recently_used_first(tmp_path):
+    backend = DiskBackend(tmp_path / "cache.sqlite", max_bytes=30)
+    backend.set("a", b"x" * 10, ttl=60)
+    time.sleep(0.01)
+    backend.set("b", b"x" * 10, ttl=60)
+    time.sleep(0.01)
+    backend.set("c", b"x" * 10, ttl=60)
+    time.sleep(0.01)
+    assert backend.get("a") is not None
+    time.sleep(0.01)
+
+    backend.set("d", b"x" * 10, ttl=60)
+    assert backend.get("b") is None
+    assert [backend.get(key) is not None for key in "acd"] == [True, True, True]
+    assert backend.size() == stored_bytes(backend) == 30
+
+
+def test_disk_expired_entries_are_dropped(tmp_path):
+    backend = DiskBackend(tmp_path / "cache.sqlite", max_bytes=100)
+    backend.set("old", b"x" * 10, ttl=-1)
+    assert backend.get("old") is None
+
+    backend.set("new", b"x" * 10, ttl=60)
+    assert backend.size() == stored_bytes(backend) == 10
+
+
+def test_disk_counts_entries_written_before_the_counter(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, used REAL NOT NULL)"
+    )
+    connection.execute("INSERT INTO responses VALUES ('a', ?, ?, ?)", (b"x" * 25, time.time() + 60, time.time()))
+    connection.commit()
+    connection.close()
+
+    backend = DiskBackend(path, max_bytes=100)
+    assert backend.size() == 25
+    assert DiskBackend(path, max_bytes=100).size() == 25
+
+
+def test_response_cache_counts_hits_and_misses(tmp_path):
+    async def run(cache: ResponseCache):
+        key = cache.key("search", {"query": "x"}, 1)
+        assert await cache.get(key) is None
+        await cache.set(key, b"response")
+        assert await cache.get(key) == b"response"
+        return await cache.stats()
+
+    for backend in (MemoryBackend(100), DiskBackend(tmp_path / "cache.sqlite", 100)):
+        stats = asyncio.run(run(ResponseCache(backend, ttl=60)))
+        assert (stats["hits"], stats["misses"], stats["bytes"]) == (1, 1, 8)
+
+
+def test_key_depends_on_generation():
+    assert ResponseCache.key("search", {"a": 1}, 1) != ResponseCache.key("search", {"a": 1}, 2)
+    assert ResponseCache.key("search", {"a": 1, "b": 2}, 1) == ResponseCache.key("search", {"b": 2, "a": 1}, 1)
+
+
+class LockedBackend:
+    blocking = True
+
+    def get(self, key: str):
+        raise sqlite3.OperationalError("database is locked")
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise sqlite3.OperationalError("database is locked")
+
+    def size(self) -> int:
+        return 0
+
+
+def test_backend_errors_are_misses_and_skipped_writes():
+    async def run(cache: ResponseCache):
+        assert await cache.get("search:key") is None
+        await cache.set("search:key", b"response")
+        return await cache.stats()
+
+    stats = asyncio.run(run(ResponseCache(LockedBackend(), ttl=60)))
+    assert (stats["hits"], stats["misses"], stats["errors"]) == (0, 1, 2)
@@ -0,0 +1,83 @@
+from ingest.checkpoint import Intervals, Manifest
+
+
+def test_intervals_merge_touching_and_overlapping():
+    intervals = Intervals([(10, 20), (30, 40)])
+    intervals.add(20, 25)
+    intervals.add(35, 50)
+    assert intervals.to_list() == [[10, 25], [30, 50]]
+
+    intervals.add(0, 100)
+    assert intervals.to_list() == [[0, 100]]
+
+
+def test_intervals_ignore_empty_ranges():
+    intervals = Intervals()
+    intervals.add(5, 5)
+    intervals.add(7, 3)
+    assert intervals.to_list() == []
+
+
+def test_intervals_gaps_and_covers():
+    intervals = Intervals([(10, 20), (30, 40)])
+    assert intervals.gaps((0, 50)) == [(0, 10), (20, 30), (40, 50)]
+    assert intervals.gaps((12, 35)) == [(20, 30)]
+    assert intervals.covers((10, 20))
+    assert intervals.covers((32, 38))
+    assert not intervals.covers((15, 25))
+
+
+def test_intervals_watermark_and_total():
+    intervals = Intervals([(0, 10), (20, 30)])
+    assert intervals.watermark() == 10
+    assert intervals.watermark(20) == 30
+    assert intervals.watermark(15) == 15
+    assert intervals.total() == 20
+
+
+def test_manifest_resumes_same_dump(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_text("{}\n")
+    path = tmp_path / "manifest.json"
+
+    manifest = Manifest(path)
+    manifest.reset(dump, workers=4)
+    manifest.update("elastic", completed=Intervals([(0, 10), (10, 20)]).to_list())
+
+    resumed = Manifest(path)
+    assert resumed.matches(dump)
+    assert resumed.data["workers"] == 4
+    assert resumed.completed("elastic").to_list() == [[0, 20]]
+    assert not resumed.is_done("elastic")
+    assert resumed.completed("postgres").to_list() == []
+
+
+def test_manifest_does_not_resume_changed_or_finished_dump(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_text("{}\n")
+    path = tmp_path / "manifest.json"
+
+    manifest = Manifest(path)
+    manifest.reset(dump)
+    dump.write_text("{}\n{}\n")
+    assert not Manifest(path).matches(dump)
+
+    manifest.reset(dump)
+    manifest.finish()
+    assert not Manifest(path).matches(dump)
+
+
+def test_manifest_reset_stage(tmp_path):
+    dump = tmp_path / "dump.json"
+    dump.write_text("{}\n")
+    path = tmp_path / "manifest.json"
+
+    manifest = Manifest(path)
+    manifest.reset(dump)
+    manifest.update("elastic", done=True, completed=[[0, 3]])
+    manifest.reset_stage("elastic")
+
+    resumed = Manifest(path)
+    assert not resumed.is_done("elastic")
+    assert resumed.completed("elastic").to_list() == []
+    assert not (tmp_path / "manifest.json.tmp").exists()
@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from arxivsearch.routes.search import decode_cursor, encode_cursor
+
+
+def raw_cursor(state) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("pit-id", [12.5, 7], 3)
+    assert decode_cursor(cursor) == {"pit": "pit-id", "after": [12.5, 7], "page": 3}
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        "not base64 !",
+        base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+        raw_cursor({}),
+        raw_cursor([1, 2]),
+        raw_cursor("pit"),
+        raw_cursor({"pit": "p", "after": [1]}),
+        raw_cursor({"pit": 1, "after": [1], "page": 0}),
+        raw_cursor({"pit": "p", "after": 1, "page": 0}),
+        raw_cursor({"pit": "p", "after": {"a": 1}, "page": 0}),
+        raw_cursor({"pit": "p", "after": [1], "page": "0"}),
+        raw_cursor({"pit": "p", "after": [1], "page": None}),
+    ],
+)
+def test_invalid_cursor_is_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
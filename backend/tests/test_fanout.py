@@ -0,0 +1,83 @@
+import logging
+import pickle
+import typing as t
+from multiprocessing import Queue, Value
+
+import pytest
+
+from ingest.checkpoint import Intervals
+from ingest.elastic import BulkLoader
+from ingest.fanout import FANOUT_CHUNK_SIZE, ElasticSink, Sink, feed
+from ingest.metrics import WorkerMetrics
+
+
+class ListSink(Sink):
+    stage = "list"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written: t.List[dict] = []
+
+    def write(self, records: t.List[dict]):
+        self.written.extend(records)
+
+
+def test_sink_without_write_cannot_be_created():
+    class Incomplete(Sink):
+        stage = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete(Queue(), Queue(), Value("Q", 0))
+
+
+def test_sink_skips_completed_records_and_reports_every_chunk():
+    buffer, done_queue, progress = Queue(), Queue(), Value("Q", 0)
+    for chunk in ([((0, 1), {"id": "a"}), ((1, 2), {"id": "b"})], [((2, 3), {"id": "c"})]):
+        buffer.put(pickle.dumps(chunk))
+    buffer.put(None)
+
+    sink = ListSink(buffer, done_queue, progress, completed=Intervals([(0, 1)]))
+    sink.run()
+
+    assert sink.written == [{"id": "b"}, {"id": "c"}]
+    assert [done_queue.get(timeout=1) for _ in range(2)] == [("list", (0, 2)), ("list", (2, 3))]
+    assert progress.value == 3
+
+
+def broken_chunks():
+    # first chunk is fine, the file is cut short right after it
+    yield pickle.dumps([((i, i + 1), {"id": str(i)}) for i in range(FANOUT_CHUNK_SIZE)])
+    raise ValueError("truncated record")
+
+
+def test_sinks_get_none_when_reading_fails():
+    sinks = [ListSink(Queue(), Queue(), Value("Q", 0)) for _ in range(2)]
+    errors = []
+    feed(broken_chunks(), sinks, WorkerMetrics("feed"), errors)
+
+    for sink in sinks:
+        assert len(pickle.loads(sink.buffer.get(timeout=1))) == FANOUT_CHUNK_SIZE
+        assert sink.buffer.get(timeout=1) is None
+    assert [str(error) for error in errors] == ["truncated record"]
+
+
+class PoisonedElastic:
+    def bulk(self, operations):
+        sources = operations[1::2]
+        if any(source.get("poisoned") for source in sources):
+            raise RuntimeError("mapper_parsing_exception")
+
+        return {"items": [{"index": {"status": 201}} for _ in sources]}
+
+
+def test_elastic_sink_reports_failed_parts_and_goes_on(tmp_path):
+    logger = logging.getLogger("test")
+    sink = ElasticSink([], "arxiv", logger, tmp_path / "failed.jsonl", Queue(), Queue(), Value("Q", 0))
+    sink.loader = BulkLoader(PoisonedElastic(), logger)
+    sink.loader.sizer.size = 2
+
+    sink.write([{"id": str(i), "poisoned": i == 2} for i in range(6)])
+
+    assert sink.loader.report.indexed == 4
+    assert sorted(action["_id"] for action, _ in sink.loader.report.failed) == ["2", "3"]
+    assert sink.metrics.snapshot()["errors"] == 2
@@ -0,0 +1,46 @@
+import pytest
+from pydantic import ValidationError
+
+from arxivsearch.routes.models import FacetBy, SearchQuery
+
+
+def test_normalized_equal_queries_look_the_same(categories):
+    first = SearchQuery(
+        search="  Graph   Neural Networks ",
+        author=" Geoffrey  Hinton ",
+        subject=["math.CO", "cs.AI", "cs.AI"],
+        facet_by=[
+            FacetBy(field="categories", value="cs.AI"),
+            FacetBy(field="authors", value="A"),
+            FacetBy(field="categories", value="cs.AI"),
+        ],
+    )
+    second = SearchQuery(
+        search="graph neural networks",
+        author="Geoffrey Hinton",
+        subject=["cs.AI", "math.CO"],
+        facet_by=[FacetBy(field="authors", value="A"), FacetBy(field="categories", value="cs.AI")],
+    )
+
+    assert first.normalized().model_dump() == second.normalized().model_dump()
+    assert first.normalized().search == "graph neural networks"
+    assert first.normalized().subject == ["cs.AI", "math.CO"]
+    assert [(facet.field, facet.value) for facet in first.normalized().facet_by] == [
+        ("authors", "A"),
+        ("categories", "cs.AI"),
+    ]
+
+
+def test_normalized_blank_author_is_none(categories):
+    assert SearchQuery(search="x", author="   ").normalized().author is None
+    assert SearchQuery(search="x").normalized().author is None
+
+
+def test_normalized_keeps_other_fields(categories):
+    query = SearchQuery(search="x", year_start=2001, year_end=2005, published=True).normalized()
+    assert (query.year_start, query.year_end, query.published) == (2001, 2005, True)
+
+
+def test_invalid_subject_is_rejected(categories):
+    with pytest.raises(ValidationError):
+        SearchQuery(search="x", subject=["nope"])
@@ -0,0 +1,23 @@
+from ingest.partitions import Partitioning, find_partitioning
+from partition_names import overlapping, parse_partition
+
+
+def test_partition_names_round_trip():
+    partitioning = Partitioning([2000, 2010, 2020])
+    names = partitioning.indices("arxiv")
+
+    assert names == ["arxiv-y2000-2009", "arxiv-y2010-2019", "arxiv-y2020-latest"]
+    assert [parse_partition(name) for name in names] == [
+        ("arxiv", (2000, 2009)),
+        ("arxiv", (2010, 2019)),
+        ("arxiv", (2020, None)),
+    ]
+    assert find_partitioning(names)[1].starts == partitioning.starts
+
+
+def test_overlapping_partitions():
+    names = Partitioning([2000, 2010, 2020]).indices("arxiv")
+
+    assert overlapping(names, 2009, 2010) == ["arxiv-y2000-2009", "arxiv-y2010-2019"]
+    assert overlapping(names, 2030, 2040) == ["arxiv-y2020-latest"]
+    assert overlapping(["arxiv-1700000000"], 2000, 2010) is None
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, inspect
+
+from ingest.postgres import drop_indexes
+
+
+def papers_table() -> Table:
+    return Table(
+        "arxiv_papers",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("arxiv_id", String, index=True),
+        Column("doi", String, index=True),
+    )
+
+
+def index_names(engine) -> set:
+    return {index["name"] for index in inspect(engine).get_indexes("arxiv_papers")}
+
+
+def test_drop_indexes_keeps_and_restores_kept_columns():
+    engine = create_engine("sqlite://")
+    table = papers_table()
+    table.metadata.create_all(engine)
+
+    dropped = drop_indexes(engine, table)
+    assert {index.name for index in dropped} == {"ix_arxiv_papers_arxiv_id", "ix_arxiv_papers_doi"}
+    assert index_names(engine) == set()
+
+    # resumed run after a crash, arxiv_id index was dropped by the previous one and comes back
+    dropped = drop_indexes(engine, table, keep=["arxiv_id"])
+    assert {index.name for index in dropped} == {"ix_arxiv_papers_doi"}
+    assert index_names(engine) == {"ix_arxiv_papers_arxiv_id"}
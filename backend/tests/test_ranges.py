@@ -0,0 +1,50 @@
+import mmap
+
+import pytest
+
+from ingest.ranges import iter_chunks, iter_range, split_into_ranges
+
+LINES = [b'{"id": "%d", "abstract": "%s"}\n' % (i, b"x" * (i % 7 * 10)) for i in range(100)]
+
+
+def read_ranges(path, ranges):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [list(iter_range(mm, byte_range)) for byte_range in ranges]
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 8, 500])
+def test_ranges_cover_every_line_once(tmp_path, parts):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b"".join(LINES))
+    ranges = split_into_ranges(path, parts)
+
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == 0 and ranges[-1][1] == path.stat().st_size
+    assert all(previous[1] == following[0] for previous, following in zip(ranges, ranges[1:]))
+    assert [line for lines in read_ranges(path, ranges) for line in lines] == LINES
+
+
+def test_last_line_without_newline(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b"".join(LINES) + b'{"id": "last"}')
+    ranges = split_into_ranges(path, 4)
+    assert [line for lines in read_ranges(path, ranges) for line in lines] == [*LINES, b'{"id": "last"}']
+
+
+def test_empty_file_has_no_ranges(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b"")
+    assert split_into_ranges(path, 4) == []
+
+
+def test_chunks_are_line_aligned(tmp_path):
+    path = tmp_path / "dump.json"
+    path.write_bytes(b"".join(LINES))
+    data = path.read_bytes()
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunks = list(iter_chunks(mm, (0, len(data)), size=200))
+
+    assert len(chunks) > 1
+    for (start, end), lines in chunks:
+        assert b"".join(lines) == data[start:end]
+    assert [line for _, lines in chunks for line in lines] == LINES
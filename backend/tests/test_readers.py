@@ -0,0 +1,52 @@
+import json
+import pickle
+
+import pytest
+
+from ingest.checkpoint import Intervals
+from ingest.readers import read_in_parallel, todo_spans
+from ingest.records import SHARDS_SUFFIX, open_processed
+from ingest.scheduler import PipelineError
+
+
+def write_shards(tmp_path, shards: int, records: int):
+    names = []
+    for shard in range(shards):
+        name = f"papers-{shard}.jsonl"
+        lines = [json.dumps({"id": f"{shard}.{i}"}) + "\n" for i in range(records)]
+        (tmp_path / name).write_text("".join(lines))
+        names.append(name)
+
+    path = tmp_path / f"papers{SHARDS_SUFFIX}"
+    path.write_text(json.dumps({"shards": names}))
+    return path
+
+
+def test_every_record_is_read_once_by_some_reader(tmp_path):
+    path = write_shards(tmp_path, shards=3, records=50)
+    with open_processed(path) as source:
+        # first shard is already loaded
+        spans = todo_spans(source, Intervals([(0, source.starts[1])]), readers=2)
+
+    chunks = [pickle.loads(data) for data in read_in_parallel(path, spans, readers=2, chunk_size=7)]
+
+    assert len(chunks) > 2
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    ids = sorted(record["id"] for chunk in chunks for _, record in chunk)
+    assert ids == sorted(f"{shard}.{i}" for shard in (1, 2) for i in range(50))
+
+
+def test_failed_reader_is_raised_after_the_rest_is_read(tmp_path):
+    path = write_shards(tmp_path, shards=2, records=20)
+    with open(tmp_path / "papers-1.jsonl", "a") as file:
+        file.write("{truncated\n")
+
+    with open_processed(path) as source:
+        spans = source.split(2)
+
+    ids = []
+    with pytest.raises(PipelineError, match="1 out of 2 readers"):
+        for data in read_in_parallel(path, spans, readers=2):
+            ids.extend(record["id"] for _, record in pickle.loads(data))
+
+    assert sorted(ids) == sorted(f"0.{i}" for i in range(20))
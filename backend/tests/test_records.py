@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from ingest.records import (
+    FORMAT_VERSION,
+    LENGTH,
+    PROCESSED_FIELDS,
+    SHARDS_SUFFIX,
+    RecordFile,
+    RecordWriter,
+    encode_tuples,
+    meta_path,
+    open_processed,
+)
+
+
+def record(i: int) -> dict:
+    return {
+        **{field: f"{field} {i}" for field in PROCESSED_FIELDS},
+        "authors": [f"Author {i}", "Someone Else"],
+        "categories": ["cs.AI", f"math.CO{i % 2}"],
+        "doi": None,
+    }
+
+
+def write(path, records, state=None):
+    writer = RecordWriter(path, state)
+    writer.write(encode_tuples(records))
+    state = writer.sync()
+    writer.close()
+    return state
+
+
+def test_written_records_read_back(tmp_path):
+    path = tmp_path / "papers.bin"
+    records = [record(i) for i in range(5)]
+    write(path, records)
+
+    source = RecordFile(path)
+    assert len(source) == 5
+    assert [paper for _, paper in source.read((0, 5))] == records
+    assert source[3] == records[3]
+    assert source.categories == ["cs.AI", "math.CO0", "math.CO1"]
+
+
+def test_records_are_stored_with_pinned_pickle_protocol(tmp_path):
+    path = tmp_path / "papers.bin"
+    write(path, [record(0)])
+    data = path.read_bytes()
+    assert data[LENGTH.size : LENGTH.size + 2] == b"\x80\x05"
+
+
+def test_resumed_writer_appends(tmp_path):
+    path = tmp_path / "papers.bin"
+    state = write(path, [record(0), record(1)])
+    write(path, [record(2)], state)
+    assert [paper for _, paper in RecordFile(path).read((0, 3))] == [record(i) for i in range(3)]
+
+
+@pytest.mark.parametrize("version", [1, FORMAT_VERSION + 1, None])
+def test_other_format_versions_are_refused(tmp_path, version):
+    path = tmp_path / "papers.bin"
+    state = write(path, [record(0)])
+    meta = json.loads(meta_path(path).read_text())
+    meta["version"] = version
+    meta_path(path).write_text(json.dumps(meta))
+
+    with pytest.raises(ValueError, match="Unsupported format version"):
+        RecordFile(path)
+    with pytest.raises(ValueError, match="Unsupported format version"):
+        RecordWriter(path, state)
+
+
+def test_nbytes_of_records_add_up_to_the_file(tmp_path):
+    path = tmp_path / "papers.bin"
+    write(path, [record(i) for i in range(6)])
+    source = RecordFile(path)
+
+    assert source.nbytes((0, 6)) == path.stat().st_size
+    assert source.nbytes((0, 2)) + source.nbytes((2, 6)) == path.stat().st_size
+    assert source.nbytes((3, 3)) == 0
+
+
+def test_closed_with_the_files_it_maps(tmp_path):
+    for name in ("a.bin", "b.bin"):
+        write(tmp_path / name, [record(0), record(1)])
+    path = tmp_path / f"papers{SHARDS_SUFFIX}"
+    path.write_text(json.dumps({"shards": ["a.bin", "b.bin"]}))
+
+    with open_processed(path) as source:
+        assert source.count() == 4
+        shards = source.shards
+
+    for shard in shards:
+        assert shard.file.closed and shard.mm.closed
@@ -0,0 +1,72 @@
+import bz2
+import gzip
+import lzma
+import typing as t
+
+import pytest
+
+from ingest.checkpoint import Intervals
+from ingest.streams import is_compressed, iter_stream_chunks, open_dump
+
+LINES = [b'{"id": "%d", "title": "paper number %d"}\n' % (i, i) for i in range(200)]
+DATA = b"".join(LINES)
+
+COMPRESSORS: t.Dict[str, t.Callable[[bytes], bytes]] = {
+    ".gz": gzip.compress,
+    ".bz2": bz2.compress,
+    ".xz": lzma.compress,
+}
+
+
+def write_dump(tmp_path, suffix: str, data: bytes = DATA):
+    path = tmp_path / f"dump.json{suffix}"
+    if suffix:
+        # two members, the way parallel compressors write them
+        half = len(data) // 2
+        path.write_bytes(COMPRESSORS[suffix](data[:half]) + COMPRESSORS[suffix](data[half:]))
+    else:
+        path.write_bytes(data)
+    return path
+
+
+@pytest.mark.parametrize("suffix", ["", *COMPRESSORS])
+def test_open_dump_reads_every_line(tmp_path, suffix):
+    path = write_dump(tmp_path, suffix)
+    assert is_compressed(path) == bool(suffix)
+    with open_dump(path) as dump:
+        assert list(dump) == LINES
+
+
+@pytest.mark.parametrize("suffix", COMPRESSORS)
+def test_chunks_are_line_aligned_offsets_into_decompressed_data(tmp_path, suffix):
+    path = write_dump(tmp_path, suffix)
+    chunks = list(iter_stream_chunks(path, size=100))
+
+    position = 0
+    for (start, end), lines, _ in chunks:
+        assert start == position
+        assert b"".join(lines) == DATA[start:end]
+        assert all(line.endswith(b"\n") for line in lines)
+        position = end
+
+    assert position == len(DATA)
+    assert [line for _, lines, _ in chunks for line in lines] == LINES
+
+
+@pytest.mark.parametrize("suffix", COMPRESSORS)
+def test_resumed_chunks_skip_completed_ranges(tmp_path, suffix):
+    path = write_dump(tmp_path, suffix)
+    first = [byte_range for byte_range, _, _ in iter_stream_chunks(path, size=100)]
+    completed = Intervals(first[::2])
+
+    resumed = list(iter_stream_chunks(path, completed, size=100))
+    assert [byte_range for byte_range, _, _ in resumed] == first[1::2]
+    for (start, end), lines, _ in resumed:
+        assert b"".join(lines) == DATA[start:end]
+
+
+def test_last_line_without_newline(tmp_path):
+    path = write_dump(tmp_path, ".gz", DATA + b'{"id": "last"}')
+    chunks = list(iter_stream_chunks(path, size=100))
+    assert chunks[-1][0][1] == len(DATA) + len(b'{"id": "last"}')
+    assert chunks[-1][1][-1] == b'{"id": "last"}'
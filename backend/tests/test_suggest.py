@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from arxivsearch.suggest import PrefixIndex, suggest_categories
+
+AUTHORS = [
+    ("Li", 5),
+    ("Wu", 3),
+    ("Xu", 4),
+    ("Liu Yang", 50),
+    ("Lin Wei", 40),
+    ("Wei Li", 30),
+    ("Xiao Liu", 20),
+    ("Wu Xiang", 25),
+    ("Xu Wen", 15),
+    ("Geoffrey Hinton", 100),
+]
+
+
+@pytest.mark.parametrize("max_scan", [0, 1, 2, 1000])
+def test_short_surnames_do_not_hide_longer_ones(max_scan):
+    index = PrefixIndex(AUTHORS, max_scan=max_scan)
+    assert index.search("liu", 10) == ["Liu Yang", "Xiao Liu"]
+    assert index.search("lin", 10) == ["Lin Wei"]
+    assert index.search("li", 10) == ["Liu Yang", "Lin Wei", "Wei Li", "Xiao Liu", "Li"]
+    assert index.search("wu", 10) == ["Wu Xiang", "Wu"]
+    assert index.search("xu", 10) == ["Xu Wen", "Xu"]
+    assert index.search("x", 10) == ["Wu Xiang", "Xiao Liu", "Xu Wen", "Xu"]
+
+
+@pytest.mark.parametrize("max_scan", [0, 1000])
+def test_search_by_start_and_last_word(max_scan):
+    index = PrefixIndex(AUTHORS, max_scan=max_scan)
+    assert index.search("Geoffrey  H", 10) == ["Geoffrey Hinton"]
+    assert index.search("hint", 10) == ["Geoffrey Hinton"]
+    assert index.search("zz", 10) == []
+    assert index.search("  ", 10) == []
+    assert index.search("l", 2) == ["Liu Yang", "Lin Wei"]
+
+
+def test_deep_prefixes_rank_by_papers_not_alphabet():
+    # common surname with far more names than one scan may look at, the best ones sort last
+    authors = [(f"Wang A{i:05d}", 1) for i in range(5000)] + [("Wang Zhi", 90), ("Wang Zoe", 80)]
+    random.Random(0).shuffle(authors)
+    index = PrefixIndex(authors, top=3, max_scan=100)
+
+    assert "wang" in index.ranked
+    assert index.search("wang", 2) == ["Wang Zhi", "Wang Zoe"]
+    assert index.search("wang ", 2) == ["Wang Zhi", "Wang Zoe"]
+    assert index.search("wang z", 3) == ["Wang Zhi", "Wang Zoe"]
+    assert index.search("wang a04999", 3) == ["Wang A04999"]
+
+
+def test_precomputed_and_scanned_rankings_agree():
+    generator = random.Random(1)
+    surnames = ["li", "liu", "lin", "wu", "xu", "wang", "wei"]
+    authors = [
+        (f"{generator.choice(surnames)} {generator.choice(surnames)}{i}", generator.randint(1, 99)) for i in range(300)
+    ]
+    counts = dict(authors)
+    precomputed, scanned = PrefixIndex(authors, max_scan=0), PrefixIndex(authors, max_scan=len(authors) * 2)
+    assert not scanned.ranked
+
+    for prefix in ["l", "li", "liu", "liu w", "w", "wa", "wang li", "x", "xu1"]:
+        expected = [counts[name] for name in scanned.search(prefix, 10)]
+        assert [counts[name] for name in precomputed.search(prefix, 10)] == expected
+        assert expected == sorted(expected, reverse=True)
+
+
+@pytest.mark.parametrize("prefix", ["", "   ", "\t"])
+def test_blank_prefix_suggests_no_categories(categories, prefix):
+    assert suggest_categories(prefix, 10) == []
+
+
+def test_categories_by_id_and_name(categories):
+    assert suggest_categories("cs.a", 10) == [{"id": "cs.AI", "name": "Artificial Intelligence"}]
+    assert suggest_categories("intel", 10) == [{"id": "cs.AI", "name": "Artificial Intelligence"}]
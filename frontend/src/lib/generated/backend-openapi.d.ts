@@ -168,6 +168,12 @@ export interface components {
              * @description Number of results per page
              */
             size: number;
+            /**
+             * Total Is Lower Bound
+             * @description Total number of results was not counted past this value
+             * @default false
+             */
+            total_is_lower_bound: boolean;
         };
         /** SearchQuery */
         SearchQuery: {